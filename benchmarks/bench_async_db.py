@@ -0,0 +1,80 @@
+"""
+Concurrent-request throughput of the synchronous vs the asynchronous session.
+
+Every simulated request runs one query that takes ``QUERY_MS`` inside the
+database (a ``sleep_ms`` SQL function registered on the SQLite connection), the
+same way a slow query would on Postgres. With the synchronous ``Session`` the
+event loop is blocked for the whole query, so requests are served one by one;
+with ``AsyncSession`` they overlap.
+
+Run from the project root::
+
+    python -m benchmarks.bench_async_db
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+REQUESTS = 50
+QUERY_MS = 20
+
+
+def _sleep_ms(ms):
+    time.sleep(ms / 1000)
+    return ms
+
+
+def _register_sleep(dbapi_connection, connection_record):
+    dbapi_connection.create_function("sleep_ms", 1, _sleep_ms)
+
+
+async def run_sync(url: str) -> float:
+    engine = create_engine(url, poolclass=NullPool)
+    event.listen(engine, "connect", _register_sleep)
+    session_local = sessionmaker(bind=engine)
+
+    async def request():
+        with session_local() as db:
+            db.execute(text("SELECT sleep_ms(:ms)"), {"ms": QUERY_MS})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+    return elapsed
+
+
+async def run_async(url: str) -> float:
+    engine = create_async_engine(url, poolclass=NullPool)
+    event.listen(engine.sync_engine, "connect", _register_sleep)
+    session_local = async_sessionmaker(bind=engine)
+
+    async def request():
+        async with session_local() as db:
+            await db.execute(text("SELECT sleep_ms(:ms)"), {"ms": QUERY_MS})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    await engine.dispose()
+    return elapsed
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        sync_elapsed = await run_sync(f"sqlite:///{path}")
+        async_elapsed = await run_async(f"sqlite+aiosqlite:///{path}")
+    print(f"{REQUESTS} concurrent requests, {QUERY_MS} ms per query")
+    print(f"sync Session:  {sync_elapsed:.3f}s  {REQUESTS / sync_elapsed:8.1f} req/s")
+    print(f"AsyncSession:  {async_elapsed:.3f}s  {REQUESTS / async_elapsed:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
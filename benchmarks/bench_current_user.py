@@ -0,0 +1,47 @@
+"""
+Throughput of ``Auth.get_current_user`` with and without the decoded token cache.
+
+The user is served from the in-process tier of the user cache in both runs, so
+the numbers compare only the cost of verifying and parsing the access token.
+
+Run from the project root::
+
+    python -m benchmarks.bench_current_user
+"""
+import asyncio
+import time
+
+from src.services.auth import Auth
+from src.services.local_cache import TTLCache
+from src.services.user_cache import UserCache, UserSnapshot
+
+CALLS = 50_000
+
+
+async def throughput(auth: Auth, token: str) -> float:
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        await auth.get_current_user(token, None)
+    return CALLS / (time.perf_counter() - start)
+
+
+async def main():
+    auth = Auth()
+    auth.user_cache = UserCache(None, ttl=300, local_ttl=3600, local_size=10)
+    auth.user_cache.local.set(
+        "bench@example.com",
+        UserSnapshot(1, "bench", "bench@example.com", None, True, None),
+    )
+    token = await auth.create_access_token({"sub": "bench@example.com"})
+
+    auth.token_cache = TTLCache(0, ttl=0)
+    uncached = await throughput(auth, token)
+    auth.token_cache = TTLCache(10_000, ttl=0)
+    cached = await throughput(auth, token)
+
+    print(f"without token cache {uncached:10.0f} calls/s")
+    print(f"with token cache    {cached:10.0f} calls/s ({cached / uncached:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
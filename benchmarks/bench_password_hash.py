@@ -0,0 +1,63 @@
+"""
+Concurrent password verification, on the event loop versus in the hashing pool.
+
+Runs a burst of concurrent logins (bcrypt verifications) twice: once calling
+``pwd_context.verify`` directly in the coroutine, as the login route used to,
+and once through ``Auth.verify_password``. A heartbeat task measures how long
+the event loop was blocked, which is the delay every other request on the
+worker would see.
+
+Run from the project root::
+
+    python -m benchmarks.bench_password_hash
+"""
+import asyncio
+import time
+
+from src.conf.config import settings
+from src.services.auth import Auth
+
+LOGINS = 32
+
+
+async def heartbeat(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def burst(login) -> tuple[float, float]:
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(stop))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return LOGINS / elapsed, await monitor
+
+
+async def main():
+    auth = Auth()
+    hashed = await auth.get_password_hash("password")
+
+    async def blocking_login():
+        return auth.pwd_context.verify("password", hashed)
+
+    async def pooled_login():
+        return await auth.verify_password("password", hashed)
+
+    print(
+        f"{LOGINS} concurrent logins, bcrypt rounds={settings.bcrypt_rounds}, "
+        f"workers={settings.password_hash_workers}"
+    )
+    for name, login in (("on the event loop", blocking_login), ("in the pool", pooled_login)):
+        throughput, stall = await burst(login)
+        print(f"{name:18} {throughput:8.1f} logins/s, longest loop stall {stall * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""
+Rate limiter overhead: fastapi_limiter's ``RateLimiter`` vs ``TokenBucketLimiter``.
+
+Both limiters run against an in-memory Redis that waits ``RTT_MS`` on every round
+trip, the way a Redis server on another host would. ``RateLimiter`` runs a script
+in Redis for every request; ``TokenBucketLimiter`` checks a bucket in the worker and
+reconciles all buckets in one pipeline every ``SYNC_INTERVAL`` seconds.
+``USERS`` clients send ``REQUESTS`` requests in total, all under the limit.
+
+Run from the project root::
+
+    python -m benchmarks.bench_rate_limit
+"""
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi_limiter import FastAPILimiter
+from fastapi_limiter.depends import RateLimiter
+
+from src.services.rate_limit import RateLimitReconciler, TokenBucketLimiter
+
+REQUESTS = 20_000
+USERS = 50
+RTT_MS = 0.5
+SYNC_INTERVAL = 0.1
+
+
+class SlowRedis:
+    # Counters in a dict, with a network round trip per command or pipeline
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        await asyncio.sleep(RTT_MS / 1000)
+
+    async def script_load(self, script):
+        return "sha"
+
+    async def evalsha(self, sha, numkeys, key, limit, expire):
+        # fastapi_limiter's script: a counter per key and window
+        await self._round_trip()
+        current = self.data.get(key, 0)
+        if current + 1 > int(limit):
+            return 1
+        self.data[key] = current + 1
+        return 0
+
+    def pipeline(self, transaction=True):
+        return SlowPipeline(self)
+
+
+class SlowPipeline:
+    def __init__(self, redis: SlowRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def incrby(self, key, amount):
+        self.commands.append((key, amount))
+
+    def expire(self, key, ttl):
+        self.commands.append(None)
+
+    async def execute(self):
+        await self.redis._round_trip()
+        results = []
+        for command in self.commands:
+            if command is None:
+                results.append(True)
+            else:
+                key, amount = command
+                self.redis.data[key] = self.redis.data.get(key, 0) + amount
+                results.append(self.redis.data[key])
+        return results
+
+
+async def throughput(app: FastAPI, limiter) -> float:
+    requests = [
+        Request(
+            {
+                "type": "http",
+                "app": app,
+                "path": "/api/notes/",
+                "headers": [],
+                "client": (f"10.0.0.{user}", 1),
+            }
+        )
+        for user in range(USERS)
+    ]
+
+    async def client(request):
+        for _ in range(REQUESTS // USERS):
+            await limiter(request, None)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(request) for request in requests))
+    return REQUESTS / (time.perf_counter() - start)
+
+
+async def main():
+    app = FastAPI()
+    times = REQUESTS
+
+    redis = SlowRedis()
+    await FastAPILimiter.init(redis)
+    remote = await throughput(app, RateLimiter(times=times, seconds=60))
+    remote_trips = redis.round_trips
+
+    redis = SlowRedis()
+    reconciler = RateLimitReconciler(redis, SYNC_INTERVAL)
+    limiter = TokenBucketLimiter(times, 60, reconciler=reconciler)
+    sync = asyncio.create_task(reconciler.run())
+    local = await throughput(app, limiter)
+    sync.cancel()
+    await reconciler.sync()
+    local_trips = redis.round_trips
+
+    print(f"RateLimiter        {remote:10.0f} requests/s, {remote_trips:6d} Redis round trips")
+    print(
+        f"TokenBucketLimiter {local:10.0f} requests/s, {local_trips:6d} Redis round trips "
+        f"({local / remote:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
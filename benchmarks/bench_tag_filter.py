@@ -0,0 +1,94 @@
+"""
+Tag-filtered note listing on a seeded dataset of 100k notes per user.
+
+Seeds a SQLite database with two users, 100k notes each and 50 tags per user
+(every note carries 1-3 tags), then times ``get_notes`` with ``match=any`` and
+``match=all`` for the first page and for a page deep in the keyset order.
+
+Run from the project root::
+
+    python -m benchmarks.bench_tag_filter
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Note, Tag, User, note_m2m_tag
+from src.repository import notes as repository_notes
+
+NOTES_PER_USER = 100_000
+TAGS_PER_USER = 50
+ROUNDS = 20
+
+
+async def seed(engine):
+    rng = random.Random(42)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            insert(User),
+            [{"id": i, "email": f"user{i}@example.com", "password": "x"} for i in (1, 2)],
+        )
+        await conn.execute(
+            insert(Tag),
+            [
+                {"id": user_id * 1000 + i, "name": f"tag {i}", "user_id": user_id}
+                for user_id in (1, 2)
+                for i in range(TAGS_PER_USER)
+            ],
+        )
+        note_id = 0
+        for user_id in (1, 2):
+            for start in range(0, NOTES_PER_USER, 10_000):
+                notes, links = [], []
+                for _ in range(10_000):
+                    note_id += 1
+                    notes.append(
+                        {"id": note_id, "title": "note", "description": "seeded", "user_id": user_id}
+                    )
+                    for tag in rng.sample(range(TAGS_PER_USER), rng.randint(1, 3)):
+                        links.append({"note_id": note_id, "tag_id": user_id * 1000 + tag})
+                await conn.execute(insert(Note), notes)
+                await conn.execute(insert(note_m2m_tag), links)
+        await conn.exec_driver_sql("ANALYZE")
+
+
+async def timed(session_local, **kwargs) -> float:
+    user = User(id=1)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        async with session_local() as db:
+            await repository_notes.get_notes(0, 100, user, db, **kwargs)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        started = time.perf_counter()
+        await seed(engine)
+        print(f"seeded {2 * NOTES_PER_USER} notes in {time.perf_counter() - started:.1f}s")
+        session_local = async_sessionmaker(bind=engine, expire_on_commit=False)
+        cases = {
+            "no filter": {},
+            "any of 2 tags": {"tag_ids": [1000, 1001]},
+            "all of 2 tags": {"tag_ids": [1000, 1001], "match_all": True},
+            "any of 2 tags, deep page": {"tag_ids": [1000, 1001], "after_id": 90_000},
+            "all of 2 tags, deep page": {
+                "tag_ids": [1000, 1001],
+                "match_all": True,
+                "after_id": 90_000,
+            },
+        }
+        for name, kwargs in cases.items():
+            print(f"{name:28} {await timed(session_local, **kwargs):8.2f} ms/page")
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
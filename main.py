@@ -1,30 +1,51 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Depends, HTTPException
-import redis.asyncio as redis
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.conf.config import settings
 from src.database.db import get_db
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services import redis_pool
+from src.services.rate_limit import rate_limit_reconciler
 from src.routes import notes, tags, auth, users
 from fastapi_limiter import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
+from redis.exceptions import RedisError
 
-app = FastAPI()
 
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(
-        host=settings.redis_host,
-        port=settings.redis_port,
-        password=settings.redis_password,
-        db=0,
-        encoding="utf-8",
-        decode_responses=True,
-    )
-    await FastAPILimiter.init(r)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function starts the background work of the worker and stops it on shutdown.
+    Everything that uses Redis shares the connection pool of src.services.redis_pool,
+    which is checked here and closed last. Emails are sent by the outbox worker,
+    src.services.outbox, not by the web workers.
+
+    :param app: FastAPI: The application
+    :return: None
+    """
+    await redis_pool.open_redis()
+    try:
+        await FastAPILimiter.init(redis_pool.r)
+    except (RedisError, OSError) as e:
+        print(e)
+    listeners = [
+        asyncio.create_task(auth_service.user_cache.listen()),
+        asyncio.create_task(auth_service.revoked_tokens.listen()),
+        asyncio.create_task(rate_limit_reconciler.run()),
+    ]
+    yield
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    await redis_pool.close_redis()
+
 
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth.router, prefix="/api")
 app.include_router(tags.router, prefix="/api")
@@ -54,18 +75,18 @@ def read_root():
 
 
 @app.get("/api/healthchecker")
-async def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
     The healthchecker function is a simple function that checks the health of the database.
     It does this by making a request to the database and checking if it returns any results.
     If it doesn't, then we know there's an issue with our connection.
 
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with the message key and a value of welcome to fastapi!
     """
     try:
         # Make request
-        result = db.execute(text("SELECT 1"))
+        result = await db.execute(text("SELECT 1"))
         result = result.fetchone()
         if result is None:
             raise HTTPException(
@@ -75,3 +96,15 @@ async def healthchecker(db: Session = Depends(get_db)):
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error connecting to the database")
+
+
+@app.get("/api/cache/stats")
+def cache_stats(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The cache_stats function returns the hit and miss counters of the response cache of this worker.
+    It is only available to authenticated users.
+
+    :param current_user: User: Require a valid access token
+    :return: A dictionary with the hits, misses, errors and hit_ratio keys
+    """
+    return response_cache.stats()
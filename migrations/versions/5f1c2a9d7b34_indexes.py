@@ -0,0 +1,50 @@
+"""indexes
+
+Revision ID: 5f1c2a9d7b34
+Revises: 8edeaed1cd5b
+Create Date: 2026-10-17 09:12:41.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1c2a9d7b34'
+down_revision: Union[str, None] = '8edeaed1cd5b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_notes_user_id_id', 'notes', ['user_id', 'id'], unique=False)
+    op.create_index('ix_notes_user_id_created_at', 'notes', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_tags_user_id_id', 'tags', ['user_id', 'id'], unique=False)
+
+    # note_m2m_tag: replace the surrogate id with a (note_id, tag_id) primary key
+    op.execute('DELETE FROM note_m2m_tag WHERE note_id IS NULL OR tag_id IS NULL')
+    op.execute(
+        'DELETE FROM note_m2m_tag a USING note_m2m_tag b '
+        'WHERE a.id > b.id AND a.note_id = b.note_id AND a.tag_id = b.tag_id'
+    )
+    op.drop_constraint('note_m2m_tag_pkey', 'note_m2m_tag', type_='primary')
+    op.drop_column('note_m2m_tag', 'id')
+    op.alter_column('note_m2m_tag', 'note_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('note_m2m_tag', 'tag_id', existing_type=sa.Integer(), nullable=False)
+    op.create_primary_key('note_m2m_tag_pkey', 'note_m2m_tag', ['note_id', 'tag_id'])
+    op.create_index('ix_note_m2m_tag_tag_id_note_id', 'note_m2m_tag', ['tag_id', 'note_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_note_m2m_tag_tag_id_note_id', table_name='note_m2m_tag')
+    op.drop_constraint('note_m2m_tag_pkey', 'note_m2m_tag', type_='primary')
+    op.alter_column('note_m2m_tag', 'tag_id', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('note_m2m_tag', 'note_id', existing_type=sa.Integer(), nullable=True)
+    op.execute('ALTER TABLE note_m2m_tag ADD COLUMN id SERIAL')
+    op.create_primary_key('note_m2m_tag_pkey', 'note_m2m_tag', ['id'])
+
+    op.drop_index('ix_tags_user_id_id', table_name='tags')
+    op.drop_index('ix_notes_user_id_created_at', table_name='notes')
+    op.drop_index('ix_notes_user_id_id', table_name='notes')
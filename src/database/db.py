@@ -1,20 +1,73 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+from itertools import count
+
+from sqlalchemy.exc import DBAPIError, TimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from src.conf.config import settings
 
 
+# Alembic migrations keep using the synchronous driver, the application runs on
+# the async one so that queries never block the event loop.
 SQLALCHEMY_DATABASE_URL = settings.SQLALCHEMY_DATABASE_URL
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.SQLALCHEMY_ASYNC_DATABASE_URL
+
+
+def create_pooled_engine(url: str) -> AsyncEngine:
+    """
+    The create_pooled_engine function creates an async engine with the pool settings from the config.
+
+    :param url: str: The async database url
+    :return: An async engine
+    """
+    return create_async_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_pooled_engine(SQLALCHEMY_ASYNC_DATABASE_URL)
+replica_engines = [create_pooled_engine(url) for url in settings.SQLALCHEMY_REPLICA_URLS]
+_replica_counter = count()
+
+logger = logging.getLogger(__name__)
+
+SessionLocal = async_sessionmaker(
+    bind=engine, autoflush=False, expire_on_commit=False
+)
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
+# Dependency
+async def get_read_db():
+    """
+    The get_read_db function yields a session for read-only endpoints.
+    Replicas are tried round-robin; the first one that accepts a connection is used,
+    and the primary is used when no replica is configured or none of them is reachable
+    or has a free connection within the pool timeout.
+
+    :return: A database session bound to a replica or to the primary
+    """
+    start = next(_replica_counter)
+    for i in range(len(replica_engines)):
+        replica = replica_engines[(start + i) % len(replica_engines)]
+        db = SessionLocal(bind=replica)
+        try:
+            await db.connection()
+        except (DBAPIError, OSError, TimeoutError) as e:
+            logger.warning("Replica %s is not available: %s", replica.url, e)
+            await db.close()
+            continue
+        async with db:
+            yield db
+        return
+    async with SessionLocal() as db:
+        yield db
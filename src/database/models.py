@@ -1,4 +1,16 @@
-from sqlalchemy import Column, Integer, String, Boolean, func, Table, UniqueConstraint
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Boolean,
+    func,
+    Table,
+    UniqueConstraint,
+    Index,
+    DDL,
+    event,
+    text,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import DateTime
@@ -9,14 +21,25 @@ Base = declarative_base()
 note_m2m_tag = Table(
     "note_m2m_tag",
     Base.metadata,
-    Column("id", Integer, primary_key=True),
-    Column("note_id", Integer, ForeignKey("notes.id", ondelete="CASCADE")),
-    Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE")),
+    Column(
+        "note_id",
+        Integer,
+        ForeignKey("notes.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True
+    ),
+    Index("ix_note_m2m_tag_tag_id_note_id", "tag_id", "note_id"),
 )
 
 
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        Index("ix_notes_user_id_id", "user_id", "id"),
+        Index("ix_notes_user_id_created_at", "user_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True)
     title = Column(String(50), nullable=False)
     created_at = Column("created_at", DateTime, default=func.now())
@@ -29,9 +52,55 @@ class Note(Base):
     user = relationship("User", backref="notes")
 
 
+# Full-text search over title and description. On PostgreSQL this is a generated
+# tsvector column with a GIN index (see migration 0b7e4d2c9a61), on SQLite an
+# external-content FTS5 table kept in sync by triggers.
+event.listen(
+    Note.__table__,
+    "after_create",
+    DDL(
+        "ALTER TABLE notes ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    Note.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX ix_notes_search_vector ON notes USING gin (search_vector)"
+    ).execute_if(dialect="postgresql"),
+)
+for statement in (
+    "CREATE VIRTUAL TABLE notes_fts USING fts5"
+    "(title, description, content='notes', content_rowid='id')",
+    "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER notes_fts_update AFTER UPDATE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO notes_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+):
+    event.listen(
+        Note.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    Note.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS notes_fts").execute_if(dialect="sqlite"),
+)
+
+
 class Tag(Base):
     __tablename__ = "tags"
-    __table_args__ = (UniqueConstraint("name", "user_id", name="unique_tag_user"),)
+    __table_args__ = (
+        UniqueConstraint("name", "user_id", name="unique_tag_user"),
+        Index("ix_tags_user_id_id", "user_id", "id"),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(25), nullable=False)
     user_id = Column(
@@ -50,3 +119,26 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # only the rows still to be sent are indexed
+        Index(
+            "ix_email_outbox_pending",
+            "next_attempt_at",
+            "id",
+            postgresql_where=text("sent_at IS NULL"),
+            sqlite_where=text("sent_at IS NULL"),
+        ),
+    )
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(20), nullable=False)
+    recipient = Column(String(250), nullable=False)
+    username = Column(String(50))
+    host = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
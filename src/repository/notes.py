@@ -1,13 +1,41 @@
-from typing import List
-from sqlalchemy import and_, select
-from sqlalchemy.orm import Session
-from src.database.models import Note, Tag, User
-from src.schemas import NoteModel, NoteUpdate, NoteStatusUpdate
+from typing import AsyncIterator, List, Tuple
+from sqlalchemy import (
+    and_,
+    column,
+    delete,
+    exists,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    table,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from src.database.models import Note, Tag, User, note_m2m_tag
+from src.repository import tags as repository_tags
+from src.services.cache import response_cache
+from src.schemas import NoteBase, NoteImport, NoteModel, NoteUpdate, NoteStatusUpdate
 
 
-async def get_notes(skip: int, limit: int, user: User, db: Session) -> List[Note]:
+async def get_notes(
+    skip: int,
+    limit: int,
+    user: User,
+    db: AsyncSession,
+    after_id: int | None = None,
+    tag_ids: List[int] | None = None,
+    match_all: bool = False,
+) -> List[Note]:
     """
     Retrieves a list of notes for a specific user with specified pagination parameters.
+    Notes are ordered by ID. When after_id is given the page starts right after that note
+    (keyset pagination) and skip is ignored, so deep pages cost the same as the first one.
+    When tag_ids is given only notes carrying any (or, with match_all, every) of those tags
+    are returned. Tags are checked with EXISTS lookups on the note_m2m_tag primary key; with
+    match_all the candidates come from the (tag_id, note_id) index of the first tag.
 
     :param skip: The number of notes to skip.
     :type skip: int
@@ -16,16 +44,58 @@ async def get_notes(skip: int, limit: int, user: User, db: Session) -> List[Note
     :param user: The user to retrieve notes for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param after_id: The ID of the last note of the previous page.
+    :type after_id: int | None
+    :param tag_ids: The IDs of the tags to filter by.
+    :type tag_ids: List[int] | None
+    :param match_all: Whether a note must carry all of the tags instead of any of them.
+    :type match_all: bool
     :return: A list of notes.
     :rtype: List[Note]
     """
-    stmt = select(Note).filter_by(user=user).offset(skip).limit(limit)
-    notes = db.execute(stmt)
+    stmt = (
+        select(Note)
+        .filter(Note.user_id == user.id)
+        .options(selectinload(Note.tags))
+        .order_by(Note.id)
+        .limit(limit)
+    )
+    if tag_ids:
+        if match_all:
+            first, *others = sorted(set(tag_ids))
+            stmt = stmt.filter(
+                Note.id.in_(
+                    select(note_m2m_tag.c.note_id).filter(note_m2m_tag.c.tag_id == first)
+                ),
+                *(
+                    exists().where(
+                        and_(
+                            note_m2m_tag.c.note_id == Note.id,
+                            note_m2m_tag.c.tag_id == tag_id,
+                        )
+                    )
+                    for tag_id in others
+                ),
+            )
+        else:
+            stmt = stmt.filter(
+                exists().where(
+                    and_(
+                        note_m2m_tag.c.note_id == Note.id,
+                        note_m2m_tag.c.tag_id.in_(tag_ids),
+                    )
+                )
+            )
+    if after_id is not None:
+        stmt = stmt.filter(Note.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    notes = await db.execute(stmt)
     return notes.scalars().all()
 
 
-async def get_note(note_id: int, user: User, db: Session) -> Note:
+async def get_note(note_id: int, user: User, db: AsyncSession) -> Note:
     """
     Retrieves a single note with the specified ID for a specific user.
 
@@ -34,16 +104,134 @@ async def get_note(note_id: int, user: User, db: Session) -> Note:
     :param user: The user to retrieve the note for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The note with the specified ID, or None if it does not exist.
     :rtype: Note | None
     """
-    return (
-        db.query(Note).filter(and_(Note.id == note_id, Note.user_id == user.id)).first()
+    stmt = (
+        select(Note)
+        .filter(and_(Note.id == note_id, Note.user_id == user.id))
+        .options(selectinload(Note.tags))
+    )
+    note = await db.execute(stmt)
+    return note.scalar_one_or_none()
+
+
+async def stream_notes(
+    user: User, db: AsyncSession, batch_size: int = 1000
+) -> AsyncIterator[dict]:
+    """
+    Streams every note of a specific user, with its tag names, from a server-side cursor.
+    Notes and tags are read with a single outer join ordered by note ID, fetched batch_size
+    rows at a time, so memory use does not depend on the number of notes.
+
+    :param user: The user to export notes for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param batch_size: The number of rows fetched from the cursor at a time.
+    :type batch_size: int
+    :return: An async iterator of notes as dictionaries.
+    :rtype: AsyncIterator[dict]
+    """
+    stmt = (
+        select(
+            Note.id,
+            Note.title,
+            Note.description,
+            Note.done,
+            Note.created_at,
+            Tag.name,
+        )
+        .outerjoin(note_m2m_tag, note_m2m_tag.c.note_id == Note.id)
+        .outerjoin(Tag, Tag.id == note_m2m_tag.c.tag_id)
+        .filter(Note.user_id == user.id)
+        .order_by(Note.id)
+        .execution_options(yield_per=batch_size)
+    )
+    note = None
+    async for row in await db.stream(stmt):
+        if note is None or note["id"] != row.id:
+            if note is not None:
+                yield note
+            note = {
+                "id": row.id,
+                "title": row.title,
+                "description": row.description,
+                "done": row.done,
+                "created_at": row.created_at,
+                "tags": [],
+            }
+        if row.name is not None:
+            note["tags"].append(row.name)
+    if note is not None:
+        yield note
+
+
+async def search_notes(
+    query: str,
+    limit: int,
+    user: User,
+    db: AsyncSession,
+    after: Tuple[float, int] | None = None,
+) -> List[Tuple[Note, float]]:
+    """
+    Searches the title and description of a user's notes, best matches first.
+    PostgreSQL matches the search_vector column with websearch_to_tsquery and ranks with ts_rank,
+    SQLite matches the notes_fts table and ranks with bm25. Results are ordered by rank, then ID,
+    and after continues from the (rank, ID) of the last result of the previous page.
+
+    :param query: The text to search for.
+    :type query: str
+    :param limit: The maximum number of notes to return.
+    :type limit: int
+    :param user: The user to search notes for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param after: The rank and ID of the last note of the previous page.
+    :type after: Tuple[float, int] | None
+    :return: The matching notes with their rank.
+    :rtype: List[Tuple[Note, float]]
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        # quote every word so that FTS5 operators in the input are taken literally
+        terms = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+        if not terms:
+            return []
+        notes_fts = table("notes_fts", column("rowid"))
+        fts = literal_column("notes_fts")
+        ranked = (
+            select(notes_fts.c.rowid.label("id"), (-func.bm25(fts)).label("rank"))
+            .filter(fts.op("MATCH")(terms))
+            .subquery()
+        )
+    else:
+        vector = literal_column("notes.search_vector")
+        ts_query = func.websearch_to_tsquery("simple", query)
+        ranked = (
+            select(Note.id.label("id"), func.ts_rank(vector, ts_query).label("rank"))
+            .filter(and_(Note.user_id == user.id, vector.op("@@")(ts_query)))
+            .subquery()
+        )
+    stmt = (
+        select(Note, ranked.c.rank)
+        .join(ranked, ranked.c.id == Note.id)
+        .filter(Note.user_id == user.id)
+        .options(selectinload(Note.tags))
+        .order_by(ranked.c.rank.desc(), Note.id)
+        .limit(limit)
     )
+    if after is not None:
+        rank, after_id = after
+        stmt = stmt.filter(
+            or_(ranked.c.rank < rank, and_(ranked.c.rank == rank, Note.id > after_id))
+        )
+    notes = await db.execute(stmt)
+    return [(note, rank) for note, rank in notes.all()]
 
 
-async def create_note(body: NoteModel, user: User, db: Session) -> Note:
+async def create_note(body: NoteModel, user: User, db: AsyncSession) -> Note:
     """
     Creates a new note for a specific user.
 
@@ -52,21 +240,155 @@ async def create_note(body: NoteModel, user: User, db: Session) -> Note:
     :param user: The user to create the note for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The newly created note.
     :rtype: Note
     """
-    tags = (
-        db.query(Tag).filter(and_(Tag.id.in_(body.tags), Tag.user_id == user.id)).all()
+    stmt = select(Tag).filter(and_(Tag.id.in_(body.tags), Tag.user_id == user.id))
+    tags = await db.execute(stmt)
+    note = Note(
+        title=body.title,
+        description=body.description,
+        tags=list(tags.scalars().all()),
+        user_id=user.id,
     )
-    note = Note(title=body.title, description=body.description, tags=tags, user=user)
     db.add(note)
-    db.commit()
-    db.refresh(note)
+    await db.commit()
+    await response_cache.invalidate(user.id)
+    await db.refresh(note, attribute_names=["created_at"])
     return note
 
 
-async def remove_note(note_id: int, user: User, db: Session) -> Note | None:
+async def create_notes(
+    bodies: List[NoteModel], user: User, db: AsyncSession
+) -> List[dict]:
+    """
+    Creates many notes for a specific user with set-based statements.
+    All referenced tags are resolved in one query, the notes are inserted with a multi-row
+    INSERT ... RETURNING, their tag links in one batch, and the transaction is committed once.
+    A note that references a tag the user does not own is not created.
+
+    :param bodies: The data for the notes to create.
+    :type bodies: List[NoteModel]
+    :param user: The user to create the notes for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: One result per body, in order, with either the new note ID or an error.
+    :rtype: List[dict]
+    """
+    tag_ids = {tag_id for body in bodies for tag_id in body.tags}
+    owned_tags = set()
+    if tag_ids:
+        stmt = select(Tag.id).filter(and_(Tag.id.in_(tag_ids), Tag.user_id == user.id))
+        owned_tags = set((await db.execute(stmt)).scalars().all())
+
+    results = [{"index": index, "id": None, "error": None} for index in range(len(bodies))]
+    valid = []
+    for index, body in enumerate(bodies):
+        missing = sorted(set(body.tags) - owned_tags)
+        if missing:
+            results[index]["error"] = f"Tags not found: {missing}"
+        else:
+            valid.append(index)
+
+    if valid:
+        note_ids = await _insert_notes(
+            [bodies[index] for index in valid],
+            [set(bodies[index].tags) for index in valid],
+            user,
+            db,
+        )
+        for index, note_id in zip(valid, note_ids):
+            results[index]["id"] = note_id
+        await db.commit()
+        await response_cache.invalidate(user.id)
+    return results
+
+
+async def import_notes(bodies: List[NoteImport], user: User, db: AsyncSession) -> int:
+    """
+    Imports a batch of notes for a specific user in one transaction.
+    Tags are referenced by name and created when missing. On PostgreSQL the notes and their
+    tag links are written with COPY, on other databases with executemany.
+
+    :param bodies: The notes to import.
+    :type bodies: List[NoteImport]
+    :param user: The user to import the notes for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The number of imported notes.
+    :rtype: int
+    """
+    if not bodies:
+        return 0
+    names = [name for body in bodies for name in body.tags]
+    tags = await repository_tags.upsert_tags(names, user, db, commit=False)
+    tag_ids = {tag.name: tag.id for tag in tags}
+    note_tags = [{tag_ids[name] for name in body.tags} for body in bodies]
+    if db.get_bind().dialect.name == "postgresql":
+        await _copy_notes(bodies, note_tags, user, db)
+    else:
+        await _insert_notes(bodies, note_tags, user, db)
+    await db.commit()
+    await response_cache.invalidate(user.id)
+    return len(bodies)
+
+
+async def _insert_notes(
+    bodies: List[NoteBase], note_tags: List[set], user: User, db: AsyncSession
+) -> List[int]:
+    # ids are assigned in VALUES order, sorting them restores the order of rows
+    # without sort_by_parameter_order, which SQLite can only do row by row
+    rows = [
+        {"title": body.title, "description": body.description, "user_id": user.id}
+        for body in bodies
+    ]
+    stmt = insert(Note).returning(Note.id)
+    note_ids = sorted((await db.execute(stmt, rows)).scalars().all())
+    links = [
+        {"note_id": note_id, "tag_id": tag_id}
+        for note_id, tag_ids in zip(note_ids, note_tags)
+        for tag_id in tag_ids
+    ]
+    if links:
+        await db.execute(insert(note_m2m_tag), links)
+    return note_ids
+
+
+async def _copy_notes(
+    bodies: List[NoteBase], note_tags: List[set], user: User, db: AsyncSession
+) -> List[int]:
+    # COPY cannot return ids, so they are reserved from the sequence beforehand
+    connection = await (await db.connection()).get_raw_connection()
+    driver = connection.driver_connection
+    reserved = await driver.fetch(
+        "SELECT nextval('notes_id_seq'), now()::timestamp FROM generate_series(1, $1)",
+        len(bodies),
+    )
+    note_ids = [row[0] for row in reserved]
+    await driver.copy_records_to_table(
+        "notes",
+        columns=["id", "title", "created_at", "description", "done", "user_id"],
+        records=[
+            (note_id, body.title, row[1], body.description, False, user.id)
+            for note_id, row, body in zip(note_ids, reserved, bodies)
+        ],
+    )
+    links = [
+        (note_id, tag_id)
+        for note_id, tag_ids in zip(note_ids, note_tags)
+        for tag_id in tag_ids
+    ]
+    if links:
+        await driver.copy_records_to_table(
+            "note_m2m_tag", columns=["note_id", "tag_id"], records=links
+        )
+    return note_ids
+
+
+async def remove_note(note_id: int, user: User, db: AsyncSession) -> Note | None:
     """
     Removes a single note with the specified ID for a specific user.
 
@@ -75,21 +397,20 @@ async def remove_note(note_id: int, user: User, db: Session) -> Note | None:
     :param user: The user to remove the note for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The removed note, or None if it does not exist.
     :rtype: Note | None
     """
-    note = (
-        db.query(Note).filter(and_(Note.id == note_id, Note.user_id == user.id)).first()
-    )
+    note = await get_note(note_id, user, db)
     if note:
-        db.delete(note)
-        db.commit()
+        await db.delete(note)
+        await db.commit()
+        await response_cache.invalidate(user.id)
     return note
 
 
 async def update_note(
-    note_id: int, body: NoteUpdate, user: User, db: Session
+    note_id: int, body: NoteUpdate, user: User, db: AsyncSession
 ) -> Note | None:
     """
     Updates a single note with the specified ID for a specific user.
@@ -101,29 +422,25 @@ async def update_note(
     :param user: The user to update the note for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated note, or None if it does not exist.
     :rtype: Note | None
     """
-    note = (
-        db.query(Note).filter(and_(Note.id == note_id, Note.user_id == user.id)).first()
-    )
+    note = await get_note(note_id, user, db)
     if note:
-        tags = (
-            db.query(Tag)
-            .filter(and_(Tag.id.in_(body.tags), Note.user_id == user.id))
-            .all()
-        )
+        stmt = select(Tag).filter(and_(Tag.id.in_(body.tags), Tag.user_id == user.id))
+        tags = await db.execute(stmt)
         note.title = body.title
         note.description = body.description
         note.done = body.done
-        note.tags = tags
-        db.commit()
+        note.tags = list(tags.scalars().all())
+        await db.commit()
+        await response_cache.invalidate(user.id)
     return note
 
 
 async def update_status_note(
-    note_id: int, body: NoteStatusUpdate, user: User, db: Session
+    note_id: int, body: NoteStatusUpdate, user: User, db: AsyncSession
 ) -> Note | None:
     """
     Updates the status (i.e. "done" or "not done") of a single note with the specified ID for a specific user.
@@ -135,14 +452,71 @@ async def update_status_note(
     :param user: The user to update the note for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated note, or None if it does not exist.
     :rtype: Note | None
     """
-    note = (
-        db.query(Note).filter(and_(Note.id == note_id, Note.user_id == user.id)).first()
-    )
+    note = await get_note(note_id, user, db)
     if note:
         note.done = body.done
-        db.commit()
+        await db.commit()
+        await response_cache.invalidate(user.id)
     return note
+
+
+async def update_status_notes(
+    note_ids: List[int], body: NoteStatusUpdate, user: User, db: AsyncSession
+) -> List[int]:
+    """
+    Updates the status of many notes of a specific user with a single UPDATE ... RETURNING.
+
+    :param note_ids: The IDs of the notes to update.
+    :type note_ids: List[int]
+    :param body: The updated status for the notes.
+    :type body: NoteStatusUpdate
+    :param user: The user to update the notes for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The IDs of the notes that were updated.
+    :rtype: List[int]
+    """
+    if not note_ids:
+        return []
+    stmt = (
+        update(Note)
+        .filter(and_(Note.id.in_(note_ids), Note.user_id == user.id))
+        .values(done=body.done)
+        .returning(Note.id)
+    )
+    updated = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    await response_cache.invalidate(user.id)
+    return sorted(updated)
+
+
+async def remove_notes(note_ids: List[int], user: User, db: AsyncSession) -> List[int]:
+    """
+    Removes many notes of a specific user with a single DELETE ... RETURNING.
+    Their tag links are removed by the ON DELETE CASCADE of note_m2m_tag.
+
+    :param note_ids: The IDs of the notes to remove.
+    :type note_ids: List[int]
+    :param user: The user to remove the notes for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The IDs of the notes that were removed.
+    :rtype: List[int]
+    """
+    if not note_ids:
+        return []
+    stmt = (
+        delete(Note)
+        .filter(and_(Note.id.in_(note_ids), Note.user_id == user.id))
+        .returning(Note.id)
+    )
+    removed = (await db.execute(stmt)).scalars().all()
+    await db.commit()
+    await response_cache.invalidate(user.id)
+    return sorted(removed)
@@ -0,0 +1,137 @@
+from datetime import timedelta
+from typing import List
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import EmailOutbox
+
+
+def add_email(
+    kind: str, recipient: str, username: str | None, host: str, db: AsyncSession
+) -> EmailOutbox:
+    """
+    The add_email function queues an email in the outbox within the current transaction.
+        It does not commit, so the email is only sent if the caller's transaction commits.
+
+    :param kind: str: The kind of email, a key of src.services.email.TEMPLATES
+    :param recipient: str: The email address to send to
+    :param username: str | None: Pass the username to the template
+    :param host: str: Pass the host url to the template
+    :param db: AsyncSession: Access the database
+    :return: The outbox row
+    """
+    email = EmailOutbox(kind=kind, recipient=recipient, username=username, host=host)
+    db.add(email)
+    return email
+
+
+def _seconds_from_now(seconds: float, db: AsyncSession):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.datetime("now", f"{int(seconds):+d} seconds")
+    return func.now() + timedelta(seconds=seconds)
+
+
+async def claim_emails(
+    limit: int, max_attempts: int, lease: float, db: AsyncSession
+) -> List[EmailOutbox]:
+    """
+    The claim_emails function claims up to limit emails that are due to be sent, with a single
+        UPDATE ... RETURNING. A claimed email counts as an attempt and is not due again for
+        lease seconds, so the caller can commit the claim before sending and hold no row locks
+        meanwhile; if the caller dies, the email is claimed again once the lease runs out.
+        Rows another worker is claiming are skipped (FOR UPDATE SKIP LOCKED), so several
+        workers can drain the outbox at once. SQLite has no row locks and runs the same
+        statement without the locking clause. It does not commit.
+
+    :param limit: int: The maximum number of emails to claim
+    :param max_attempts: int: Emails that were attempted this many times are not claimed again
+    :param lease: float: Seconds the caller has to send the claimed emails
+    :param db: AsyncSession: Access the database
+    :return: The claimed outbox rows, oldest first
+    """
+    due = (
+        select(EmailOutbox.id)
+        .filter(
+            and_(
+                EmailOutbox.sent_at.is_(None),
+                EmailOutbox.next_attempt_at <= func.now(),
+                EmailOutbox.attempts < max_attempts,
+            )
+        )
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(EmailOutbox)
+        .filter(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(
+            attempts=EmailOutbox.attempts + 1,
+            next_attempt_at=_seconds_from_now(lease, db),
+        )
+        .returning(EmailOutbox)
+        .execution_options(synchronize_session=False)
+    )
+    emails = (await db.execute(stmt)).scalars().all()
+    return sorted(emails, key=lambda email: email.id)
+
+
+async def mark_sent(email_ids: List[int], db: AsyncSession) -> None:
+    """
+    The mark_sent function records that emails were sent, with a single UPDATE.
+        It does not commit.
+
+    :param email_ids: List[int]: The ids of the sent emails
+    :param db: AsyncSession: Access the database
+    :return: None
+    """
+    if email_ids:
+        stmt = (
+            update(EmailOutbox)
+            .filter(EmailOutbox.id.in_(email_ids))
+            .values(sent_at=func.now())
+        )
+        await db.execute(stmt)
+
+
+def mark_failed(emails: List[EmailOutbox], retry_delay: float, db: AsyncSession) -> None:
+    """
+    The mark_failed function schedules failed emails for another attempt, with a delay that
+        doubles after every failure. It does not commit.
+
+    :param emails: List[EmailOutbox]: The claimed rows that could not be sent
+    :param retry_delay: float: Seconds to wait after the first failure
+    :param db: AsyncSession: Access the database
+    :return: None
+    """
+    for email in emails:
+        # attempts was counted by the claim
+        email.next_attempt_at = _seconds_from_now(
+            retry_delay * 2 ** (email.attempts - 1), db
+        )
+
+
+async def purge_emails(max_attempts: int, retention: float, db: AsyncSession) -> int:
+    """
+    The purge_emails function deletes the emails that were sent, or given up on after
+        max_attempts attempts, more than retention seconds ago. It does not commit.
+
+    :param max_attempts: int: Emails attempted this many times are not sent anymore
+    :param retention: float: Seconds to keep finished emails for
+    :param db: AsyncSession: Access the database
+    :return: The number of deleted emails
+    """
+    cutoff = _seconds_from_now(-retention, db)
+    stmt = delete(EmailOutbox).filter(
+        or_(
+            EmailOutbox.sent_at < cutoff,
+            and_(
+                EmailOutbox.sent_at.is_(None),
+                EmailOutbox.attempts >= max_attempts,
+                EmailOutbox.next_attempt_at < cutoff,
+            ),
+        )
+    )
+    result = await db.execute(stmt)
+    return result.rowcount
@@ -1,54 +1,106 @@
 from typing import List
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select
+from sqlalchemy.dialects import postgresql, sqlite
 from src.database.models import Tag, User
 from src.schemas import TagModel
+from src.services.cache import response_cache
 
 
-async def get_tags(skip: int, limit: int, user: User, db: Session) -> List[Tag]:
+async def get_tags(
+    skip: int, limit: int, user: User, db: AsyncSession, after_id: int | None = None
+) -> List[Tag]:
     """
-    The get_tags function returns a list of tags for the given user.
+    The get_tags function returns a list of tags for the given user, ordered by id.
+        When after_id is given the page starts right after that tag and skip is ignored.
 
     :param skip: int: Skip the first n tags
     :param limit: int: Limit the number of tags returned
     :param user: User: Get the tags for a specific user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param after_id: int | None: The id of the last tag of the previous page
     :return: A list of tags
     """
-    return db.query(Tag).filter(Tag.user_id == user.id).offset(skip).limit(limit).all()
+    stmt = select(Tag).filter(Tag.user_id == user.id).order_by(Tag.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.filter(Tag.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    tags = await db.execute(stmt)
+    return tags.scalars().all()
 
 
-async def get_tag(tag_id: int, user: User, db: Session) -> Tag:
+async def get_tag(tag_id: int, user: User, db: AsyncSession) -> Tag:
     """
     The get_tag function takes in a tag_id and user, and returns the Tag object with that id.
         If no such tag exists, it raises an HTTPException.
 
     :param tag_id: int: Specify the tag id that we want to get from the database
     :param user: User: Get the user's tags
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The tag with the given id if it exists and is owned by the user
     """
-    return db.query(Tag).filter(and_(Tag.id == tag_id, Tag.user_id == user.id)).first()
+    stmt = select(Tag).filter(and_(Tag.id == tag_id, Tag.user_id == user.id))
+    tag = await db.execute(stmt)
+    return tag.scalar_one_or_none()
 
 
-async def create_tag(body: TagModel, user: User, db: Session) -> Tag:
+async def create_tag(body: TagModel, user: User, db: AsyncSession) -> Tag:
     """
     The create_tag function creates a new tag in the database.
 
     :param body: TagModel: Pass the tag name to the function
     :param user: User: Get the user_id of the logged in user
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The newly created tag
     """
     tag = Tag(name=body.name, user_id=user.id)
     db.add(tag)
-    db.commit()
-    db.refresh(tag)
+    await db.commit()
+    await response_cache.invalidate(user.id)
+    await db.refresh(tag)
     return tag
 
 
+async def upsert_tags(
+    names: List[str], user: User, db: AsyncSession, commit: bool = True
+) -> List[Tag]:
+    """
+    The upsert_tags function creates the tags from names that the user does not have yet
+        and returns the ids of all of them, new and existing, with a single statement.
+        It relies on ON CONFLICT over the unique_tag_user constraint; the conflicting rows are
+        "updated" to the same name so that RETURNING reports them too.
+
+    :param names: List[str]: The tag names, duplicates are ignored
+    :param user: User: The owner of the tags
+    :param db: AsyncSession: Access the database
+    :param commit: bool: Commit the transaction, or leave it to the caller
+    :return: The tags in the order their names were first given
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite.insert(Tag)
+        conflict = {"index_elements": [Tag.name, Tag.user_id]}
+    else:
+        stmt = postgresql.insert(Tag)
+        conflict = {"constraint": "unique_tag_user"}
+    stmt = (
+        stmt.values([{"name": name, "user_id": user.id} for name in names])
+        .on_conflict_do_update(set_={"name": stmt.excluded.name}, **conflict)
+        .returning(Tag.id, Tag.name)
+    )
+    rows = (await db.execute(stmt)).all()
+    if commit:
+        await db.commit()
+        await response_cache.invalidate(user.id)
+    tags = {row.name: Tag(id=row.id, name=row.name, user_id=user.id) for row in rows}
+    return [tags[name] for name in names]
+
+
 async def update_tag(
-    tag_id: int, body: TagModel, user: User, db: Session
+    tag_id: int, body: TagModel, user: User, db: AsyncSession
 ) -> Tag | None:
     """
     The update_tag function updates a tag in the database.
@@ -61,31 +113,33 @@ async def update_tag(
     :param tag_id: int: Identify the tag that is being updated
     :param body: TagModel: Pass the new tag name to update_tag
     :param user: User: Check if the user is authorized to delete a tag
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The updated tag
     """
-    tag = db.query(Tag).filter(and_(Tag.id == tag_id, Tag.user_id == user.id)).first()
+    tag = await get_tag(tag_id, user, db)
     if tag:
         tag.name = body.name
-        db.commit()
+        await db.commit()
+        await response_cache.invalidate(user.id)
     return tag
 
 
-async def remove_tag(tag_id: int, user: User, db: Session) -> Tag | None:
+async def remove_tag(tag_id: int, user: User, db: AsyncSession) -> Tag | None:
     """
     The remove_tag function removes a tag from the database.
         Args:
             tag_id (int): The id of the tag to be removed.
             user (User): The user who owns the tags being removed.
-            db (Session): A connection to our database, used for querying and deleting data.
+            db (AsyncSession): A connection to our database, used for querying and deleting data.
 
     :param tag_id: int: Specify the tag to remove
     :param user: User: Identify the user who is making the request
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: The tag that was removed, or none if no such tag exists
     """
-    tag = db.query(Tag).filter(and_(Tag.id == tag_id, Tag.user_id == user.id)).first()
+    tag = await get_tag(tag_id, user, db)
     if tag:
-        db.delete(tag)
-        db.commit()
+        await db.delete(tag)
+        await db.commit()
+        await response_cache.invalidate(user.id)
     return tag
@@ -1,32 +1,40 @@
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.models import User
+from src.repository import outbox as repository_outbox
 from src.schemas import UserModel
 
 # region previous
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists, it returns None.
 
     :param email: str: Specify the type of data that is expected to be passed in
-    :param db: Session: Pass the database session into the function
+    :param db: AsyncSession: Pass the database session into the function
     :return: The first user with the given email from the database
     """
-    return db.query(User).filter(User.email == email).first()
+    user = await db.execute(select(User).filter(User.email == email))
+    return user.scalar_one_or_none()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(
+    body: UserModel, db: AsyncSession, confirmation_host: str | None = None
+) -> User:
     """
     The create_user function creates a new user in the database.
         Args:
             body (UserModel): The UserModel object to be created.
-            db (Session): The SQLAlchemy session object used for querying the database.
+            db (AsyncSession): The SQLAlchemy session object used for querying the database.
+        If confirmation_host is given, the confirmation email is queued in the outbox
+        in the same transaction as the user.
 
     :param body: UserModel: Create a new user object
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
+    :param confirmation_host: str | None: The host url of the confirmation link
     :return: A user object
     """
     avatar = None
@@ -37,52 +45,69 @@ async def create_user(body: UserModel, db: Session) -> User:
         print(e)
     new_user = User(**body.model_dump(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    if confirmation_host is not None:
+        repository_outbox.add_email(
+            "confirm", body.email, body.username, confirmation_host, db
+        )
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh token for a user.
 
     :param user: User: Identify the user in the database
     :param token: str | None: Update the user's refresh token
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: None
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    """
+    The update_password function stores a new password hash for a user.
+
+    :param user: User: Identify the user in the database
+    :param password: str: The new password hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    user.password = password
+    await db.commit()
+
+
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function takes in an email and a database session,
     and sets the confirmed field of the user with that email to True.
 
 
     :param email: str: Pass in the email address of the user who is trying to log in
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: None
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
 
 
 # endregion
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
     The update_avatar function updates the avatar of a user.
 
     :param email: Find the user in the database
     :param url: str: Specify the type of data that is expected to be passed into the function
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The user object after updating the avatar
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
     return user
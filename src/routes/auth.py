@@ -4,7 +4,6 @@ from fastapi import (
     Depends,
     status,
     Security,
-    BackgroundTasks,
     Request,
 )
 from fastapi.security import (
@@ -13,12 +12,14 @@ from fastapi.security import (
     HTTPBearer,
 )
 from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.db import get_db
+from src.database.models import User
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
+from src.repository import outbox as repository_outbox
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.services.email import send_email, send_recovery_email
+from src.services.email import dispatcher
 
 # region previous
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -30,17 +31,16 @@ security = HTTPBearer()
 )
 async def signup(
     body: UserModel,
-    background_tasks: BackgroundTasks,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The signup function creates a new user in the database.
+    The confirmation email is queued in the outbox in the same transaction.
 
     :param body: UserModel: Get the user's email and password
-    :param background_tasks: BackgroundTasks: Add a task to the background queue
     :param request: Request: Get the base_url of the request
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A dictionary with two keys:
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
@@ -48,10 +48,9 @@ async def signup(
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Account already exists"
         )
-    body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(
-        send_email, new_user.email, new_user.username, str(request.base_url)
+    body.password = await auth_service.get_password_hash(body.password)
+    new_user = await repository_users.create_user(
+        body, db, confirmation_host=str(request.base_url)
     )
     return {
         "user": new_user,
@@ -61,13 +60,13 @@ async def signup(
 
 @router.post("/login", response_model=TokenModel)
 async def login(
-    body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)
 ):
     """
     The login function is used to authenticate a user.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A token
     """
     user = await repository_users.get_user_by_email(body.username, db)
@@ -79,14 +78,19 @@ async def login(
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed"
         )
-    if not auth_service.verify_password(body.password, user.password):
+    valid, new_hash = await auth_service.verify_and_update_password(
+        body.password, user.password
+    )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password"
         )
+    if new_hash is not None:
+        # the hash was made with another work factor
+        await repository_users.update_password(user, new_hash, db)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh__token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh__token, db)
+    refresh__token, claims = await auth_service.issue_refresh_token(user, db)
+    access_token = await auth_service.create_access_token(data=claims)
     return {
         "access_token": access_token,
         "refresh_token": refresh__token,
@@ -94,35 +98,45 @@ async def login(
     }
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    token: str = Depends(auth_service.oauth2_scheme),
+    current_user: User = Depends(auth_service.get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    The logout function ends the session of the current user.
+    The access token is revoked right away and the refresh tokens of its login can no longer
+    be used; the other devices of the user stay logged in.
+
+    :param token: str: The access token from the request header
+    :param current_user: User: Make sure the token is valid and not revoked yet
+    :param db: AsyncSession: Get the database session
+    :return: None
+    """
+    await auth_service.logout(token, db)
+
+
 @router.get("/refresh_token", response_model=TokenModel)
 async def refresh_token(
     credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The refresh_token function is used to refresh the access token.
     It takes in a refresh token and returns a new access_token, refresh_token pair.
-    The function first decodes the provided refresh token to get the email of its owner.
-    Then it gets that user from our database and checks if their stored
-    refresh_token matches with what was provided as an argument. If they don't match,
-    it means that either this is not a valid user or someone else has stolen their tokens!
-    In both cases we should invalidate all tokens for this user by setting them to None in our database
+    The refresh token is single use: with the Redis token store, presenting a token that was
+    already rotated revokes every token of its login; with the database store, a token that does
+    not match the stored one invalidates it.
+
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-    :param db: Session: Pass the database session to the function
-    :param : Get the user's information from the database
+    :param db: AsyncSession: Pass the database session to the function
     :return: An access token and a refresh token
     """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
-        )
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    claims, refresh_token = await auth_service.rotate_refresh_token(
+        credentials.credentials, db
+    )
+    access_token = await auth_service.create_access_token(data=claims)
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -131,7 +145,7 @@ async def refresh_token(
 
 
 @router.get("/confirmed_email/{token}")
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
         It takes the token from the URL and uses it to get the user's email address.
@@ -139,7 +153,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
         If not, then we update their record in our database with a confirmation of their email.
 
     :param token: str: Get the token from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with a message
     """
     email = await auth_service.get_email_from_token(token)
@@ -151,44 +165,44 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     await repository_users.confirmed_email(email, db)
+    await auth_service.invalidate_user(email)
     return {"message": "Email confirmed"}
 
 
 @router.post("/request_email")
 async def request_email(
     body: RequestEmail,
-    background_tasks: BackgroundTasks,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The request_email function is used to send an email to the user with a link that they can click on
     to confirm their email address. The function takes in a RequestEmail object, which contains the user's
     email address. It then checks if there is already a confirmed account associated with that email address,
     and if so, returns an error message saying as much. If not, it sends an email containing a confirmation link.
+    The email is queued in the outbox, unless it was already requested within the de-duplication window.
 
     :param body: RequestEmail: Validate the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the request
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A message to the user
     """
     user = await repository_users.get_user_by_email(body.email, db)
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
-    if user:
-        background_tasks.add_task(
-            send_email, user.email, user.username, str(request.base_url)
+    if user and not dispatcher.is_duplicate(f"confirm:{user.email}"):
+        repository_outbox.add_email(
+            "confirm", user.email, user.username, str(request.base_url), db
         )
+        await db.commit()
     return {"message": "Check your email for confirmation."}
 
 
 @router.post("/recovery_password")
 async def recovery_email(
     body: RequestEmail,
-    background_tasks: BackgroundTasks,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The recovery_email function is used to send a recovery email to the user.
@@ -196,22 +210,26 @@ async def recovery_email(
     If the user does not exist, then it will return an error message.
 
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks
     :param request: Request: Get the base url of the request
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A dictionary with a message
     """
     user = await repository_users.get_user_by_email(body.email, db)
-    if user and user.email == body.email:
-        background_tasks.add_task(
-            send_recovery_email, user.email, user.username, str(request.base_url)
+    if (
+        user
+        and user.email == body.email
+        and not dispatcher.is_duplicate(f"recovery:{user.email}")
+    ):
+        repository_outbox.add_email(
+            "recovery", user.email, user.username, str(request.base_url), db
         )
+        await db.commit()
     return {"message": "Check your email for instruction to recovery."}
 
 
 @router.get("/recovered_password/{token}")
 async def recovered_password(
-    new_password: str, token: str, db: Session = Depends(get_db)
+    new_password: str, token: str, db: AsyncSession = Depends(get_db)
 ):
     """
     The recovered_password function is used to reset a user's password.
@@ -221,7 +239,7 @@ async def recovered_password(
 
     :param new_password: str: Get the new password from the request body
     :param token: str: Get the email of the user who forgot his password
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message that the password was successfully reseted
     """
     email = await auth_service.get_email_from_token(token)
@@ -230,7 +248,7 @@ async def recovered_password(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Recovering error"
         )
-    user.password = auth_service.get_password_hash(new_password)
-    db.commit()
-    db.refresh(user)
+    password = await auth_service.get_password_hash(new_password)
+    await repository_users.update_password(user, password, db)
+    await auth_service.invalidate_user(email)
     return {"message": "Password was successfully reseted"}
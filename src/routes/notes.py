@@ -1,11 +1,41 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
-from src.database.db import get_db
-from src.schemas import NoteModel, NoteUpdate, NoteStatusUpdate, NoteResponse
+from typing import List, Literal
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    Depends,
+    status,
+    Request,
+    Response,
+    Query,
+    Body,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database.db import get_db, get_read_db
+from src.schemas import (
+    BULK_MAX_ITEMS,
+    NoteModel,
+    NoteUpdate,
+    NoteStatusUpdate,
+    NoteResponse,
+    NoteBulkResponse,
+    NoteIds,
+    NoteBulkStatusUpdate,
+    NoteIdsResponse,
+)
 from src.repository import notes as repository_notes
 from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.export import export_csv, export_ndjson
+from src.services.imports import ProgressStreamingResponse, import_ndjson
+from src.services.rate_limit import rate_limited_user
+from src.conf.config import settings
+from src.services.pagination import (
+    decode_cursor,
+    decode_rank_cursor,
+    encode_rank_cursor,
+    set_next_cursor,
+)
 from src.database.models import User
 
 router = APIRouter(prefix="/notes", tags=["notes"])
@@ -15,26 +45,110 @@ router = APIRouter(prefix="/notes", tags=["notes"])
     "/",
     response_model=List[NoteResponse],
     description="No more than 10 requests per minute",
-    dependencies=[Depends(RateLimiter(times=10, seconds=60))],
 )
 async def read_notes(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(auth_service.get_current_user),
+    cursor: str | None = None,
+    tags: str | None = Query(default=None, pattern=r"^\d+(,\d+){0,19}$"),
+    match: Literal["all", "any"] = "any",
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(rate_limited_user(times=10, seconds=60)),
 ):
     """
     The read_notes function returns a list of notes.
+    Pages are chained with the opaque cursor returned in the X-Next-Cursor and Link headers;
+    skip is still accepted for the first page and for older clients.
+    Responses are cached per user until one of the user's notes or tags changes, and carry
+    an ETag: a matching If-None-Match is answered with 304 before the database is queried.
+    Misses are read from the primary, since a lagging replica would cache stale notes
+    under the current version.
 
+    :param request: Request: Build the url of the next page
+    :param response: Response: Set the pagination headers
     :param skip: int: Skip a certain number of notes
     :param limit: int: Limit the number of notes returned
-    :param db: Session: Pass the database session to the repository layer
+    :param cursor: str: The cursor of the page to return
+    :param tags: str: Comma-separated ids of the tags to filter by, up to 20
+    :param match: str: Return notes with all of the tags or with any of them
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Get the current user
+    :return: A list of notes
+    """
+    after_id = decode_cursor(cursor) if cursor else None
+    tag_ids = [int(tag_id) for tag_id in tags.split(",")] if tags else None
+    cached = await response_cache.get(current_user.id, request)
+    if cached.response is not None:
+        return cached.response
+    notes = await repository_notes.get_notes(
+        skip, limit, current_user, db, after_id, tag_ids, match == "all"
+    )
+    set_next_cursor(request, response, notes, limit)
+    return await response_cache.set(cached, List[NoteResponse], notes, response)
+
+
+@router.get("/search", response_model=List[NoteResponse])
+async def search_notes(
+    request: Request,
+    response: Response,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The search_notes function returns the notes whose title or description match q, best matches first.
+    The cursor of the next page is sent in the X-Next-Cursor and Link headers.
+
+    :param request: Request: Build the url of the next page
+    :param response: Response: Set the pagination headers
+    :param q: str: The text to search for
+    :param limit: int: Limit the number of notes returned
+    :param cursor: str: The cursor of the page to return
+    :param db: AsyncSession: Pass the database session to the repository layer
     :param current_user: User: Get the current user
-    :param: Determine the number of notes to skip
     :return: A list of notes
     """
-    notes = await repository_notes.get_notes(skip, limit, current_user, db)
-    return notes
+    after = decode_rank_cursor(cursor) if cursor else None
+    results = await repository_notes.search_notes(q, limit, current_user, db, after)
+    set_next_cursor(
+        request,
+        response,
+        results,
+        limit,
+        encode=lambda result: encode_rank_cursor(result[1], result[0].id),
+    )
+    return [note for note, _ in results]
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_notes(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The export_notes function streams all notes of the current user, with tag names, as NDJSON or CSV.
+    Rows are read from a server-side cursor while the response is sent, so memory use stays flat.
+
+    :param format: str: The export format, ndjson or csv
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Get the current user
+    :return: A streaming response with the notes
+    """
+    notes = repository_notes.stream_notes(current_user, db)
+    if format == "csv":
+        content, media_type = export_csv(notes), "text/csv"
+    else:
+        content, media_type = export_ndjson(notes), "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="notes.{format}"'},
+    )
 
 
 # previous below
@@ -43,7 +157,9 @@ async def read_notes(
 @router.get("/{note_id}", response_model=NoteResponse)
 async def read_note(
     note_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -52,23 +168,28 @@ async def read_note(
     If no such note exists, it raises an HTTPException with status code 404 (Not Found).
 
     :param note_id: int: Specify the note id
-    :param db: Session: Pass the database session to the function
+    :param request: Request: Look the response up in the cache and check If-None-Match
+    :param response: Response: The response to cache
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current user
     :return: A note object, which is defined in the models
     """
+    cached = await response_cache.get(current_user.id, request)
+    if cached.response is not None:
+        return cached.response
     note = await repository_notes.get_note(note_id, current_user, db)
     if note is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Note not found"
         )
-    return note
+    return await response_cache.set(cached, NoteResponse, note, response)
 
 
 @router.put("/{note_id}", response_model=NoteResponse)
 async def update_note(
     body: NoteUpdate,
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -76,7 +197,7 @@ async def update_note(
 
     :param body: NoteUpdate: Pass the data from the request body to the function
     :param note_id: int: Identify the note to be deleted
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the user that is currently logged in
     :param: Get the note id from the url
     :return: A note object
@@ -89,11 +210,49 @@ async def update_note(
     return note
 
 
+@router.patch("/status", response_model=NoteIdsResponse)
+async def update_status_notes(
+    body: NoteBulkStatusUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The update_status_notes function sets the status of many notes at once.
+
+    :param body: NoteBulkStatusUpdate: Get the note ids and the new status from the request body
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user that is logged in
+    :return: The ids that were updated and the ids that were not found
+    """
+    updated = await repository_notes.update_status_notes(
+        body.ids, body, current_user, db
+    )
+    return {"affected": updated, "not_found": sorted(set(body.ids) - set(updated))}
+
+
+@router.delete("/", response_model=NoteIdsResponse)
+async def remove_notes(
+    body: NoteIds,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The remove_notes function removes many notes at once.
+
+    :param body: NoteIds: Get the ids of the notes to remove from the request body
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user that is logged in
+    :return: The ids that were removed and the ids that were not found
+    """
+    removed = await repository_notes.remove_notes(body.ids, current_user, db)
+    return {"affected": removed, "not_found": sorted(set(body.ids) - set(removed))}
+
+
 @router.patch("/{note_id}", response_model=NoteResponse)
 async def update_status_note(
     body: NoteStatusUpdate,
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -101,7 +260,7 @@ async def update_status_note(
 
     :param body: NoteStatusUpdate: Get the status of the note from the request body
     :param note_id: int: Get the note id from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user that is logged in
     :param: Get the note_id from the url
     :return: A note object
@@ -117,7 +276,7 @@ async def update_status_note(
 @router.delete("/{note_id}", response_model=NoteResponse)
 async def remove_note(
     note_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -126,7 +285,7 @@ async def remove_note(
         If no such Note exists, then a 404 error is raised. Otherwise, that Note is removed from the database.
 
     :param note_id: int: Get the note id from the url
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current user from the database
     :return: The removed note, which is a dict
     """
@@ -139,15 +298,62 @@ async def remove_note(
 
 
 @router.post("/", response_model=NoteResponse, status_code=status.HTTP_201_CREATED)
-async def create_note(body: NoteModel, db: Session = Depends(get_db),
+async def create_note(body: NoteModel, db: AsyncSession = Depends(get_db),
                       user: User = Depends(auth_service.get_current_user)):
     """
     The create_note function creates a new note in the database.
 
     :param body: NoteModel: Get the body of the note
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param user: User: Get the current user
     :return: A notemodel object
     """
     note = await repository_notes.create_note(body, user, db)
     return note
+
+
+@router.post("/import", response_class=ProgressStreamingResponse)
+async def import_notes(
+    request: Request,
+    batch_size: int | None = Query(default=None, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The import_notes function imports notes from an NDJSON request body.
+    Every line is a note with a title, a description and tag names; missing tags are created.
+    The body is read incrementally and written in batches, and a progress line is streamed
+    back after each batch.
+
+    :param request: Request: Read the request body as it arrives
+    :param batch_size: int: The number of notes written per transaction
+    :param db: AsyncSession: Get the database session
+    :param user: User: Get the current user
+    :return: A streaming NDJSON response with the import progress
+    """
+    return ProgressStreamingResponse(
+        import_ndjson(
+            request.stream(), user, db, batch_size or settings.import_batch_size
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/bulk", response_model=NoteBulkResponse)
+async def create_notes(
+    body: List[NoteModel] = Body(max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The create_notes function creates many notes in one request and one transaction.
+    Notes that reference unknown tags are reported in the results and skipped, the rest are created.
+
+    :param body: List[NoteModel]: The notes to create, at most BULK_MAX_ITEMS
+    :param db: AsyncSession: Get the database session
+    :param user: User: Get the current user
+    :return: The number of created notes and a result for every submitted note
+    """
+    results = await repository_notes.create_notes(body, user, db)
+    created = sum(1 for result in results if result["id"] is not None)
+    return {"created": created, "results": results}
@@ -1,10 +1,12 @@
 from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Request, Response, Body
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.db import get_db
-from src.schemas import TagModel, TagResponse
+from src.schemas import BULK_MAX_ITEMS, TagModel, TagResponse
 from src.repository import tags as repository_tags
 from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.pagination import decode_cursor, set_next_cursor
 from src.database.models import User
 
 router = APIRouter(prefix="/tags", tags=["tags"])
@@ -12,28 +14,46 @@ router = APIRouter(prefix="/tags", tags=["tags"])
 
 @router.get("/", response_model=List[TagResponse])
 async def read_tags(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
     The read_tags function returns a list of tags.
-
+    The cursor of the next page is sent in the X-Next-Cursor and Link headers.
+    Responses are cached per user until one of the user's notes or tags changes, and carry
+    an ETag: a matching If-None-Match is answered with 304 before the database is queried.
+    Misses are read from the primary, since a lagging replica would cache stale tags
+    under the current version.
+
+    :param request: Request: Build the url of the next page
+    :param response: Response: Set the pagination headers
     :param skip: int: Skip the first n tags
     :param limit: int: Limit the number of tags returned
-    :param db: Session: Get the database session
+    :param cursor: str: The cursor of the page to return
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the auth_service
     :return: A list of tags
     """
-    tags = await repository_tags.get_tags(skip, limit, current_user, db)
-    return tags
+    after_id = decode_cursor(cursor) if cursor else None
+    cached = await response_cache.get(current_user.id, request)
+    if cached.response is not None:
+        return cached.response
+    tags = await repository_tags.get_tags(skip, limit, current_user, db, after_id)
+    set_next_cursor(request, response, tags, limit)
+    return await response_cache.set(cached, List[TagResponse], tags, response)
 
 
 @router.get("/{tag_id}", response_model=TagResponse)
 async def read_tag(
     tag_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -41,23 +61,28 @@ async def read_tag(
     It takes in an integer representing the ID of the tag, and returns a Tag object.
 
     :param tag_id: int: Specify the tag id to be read
-    :param db: Session: Pass the database session to the function
+    :param request: Request: Look the response up in the cache and check If-None-Match
+    :param response: Response: The response to cache
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Ensure that the user is logged in
     :return: A tag object
     :doc-author: Trelent
     """
+    cached = await response_cache.get(current_user.id, request)
+    if cached.response is not None:
+        return cached.response
     tag = await repository_tags.get_tag(tag_id, current_user, db)
     if tag is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Tag not found"
         )
-    return tag
+    return await response_cache.set(cached, TagResponse, tag, response)
 
 
 @router.post("/", response_model=TagResponse, status_code=status.HTTP_201_CREATED)
 async def create_tag(
     body: TagModel,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -66,7 +91,7 @@ async def create_tag(
         The function also requires an authenticated user to be passed in via the current_user parameter.
 
     :param body: TagModel: Validate the body of the request
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the current user from the database
     :return: A tagmodel object
     :doc-author: Trelent
@@ -78,7 +103,7 @@ async def create_tag(
 async def update_tag(
     body: TagModel,
     tag_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -86,11 +111,11 @@ async def update_tag(
         The function takes three arguments:
             body (TagModel): A TagModel object containing the new values for the tag.
             tag_id (int): An integer representing the ID of an existing tag to be updated.
-            db (Session, optional): A SQLAlchemy Session object used to query and update data in a database. Defaults to None, which will cause Depends(get_db) to create one when called by FastAPI's dependency injection system.
+            db (AsyncSession, optional): A SQLAlchemy AsyncSession object used to query and update data in a database. Defaults to None, which will cause Depends(get_db) to create one when called by FastAPI's dependency injection system.
 
     :param body: TagModel: Get the data from the request body and
     :param tag_id: int: Specify the id of the tag to be deleted
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the current user from the database
     :return: A tagmodel object
     :doc-author: Trelent
@@ -106,14 +131,14 @@ async def update_tag(
 @router.delete("/{tag_id}", response_model=TagResponse)
 async def remove_tag(
     tag_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     """
     The remove_tag function removes a tag from the database.
 
     :param tag_id: int: Get the tag id from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user who is currently logged in
     :return: A dict, but the schema is not specified
     :doc-author: Trelent
@@ -124,3 +149,24 @@ async def remove_tag(
             status_code=status.HTTP_404_NOT_FOUND, detail="Tag not found"
         )
     return tag
+
+
+@router.post("/bulk", response_model=List[TagResponse])
+async def upsert_tags(
+    body: List[TagModel] = Body(max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    The upsert_tags function creates many tags at once.
+        Names the user already has are not duplicated: the existing tags are returned instead,
+        so the ids of every requested name come back in one response.
+
+    :param body: List[TagModel]: The tags to create, at most BULK_MAX_ITEMS
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Get the current user from the database
+    :return: A list of tags, in the order of the request
+    """
+    return await repository_tags.upsert_tags(
+        [tag.name for tag in body], current_user, db
+    )
@@ -1,61 +1,137 @@
-import pickle
+import os
 
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.avatars import (
+    LocalAvatarStorage,
+    RangeFileResponse,
+    avatar_storage,
+    process_avatar,
+    read_upload,
+)
+from src.services.cache import etag_matches, response_cache
 from src.conf.config import settings
 from src.schemas import UserDb
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+IMMUTABLE = "public, max-age=31536000, immutable"
+
 
 @router.get("/me/", response_model=UserDb)
-async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
+async def read_users_me(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(auth_service.get_current_user),
+):
     """
     The read_users_me function is a GET endpoint that returns the current user's information.
+    It carries the ETag of the user's data version and answers a matching If-None-Match with 304.
+    The user is read from the primary, since a lagging replica would cache the old row
+    under the version that the last update just bumped.
 
+    :param request: Request: Check the If-None-Match header
+    :param response: Response: The response to cache
     :param current_user: User: Get the current user
     :return: The current user object
     """
-    return current_user
+    cached = await response_cache.get(current_user.id, request)
+    if cached.response is not None:
+        return cached.response
+    return await response_cache.set(cached, UserDb, current_user, response)
 
 
-@router.patch("/avatar", response_model=UserDb)
+@router.patch(
+    "/avatar",
+    response_model=UserDb,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
 async def update_avatar_user(
-    file: UploadFile = File(),
+    request: Request,
     current_user: User = Depends(auth_service.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The update_avatar_user function is used to update the avatar of a user.
-        The function takes in an UploadFile object, which contains the file that will be uploaded to Cloudinary.
-        It also takes in a User object, which is obtained from auth_service's get_current_user function.
-        Finally it takes in a Session object, which is obtained from get_db().
+        The image is read from the file field of a multipart form, at most avatar_max_bytes of it,
+        cropped to avatar_size x avatar_size and re-encoded as a JPEG in the thread pool,
+        then saved by the configured avatar storage.
 
-    :param file: UploadFile: Upload the file to cloudinary
+    :param request: Request: Read the multipart body with the file
     :param current_user: User: Get the current user's email
-    :param db: Session: Connect to the database
+    :param db: AsyncSession: Connect to the database
     :return: The user object with the updated avatar
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True,
-    )
-
-    r = cloudinary.uploader.upload(
-        file.file, public_id=f"NotesApp/{current_user.username}", overwrite=True
-    )
-    src_url = cloudinary.CloudinaryImage(f"NotesApp/{current_user.username}").build_url(
-        width=250, height=250, crop="fill", version=r.get("version")
-    )
+    data = await read_upload(request, "file", settings.avatar_max_bytes)
+    avatar = await process_avatar(data, settings.avatar_size)
+    src_url = await avatar_storage.save(current_user, avatar)
     user = await repository_users.update_avatar(current_user.email, src_url, db)
-    await auth_service.r.set(user.email, pickle.dumps(user))
-    await auth_service.r.expire(user.email, 300)
+    await auth_service.invalidate_user(user.email)
+    await response_cache.invalidate(user.id)
     return user
+
+
+@router.get(
+    "/{user_id}/avatar",
+    response_class=FileResponse,
+    responses={200: {"content": {"image/jpeg": {}}}},
+)
+async def read_avatar(user_id: int, request: Request, v: str | None = None):
+    """
+    The read_avatar function serves an avatar kept by the local avatar storage straight from disk.
+        With the content hash of the avatar as v, which users.avatar carries, the response
+        can be cached forever; without it the current avatar is sent and has to be revalidated.
+        Single byte ranges are supported.
+
+    :param user_id: int: The owner of the avatar
+    :param request: Request: Check the If-None-Match, Range and If-Range headers
+    :param v: str | None: The content hash of the avatar
+    :return: The avatar, or 304 if the client has it already
+    """
+    found = None
+    if isinstance(avatar_storage, LocalAvatarStorage):
+        found = await run_in_threadpool(avatar_storage.find, user_id, v)
+    if found is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    path, version = found
+    etag = f'"{version}"'
+    headers = {
+        "etag": etag,
+        "cache-control": IMMUTABLE if v is not None else "no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    range_header = request.headers.get("range")
+    if request.headers.get("if-range", etag) != etag:
+        range_header = None
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        # replaced by a new avatar meanwhile
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    return RangeFileResponse(
+        path,
+        stat_result,
+        range_header,
+        headers=headers,
+        media_type="image/jpeg",
+    )
@@ -1,10 +1,15 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Annotated, List, Optional
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
 
 
 # region previous
 
+# The bulk endpoints bind a parameter per item, and per tag of a note, in one statement;
+# the limits keep them well under the 32767 bind parameters PostgreSQL accepts.
+BULK_MAX_ITEMS = 1000
+NOTE_MAX_TAGS = 20
+
 
 class TagModel(BaseModel):
     name: str = Field(max_length=25)
@@ -21,7 +26,11 @@ class NoteBase(BaseModel):
 
 
 class NoteModel(NoteBase):
-    tags: List[int]
+    tags: List[int] = Field(max_length=NOTE_MAX_TAGS)
+
+
+class NoteImport(NoteBase):
+    tags: List[Annotated[str, Field(min_length=1, max_length=25)]] = []
 
 
 class NoteUpdate(NoteModel):
@@ -32,6 +41,19 @@ class NoteStatusUpdate(BaseModel):
     done: bool
 
 
+class NoteIds(BaseModel):
+    ids: List[int] = Field(max_length=BULK_MAX_ITEMS)
+
+
+class NoteBulkStatusUpdate(NoteIds, NoteStatusUpdate):
+    pass
+
+
+class NoteIdsResponse(BaseModel):
+    affected: List[int]
+    not_found: List[int]
+
+
 class NoteResponse(NoteBase):
     id: int
     created_at: datetime
@@ -40,6 +62,17 @@ class NoteResponse(NoteBase):
     ConfigDict(from_attributes=True)
 
 
+class NoteBulkResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class NoteBulkResponse(BaseModel):
+    created: int
+    results: List[NoteBulkResult]
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
     email: str
@@ -1,52 +1,99 @@
-import redis.asyncio as redis
-import pickle
-from typing import Optional
+import asyncio
+import hashlib
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from src.database.db import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database.db import get_db, get_read_db
 from src.repository import users as repository_users
+from src.database.models import User
 from src.conf.config import settings
+from src.services import redis_pool
+from src.services.local_cache import TTLCache
+from src.services.refresh_tokens import RefreshTokenStore
+from src.services.revocation import RevokedTokens
+from src.services.user_cache import UserCache, UserSnapshot
+
+
+REFRESH_TOKEN_TTL = 7 * 24 * 60 * 60
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds
+    )
+    # bcrypt releases the GIL, so hashing in threads keeps the event loop free
+    hash_executor = ThreadPoolExecutor(
+        max_workers=settings.password_hash_workers, thread_name_prefix="password-hash"
+    )
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(
-        host=settings.redis_host,
-        port=settings.redis_port,
-        password=settings.redis_password,
-        db=0,
+    r = redis_pool.r
+    user_cache = UserCache(
+        r,
+        ttl=settings.user_cache_ttl,
+        local_ttl=settings.user_cache_local_ttl,
+        local_size=settings.user_cache_local_size,
     )
+    refresh_tokens = RefreshTokenStore(r, ttl=REFRESH_TOKEN_TTL)
+    revoked_tokens = RevokedTokens(r)
+    # claims of verified access tokens, by token hash, kept until the token expires
+    token_cache = TTLCache(settings.token_cache_size, ttl=0)
 
-    def verify_password(self, plain_password, hashed_password):
+    async def _run_hash(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.hash_executor, func, *args)
+
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
         password as arguments. It then uses the pwd_context object to verify that the
-        plain-text password matches the hashed one.
+        plain-text password matches the hashed one, in the hash_executor thread pool.
 
         :param self: Represent the instance of the class
         :param plain_password: Compare the password entered by the user to see if it matches
         :param hashed_password: Compare the hashed password stored in the database to the plain text password entered by a user
         :return: True if the password is correct and false otherwise
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await self._run_hash(
+            self.pwd_context.verify, plain_password, hashed_password
+        )
+
+    async def verify_and_update_password(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, str | None]:
+        """
+        The verify_and_update_password function verifies a password like verify_password and,
+        when the stored hash was made with another work factor than settings.bcrypt_rounds,
+        also returns a new hash of the password to store instead.
 
-    def get_password_hash(self, password: str):
+        :param self: Represent the instance of the class
+        :param plain_password: str: The password entered by the user
+        :param hashed_password: str: The hash stored in the database
+        :return: Whether the password is correct, and the new hash or None
+        """
+        return await self._run_hash(
+            self.pwd_context.verify_and_update, plain_password, hashed_password
+        )
+
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-        The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+        The hash is generated using the pwd_context object, in the hash_executor thread pool.
 
         :param self: Represent the instance of the class
         :param password: str: Specify the password that we want to hash
         :return: A hash of the password
         """
-        return self.pwd_context.hash(password)
+        return await self._run_hash(self.pwd_context.hash, password)
 
     # define a function to generate a new access token
     async def create_access_token(
@@ -69,7 +116,12 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update(
-            {"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"}
+            {
+                "iat": datetime.utcnow(),
+                "exp": expire,
+                "scope": "access_token",
+                "jti": uuid.uuid4().hex,
+            }
         )
         encoded_access_token = jwt.encode(
             to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM
@@ -95,7 +147,7 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=REFRESH_TOKEN_TTL)
         to_encode.update(
             {"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"}
         )
@@ -114,13 +166,24 @@ class Auth:
         :param refresh_token: str: Decode the refresh token
         :return: The email of the user
         """
+        payload = await self.decode_refresh_claims(refresh_token)
+        return payload["sub"]
+
+    async def decode_refresh_claims(self, refresh_token: str) -> dict:
+        """
+        The decode_refresh_claims function verifies a refresh token and returns its claims.
+        It will raise an exception if the token is invalid, has expired or is not a refresh token.
+
+        :param self: Represent the instance of a class
+        :param refresh_token: str: Decode the refresh token
+        :return: The claims of the token
+        """
         try:
             payload = jwt.decode(
                 refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM]
             )
             if payload["scope"] == "refresh_token":
-                email = payload["sub"]
-                return email
+                return payload
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid scope for token",
@@ -131,52 +194,199 @@ class Auth:
                 detail="Could not validate credentials",
             )
 
+    async def issue_refresh_token(self, user: User, db: AsyncSession) -> Tuple[str, dict]:
+        """
+        The issue_refresh_token function creates the refresh token of a new login.
+            With settings.refresh_token_store set to "redis" the token starts a rotation family
+            in refresh_tokens and nothing is written to the database; otherwise the token is
+            stored in users.refresh_token.
+            The access tokens of the login carry the id of its family, so that logging out
+            ends only this login.
+
+        :param self: Represent the instance of a class
+        :param user: User: The user that logged in
+        :param db: AsyncSession: Pass the database session to the function
+        :return: A refresh token and the claims of the access tokens of the login
+        """
+        if settings.refresh_token_store == "redis":
+            family, jti = await self.refresh_tokens.issue(user.email)
+            refresh_token = await self.create_refresh_token(
+                {"sub": user.email, "fid": family, "jti": jti}
+            )
+            return refresh_token, {"sub": user.email, "fid": family}
+        # the jti keeps two tokens issued within the same second apart
+        refresh_token = await self.create_refresh_token(
+            {"sub": user.email, "jti": uuid.uuid4().hex}
+        )
+        await repository_users.update_token(user, refresh_token, db)
+        return refresh_token, {"sub": user.email}
+
+    async def rotate_refresh_token(
+        self, refresh_token: str, db: AsyncSession
+    ) -> Tuple[dict, str]:
+        """
+        The rotate_refresh_token function exchanges a refresh token for a new one.
+            A token of a rotation family is rotated in Redis without touching the database; if it
+            was already used, its family is revoked. A token stored in users.refresh_token is
+            checked against the database, and when the Redis store is enabled it is moved into
+            a new family, so tokens issued before the switch keep working once.
+            A token that does not match invalidates the stored one.
+
+        :param self: Represent the instance of a class
+        :param refresh_token: str: The refresh token sent by the client
+        :param db: AsyncSession: Pass the database session to the function
+        :return: The claims of the new access token and the new refresh token
+        """
+        invalid_token = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
+        )
+        payload = await self.decode_refresh_claims(refresh_token)
+        email = payload["sub"]
+        if "fid" in payload:
+            if settings.refresh_token_store != "redis":
+                raise invalid_token
+            jti = await self.refresh_tokens.rotate(payload["fid"], payload["jti"], email)
+            if jti is None:
+                raise invalid_token
+            new_token = await self.create_refresh_token(
+                {"sub": email, "fid": payload["fid"], "jti": jti}
+            )
+            return {"sub": email, "fid": payload["fid"]}, new_token
+
+        user = await repository_users.get_user_by_email(email, db)
+        if user is None:
+            raise invalid_token
+        if user.refresh_token != refresh_token:
+            await repository_users.update_token(user, None, db)
+            raise invalid_token
+        if settings.refresh_token_store == "redis":
+            await repository_users.update_token(user, None, db)
+        new_token, claims = await self.issue_refresh_token(user, db)
+        return claims, new_token
+
     async def get_current_user(
-        self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+        self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
     ):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
             if it's valid, otherwise raises an HTTPException with status code 401.
+            The token is verified once and its claims are cached until it expires; revoked
+            tokens are rejected from the in-memory copy of revoked_tokens.
+            The user is looked up in user_cache first and read from the database on a miss,
+            then cached.
 
         :param self: Access the class attributes
         :param token: str: Pass the token from the request header
-        :param db: Session: Pass the database session to the function
-        :return: A user object
+        :param db: AsyncSession: Pass the database session to the function
+        :return: A UserSnapshot of the user
         """
+        return await self._current_user(token, db, fill_cache=True)
+
+    async def _current_user(self, token: str, db: AsyncSession, fill_cache: bool):
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload["scope"] == "access_token":
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+        payload = self.decode_access_token(token)
+        if payload is None or self.revoked_tokens.is_revoked(payload.get("jti")):
             raise credentials_exception
+        email = payload["sub"]
 
-        user_hash = str(email)
-        user = await self.r.get(user_hash)
-
+        user = await self.user_cache.get(email)
         if user is None:
-            print("User from database")
-            user = await repository_users.get_user_by_email(email, db)
-            if user is None:
+            db_user = await repository_users.get_user_by_email(email, db)
+            if db_user is None:
                 raise credentials_exception
-            await self.r.set(user_hash, pickle.dumps(user))
-            await self.r.expire(user_hash, 100)
-        else:
-            print("User from cache")
-            user = pickle.loads(user)
+            user = UserSnapshot.from_user(db_user)
+            if fill_cache:
+                await self.user_cache.set(user)
         return user
 
+    def decode_access_token(self, token: str) -> dict | None:
+        """
+        The decode_access_token function returns the claims of a valid access token.
+            A token is verified and parsed the first time it is seen; its claims are then kept
+            in token_cache, by a hash of the token, until it expires, so the same token presented
+            again skips the signature check and the JSON parsing.
+
+        :param self: Access the class attributes
+        :param token: str: The access token from the request header
+        :return: The claims, or None if the token is invalid, expired or not an access token
+        """
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        payload = self.token_cache.get(key)
+        if payload is not None:
+            return payload
+        try:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        except JWTError:
+            return None
+        if payload.get("scope") != "access_token" or payload.get("sub") is None:
+            return None
+        ttl = payload["exp"] - time.time()
+        if ttl > 0:
+            self.token_cache.set(key, payload, ttl=ttl)
+        return payload
+
+    async def logout(self, token: str, db: AsyncSession) -> None:
+        """
+        The logout function revokes an access token and the refresh tokens of its login.
+            The access token is rejected by all workers from then on, without waiting for it
+            to expire. With the Redis store only the rotation family named by the token ends,
+            so the other devices of the user stay logged in; an access token issued before
+            tokens named their family ends every family of the user.
+
+        :param self: Access the class attributes
+        :param token: str: The access token of the session to end
+        :param db: AsyncSession: Pass the database session to the function
+        :return: None
+        """
+        payload = self.decode_access_token(token)
+        if payload is None:
+            return
+        if payload.get("jti") is not None:
+            await self.revoked_tokens.revoke(payload["jti"], payload["exp"])
+        if settings.refresh_token_store == "redis":
+            if "fid" in payload:
+                await self.refresh_tokens.revoke(payload["fid"], payload["sub"])
+            else:
+                await self.refresh_tokens.revoke_user(payload["sub"])
+        user = await repository_users.get_user_by_email(payload["sub"], db)
+        if user is not None and user.refresh_token is not None:
+            await repository_users.update_token(user, None, db)
+
+    async def invalidate_user(self, email: str) -> None:
+        """
+        The invalidate_user function drops the cached user after a change to its row,
+            in this worker and, over Redis pub/sub, in all the others.
+
+        :param self: Access the class attributes
+        :param email: str: The email of the user that changed
+        :return: None
+        """
+        await self.user_cache.invalidate(email)
+
+    async def get_current_user_readonly(
+        self,
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_read_db),
+    ):
+        """
+        The get_current_user_readonly function is the get_current_user dependency for
+            read-only endpoints: a cache miss is served from a read replica instead of the primary.
+            The user read from the replica is not cached, since a lagging replica would put back
+            the row that invalidate_user just dropped; the cache is only filled from the primary.
+
+        :param self: Access the class attributes
+        :param token: str: Pass the token from the request header
+        :param db: AsyncSession: Pass the read-only database session to the function
+        :return: A user object
+        """
+        return await self._current_user(token, db, fill_cache=False)
+
     async def create_email_token(self, data: dict):
         """
         The create_email_token function takes in a dictionary of data and returns a token.
@@ -0,0 +1,341 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Tuple
+
+import anyio
+
+import cloudinary
+import cloudinary.uploader
+from fastapi import HTTPException, Request, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from src.conf.config import settings
+from src.database.models import User
+
+# room for the multipart boundaries and part headers around the file
+FORM_OVERHEAD = 16 * 1024
+# the content hash that names a locally stored avatar
+VERSION = re.compile(r"[0-9a-f]{32}")
+
+
+async def read_upload(request: Request, field: str, max_bytes: int) -> bytes:
+    """
+    The read_upload function reads one file of a multipart/form-data request body.
+        The body is parsed as it is received and the request is rejected with 413 as soon as
+        it grows past max_bytes, instead of after the whole body was spooled to disk.
+
+    :param request: Request: The request with the multipart body
+    :param field: str: The name of the form field with the file
+    :param max_bytes: int: The largest accepted file, in bytes
+    :return: The content of the file
+    """
+    limit = max_bytes + FORM_OVERHEAD
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File is larger than {max_bytes} bytes",
+    )
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Expected multipart/form-data",
+        )
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise too_large
+
+    async def capped():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise too_large
+            yield chunk
+
+    try:
+        form = await MultiPartParser(
+            request.headers, capped(), max_files=1, max_fields=1
+        ).parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.message)
+    file = form.get(field)
+    if not isinstance(file, UploadFile):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Missing file field '{field}'",
+        )
+    try:
+        data = await file.read()
+    finally:
+        await form.close()
+    if len(data) > max_bytes:
+        raise too_large
+    return data
+
+
+def resize_avatar(data: bytes, size: int) -> bytes:
+    """
+    The resize_avatar function crops an image to a centered square of size x size pixels
+    and re-encodes it as a JPEG. It is CPU bound; call it through process_avatar.
+
+    :param data: bytes: The uploaded image, in any format Pillow reads
+    :param size: int: The width and height of the avatar
+    :return: The JPEG avatar
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # let the JPEG decoder downscale while decoding
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            avatar = ImageOps.fit(image.convert("RGB"), (size, size), Image.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="File is not a valid image"
+        )
+    output = io.BytesIO()
+    avatar.save(output, "JPEG", quality=85, optimize=True)
+    return output.getvalue()
+
+
+async def process_avatar(data: bytes, size: int = settings.avatar_size) -> bytes:
+    """
+    The process_avatar function runs resize_avatar in the thread pool, so the event loop
+    keeps serving other requests while the image is decoded, resized and encoded.
+
+    :param data: bytes: The uploaded image
+    :param size: int: The width and height of the avatar
+    :return: The JPEG avatar
+    """
+    return await run_in_threadpool(resize_avatar, data, size)
+
+
+class AvatarStorage(ABC):
+    """
+    Where processed avatars are kept. save stores the avatar of a user, replacing the
+    previous one, and returns the URL to put in users.avatar.
+    """
+
+    @abstractmethod
+    async def save(self, user: User, data: bytes) -> str:
+        ...
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        # removed by the save that wrote a newer avatar
+        return -1.0
+
+
+class LocalAvatarStorage(AvatarStorage):
+    """
+    Keeps avatars as files in a local directory, one subdirectory per user, and serves them
+    from GET /api/users/{user_id}/avatar.
+    Every file is named after the hash of its content and the URL carries that hash,
+    so the URL of an avatar changes with its content and can be cached forever.
+    Works offline, e.g. in development and tests.
+    """
+
+    def __init__(self, root: str | Path, url: str):
+        self.root = Path(root)
+        self.url = url
+
+    def _write(self, user_id: int, version: str, data: bytes) -> None:
+        directory = self.root / str(user_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file first, so a half-written avatar is never served
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, directory / f"{version}.jpg")
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        for path in directory.glob("*.jpg"):
+            if path.stem != version:
+                path.unlink(missing_ok=True)
+
+    async def save(self, user: User, data: bytes) -> str:
+        """
+        The save method writes the avatar of a user to the directory in the thread pool
+        and removes the previous one.
+
+        :param self: Represent the instance of the class
+        :param user: User: The owner of the avatar
+        :param data: bytes: The JPEG avatar
+        :return: The URL of the avatar, with its content hash as the v parameter
+        """
+        version = hashlib.blake2b(data, digest_size=16).hexdigest()
+        await run_in_threadpool(self._write, user.id, version, data)
+        return f"{self.url.format(user_id=user.id)}?v={version}"
+
+    def find(self, user_id: int, version: str | None = None) -> Tuple[Path, str] | None:
+        """
+        The find method looks up the file of an avatar. It touches the disk, so call it
+        in the thread pool.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the avatar
+        :param version: str | None: The content hash from the URL, None for the current avatar
+        :return: The path and the version of the avatar, or None if there is no such avatar
+        """
+        directory = self.root / str(user_id)
+        if version is not None:
+            if not VERSION.fullmatch(version):
+                return None
+            path = directory / f"{version}.jpg"
+            return (path, version) if path.is_file() else None
+        # save leaves a single avatar, but a concurrent save may briefly leave two
+        paths = list(directory.glob("*.jpg")) if directory.is_dir() else []
+        if not paths:
+            return None
+        path = max(paths, key=_mtime)
+        return path, path.stem
+
+
+def parse_range(header: str, size: int) -> Tuple[int, int] | None:
+    """
+    The parse_range function reads a Range header with a single byte range.
+        Other units and multiple ranges are not supported and the whole file is sent instead,
+        as it is for an invalid range, e.g. one whose last byte comes before its first.
+
+    :param header: str: The Range header of the request
+    :param size: int: The size of the file
+    :return: The first byte and the end (exclusive) of the range, or None to send the whole file
+    :raises ValueError: If the range starts at or past the end of the file
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, dash, last = ranges.strip().partition("-")
+    if not dash or not (first or last) or not all(p.isdigit() for p in (first, last) if p):
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size
+    elif last and int(last) < int(first):
+        return None
+    else:
+        start, end = int(first), min(int(last) + 1, size) if last else size
+    if start >= end:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
+
+
+class RangeFileResponse(FileResponse):
+    """
+    A FileResponse that advertises Accept-Ranges and answers a Range request for a single
+    byte range with 206 Partial Content, or 416 if the range is outside of the file.
+    The body is sent with the ASGI zero-copy send extension when the server offers it,
+    and read in chunks otherwise.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        stat_result: os.stat_result,
+        range_header: str | None = None,
+        **kwargs,
+    ):
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        size = stat_result.st_size
+        self.headers["accept-ranges"] = "bytes"
+        self.start, self.end = 0, size
+        try:
+            byte_range = parse_range(range_header, size) if range_header else None
+        except ValueError:
+            self.status_code = status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+            self.start = self.end = 0
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            return
+        if byte_range is not None:
+            self.start, self.end = byte_range
+            self.status_code = status.HTTP_206_PARTIAL_CONTENT
+            self.headers["content-range"] = f"bytes {self.start}-{self.end - 1}/{size}"
+            self.headers["content-length"] = str(self.end - self.start)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        count = self.end - self.start
+        if self.send_header_only or not count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": file,
+                        "offset": self.start,
+                        "count": count,
+                        "more_body": False,
+                    }
+                )
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.start)
+                more_body = True
+                while more_body:
+                    chunk = await file.read(min(self.chunk_size, count))
+                    count -= len(chunk)
+                    more_body = bool(chunk) and count > 0
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": more_body}
+                    )
+        if self.background is not None:
+            await self.background()
+
+
+class CloudinaryAvatarStorage(AvatarStorage):
+    """
+    Uploads avatars to Cloudinary. The blocking upload runs in the thread pool.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, folder: str = "NotesApp"):
+        self.folder = folder
+        cloudinary.config(
+            cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True
+        )
+
+    async def save(self, user: User, data: bytes) -> str:
+        """
+        The save method uploads the avatar of a user, overwriting the previous one.
+
+        :param self: Represent the instance of the class
+        :param user: User: The owner of the avatar
+        :param data: bytes: The JPEG avatar
+        :return: The versioned URL of the avatar
+        """
+        r = await run_in_threadpool(
+            cloudinary.uploader.upload,
+            io.BytesIO(data),
+            public_id=f"{self.folder}/{user.username}",
+            overwrite=True,
+        )
+        return r["secure_url"]
+
+
+if settings.avatar_storage == "local":
+    avatar_storage: AvatarStorage = LocalAvatarStorage(
+        settings.avatar_dir, "/api/users/{user_id}/avatar"
+    )
+else:
+    avatar_storage = CloudinaryAvatarStorage(
+        settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret
+    )
@@ -0,0 +1,200 @@
+import json
+import secrets
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.auth import Auth
+
+# headers Response sets itself from the body
+SKIP_HEADERS = {"content-length", "content-type"}
+# clients may keep the response but have to revalidate it with If-None-Match
+CACHE_CONTROL = "private, no-cache"
+
+
+@dataclass
+class CacheLookup:
+    key: str
+    version: int | None
+    response: Response | None = None
+    etag: str | None = None
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    The etag_matches function tells if an If-None-Match header matches etag.
+    It uses the weak comparison that RFC 9110 prescribes for If-None-Match.
+
+    :param if_none_match: str | None: The If-None-Match header of the request
+    :param etag: str: The current entity tag of the resource
+    :return: True if the client already has the current representation
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+@lru_cache(maxsize=None)
+def _adapter(response_type: Any) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+class ResponseCache:
+    """
+    Caches serialized GET responses per user in Redis.
+    Every user has a version counter that the write paths bump; an entry stores the version
+    it was built at and is ignored once the counter has moved on, so invalidation never has
+    to look for keys. Stale entries simply expire.
+    The version also makes the strong ETag of the responses, so a request whose If-None-Match
+    is still current is answered with 304 Not Modified before anything is read or serialized.
+    A counter that is missing, e.g. after a Redis restart, a flush or an eviction, starts
+    again from a random base instead of from 1, so an old ETag does not match new content.
+    Redis errors are not fatal: the request is then served from the database.
+    """
+
+    def __init__(self, r, ttl: int, prefix: str = "cache"):
+        self.r = r
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def version_key(self, user_id: int) -> str:
+        return f"{self.prefix}:version:{user_id}"
+
+    def entry_key(self, user_id: int, request: Request) -> str:
+        query = sorted(request.query_params.multi_items())
+        return f"{self.prefix}:{user_id}:{request.url.path}?{json.dumps(query)}"
+
+    @staticmethod
+    def etag(user_id: int, version: int) -> str:
+        return f'"{user_id}-{version}"'
+
+    async def start_version(self, user_id: int) -> int:
+        """
+        The start_version method sets the missing version counter of a user to a random base,
+        unless another worker did it first, in one round trip.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The user whose counter is missing
+        :return: The current version of the user
+        """
+        key = self.version_key(user_id)
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.set(key, secrets.randbits(48), nx=True)
+            pipe.get(key)
+            _, version = await pipe.execute()
+        return int(version)
+
+    async def get(self, user_id: int, request: Request) -> CacheLookup:
+        """
+        The get method reads the cached response of request together with the current
+        version of the user, in one round trip.
+        If the If-None-Match header of the request holds the current ETag, the response
+        is a 304 Not Modified instead.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The owner of the response
+        :param request: Request: The request to look up, keyed by path and query
+        :return: A CacheLookup with the response on a hit, to be passed to set on a miss
+        """
+        key = self.entry_key(user_id, request)
+        try:
+            version, entry = await self.r.mget(self.version_key(user_id), key)
+            version = int(version) if version is not None else await self.start_version(user_id)
+        except (RedisError, OSError) as e:
+            print(e)
+            self.errors += 1
+            return CacheLookup(key, None)
+        etag = self.etag(user_id, version)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+            return CacheLookup(key, version, Response(status_code=304, headers=headers), etag)
+        if entry is not None:
+            meta, content = entry.split(b"\n", 1)
+            entry_version, headers = json.loads(meta)
+            if entry_version == version:
+                self.hits += 1
+                return CacheLookup(
+                    key,
+                    version,
+                    Response(content, media_type="application/json", headers=headers),
+                    etag,
+                )
+        self.misses += 1
+        return CacheLookup(key, version, etag=etag)
+
+    async def set(
+        self, lookup: CacheLookup, response_type: Any, content: Any, response: Response
+    ) -> Response:
+        """
+        The set method serializes content as response_type and stores it under the version
+        read by get, so that a write that happened in the meantime leaves the entry stale.
+
+        :param self: Represent the instance of the class
+        :param lookup: CacheLookup: The result of get for this request
+        :param response_type: Any: The response model to serialize content with
+        :param content: Any: The objects returned by the endpoint
+        :param response: Response: The endpoint response, whose headers are kept
+        :return: The response to send
+        """
+        adapter = _adapter(response_type)
+        body = adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name not in SKIP_HEADERS
+        }
+        if lookup.version is not None:
+            headers["ETag"] = lookup.etag
+            headers["Cache-Control"] = CACHE_CONTROL
+            meta = json.dumps([lookup.version, headers]).encode()
+            try:
+                await self.r.setex(lookup.key, self.ttl, meta + b"\n" + body)
+            except (RedisError, OSError) as e:
+                print(e)
+                self.errors += 1
+        return Response(body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, user_id: int) -> None:
+        """
+        The invalidate method makes every cached response of the user stale.
+        A missing counter is given a random base before it is incremented, like in get.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: The user whose data changed
+        :return: None
+        """
+        key = self.version_key(user_id)
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.set(key, secrets.randbits(48), nx=True)
+                pipe.incr(key)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            print(e)
+            self.errors += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+response_cache = ResponseCache(Auth.r, settings.response_cache_ttl)
@@ -1,10 +1,16 @@
+import asyncio
+import logging
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
-from pydantic import EmailStr
+from typing import Tuple
+
+import aiosmtplib
+from fastapi_mail import ConnectionConfig
 
 from src.conf.config import settings
 from src.services.auth import auth_service
+from src.services.local_cache import TTLCache
 
 conf = ConnectionConfig(
     MAIL_USERNAME=settings.mail_username,
@@ -20,64 +26,244 @@ conf = ConnectionConfig(
     TEMPLATE_FOLDER=Path(__file__).parent / "templates",
 )
 
+logger = logging.getLogger(__name__)
 
-async def send_email(email: EmailStr, username: str, host: str):
-    """
-    The send_email function sends an email to the user with a link to confirm their email address.
-        The function takes in three parameters:
-            -email: EmailStr, the user's email address.
-            -username: str, the username of the user who is registering for an account.  This will be used in a greeting message within the body of the email sent to them.
-            -host: str, this is used as part of a URL that will be included in an HTML template for sending emails.
 
-    :param email: EmailStr: Specify the email address of the recipient
-    :param username: str: Pass the username to the template
-    :param host: str: Pass in the hostname of the server to be used in the email template
-    :return: A coroutine object
+class EmailDispatcher:
+    """
+    Delivers emails from an asyncio queue with a fixed number of workers, each of which
+    keeps its own SMTP connection open between messages instead of connecting per message.
+    A failed delivery is retried with exponential backoff on a fresh connection; an
+    unexpected error fails the message without stopping its worker.
+    The same template sent to the same recipient again within dedup_window seconds is
+    dropped; the window is tracked per process.
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={
-                "host": host,
-                "username": username,
-                "token": token_verification,
-            },
-            subtype=MessageType.html,
+
+    def __init__(
+        self,
+        conf: ConnectionConfig,
+        concurrency: int,
+        queue_size: int,
+        max_attempts: int,
+        retry_delay: float,
+        dedup_window: float,
+    ):
+        self.conf = conf
+        self.templates = conf.template_engine()
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.recent = TTLCache(maxsize=10000, ttl=dedup_window)
+        self.queue: asyncio.Queue | None = None
+        self.workers: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+        self.deduplicated = 0
+
+    def _smtp(self) -> aiosmtplib.SMTP:
+        credentials = {}
+        if self.conf.USE_CREDENTIALS:
+            credentials = {
+                "username": self.conf.MAIL_USERNAME,
+                "password": self.conf.MAIL_PASSWORD.get_secret_value(),
+            }
+        return aiosmtplib.SMTP(
+            hostname=self.conf.MAIL_SERVER,
+            port=self.conf.MAIL_PORT,
+            use_tls=self.conf.MAIL_SSL_TLS,
+            start_tls=self.conf.MAIL_STARTTLS,
+            validate_certs=self.conf.VALIDATE_CERTS,
+            timeout=self.conf.TIMEOUT,
+            **credentials,
         )
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
 
+    def render(
+        self, recipient: str, subject: str, template_name: str, template_body: dict
+    ) -> EmailMessage:
+        """
+        The render method builds an HTML email from one of the templates of conf.
+
+        :param self: Represent the instance of the class
+        :param recipient: str: The email address to send to
+        :param subject: str: The subject of the email
+        :param template_name: str: The template in the TEMPLATE_FOLDER of conf
+        :param template_body: dict: The variables of the template
+        :return: The email message
+        """
+        template = self.templates.get_template(template_name)
+        message = EmailMessage()
+        message["From"] = formataddr((self.conf.MAIL_FROM_NAME, self.conf.MAIL_FROM))
+        message["To"] = recipient
+        message["Subject"] = subject
+        message.set_content(template.render(**template_body), subtype="html")
+        return message
+
+    def start(self) -> None:
+        """
+        The start method starts the workers on the running event loop.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(self.queue_size)
+        self.workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        The stop method waits up to timeout seconds for the queued emails to be sent,
+        then stops the workers and closes their connections.
+
+        :param self: Represent the instance of the class
+        :param timeout: float: Seconds to wait for the queue to drain
+        :return: None
+        """
+        if not self.workers:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%d emails were not sent", self.queue.qsize())
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def enqueue(self, message: EmailMessage, dedup_key: str | None = None) -> bool:
+        """
+        The enqueue method queues a message for delivery, waiting while the queue is full.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message to send
+        :param dedup_key: str | None: Drop the message if this key was queued within the window
+        :return: False if the message was dropped as a duplicate, True otherwise
+        """
+        if self.is_duplicate(dedup_key):
+            return False
+        self.start()
+        await self.queue.put((message, None))
+        return True
+
+    async def send(self, message: EmailMessage, dedup_key: str | None = None) -> bool:
+        """
+        The send method queues a message like enqueue and waits until it is delivered.
 
-async def send_recovery_email(email: EmailStr, username: str, host: str):
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: The message to send
+        :param dedup_key: str | None: Drop the message if this key was queued within the window
+        :return: True if the message was sent or dropped as a duplicate, False if delivery failed
+        :raises Exception: The unexpected error that failed the delivery
+        """
+        if self.is_duplicate(dedup_key):
+            return True
+        self.start()
+        result = asyncio.get_running_loop().create_future()
+        await self.queue.put((message, result))
+        return await result
+
+    def is_duplicate(self, dedup_key: str | None) -> bool:
+        """
+        The is_duplicate method tells if dedup_key was already seen within the window,
+        and remembers it otherwise.
+
+        :param self: Represent the instance of the class
+        :param dedup_key: str | None: The key of the message, None to never drop it
+        :return: True if the message should be dropped
+        """
+        if dedup_key is None:
+            return False
+        if self.recent.get(dedup_key) is not None:
+            self.deduplicated += 1
+            return True
+        self.recent.set(dedup_key, True)
+        return False
+
+    async def _worker(self) -> None:
+        smtp = None
+        try:
+            while True:
+                message, result = await self.queue.get()
+                try:
+                    smtp, sent = await self._deliver(smtp, message)
+                except Exception as e:
+                    logger.exception("Email to %s failed", message["To"])
+                    self.failed += 1
+                    smtp = None
+                    if result is not None and not result.done():
+                        # the traceback was logged; the caller must not hold the worker's frames
+                        result.set_exception(e.with_traceback(None))
+                else:
+                    if result is not None and not result.done():
+                        result.set_result(sent)
+                finally:
+                    self.queue.task_done()
+        finally:
+            if smtp is not None and smtp.is_connected:
+                smtp.close()
+
+    async def _deliver(
+        self, smtp: aiosmtplib.SMTP | None, message: EmailMessage
+    ) -> Tuple[aiosmtplib.SMTP | None, bool]:
+        for attempt in range(self.max_attempts):
+            try:
+                if smtp is None or not smtp.is_connected:
+                    smtp = self._smtp()
+                    await smtp.connect()
+                await smtp.send_message(message)
+                self.sent += 1
+                return smtp, True
+            except (aiosmtplib.SMTPException, OSError) as e:
+                logger.warning("Email to %s failed: %s", message["To"], e)
+                if smtp is not None and smtp.is_connected:
+                    smtp.close()
+                smtp = None
+                if attempt + 1 < self.max_attempts:
+                    await asyncio.sleep(self.retry_delay * 2**attempt)
+            except Exception:
+                # the worker starts over on a new connection
+                if smtp is not None and smtp.is_connected:
+                    smtp.close()
+                raise
+        self.failed += 1
+        return smtp, False
+
+
+dispatcher = EmailDispatcher(
+    conf,
+    concurrency=settings.mail_concurrency,
+    queue_size=settings.mail_queue_size,
+    max_attempts=settings.mail_max_attempts,
+    retry_delay=settings.mail_retry_delay,
+    dedup_window=settings.mail_dedup_window,
+)
+
+
+# subject and template of every kind of email
+TEMPLATES = {
+    "confirm": ("Confirm your email ", "email_template.html"),
+    "recovery": ("Confirm your email ", "email_recovery_template.html"),
+}
+
+
+async def render_email(kind: str, email: str, username: str, host: str) -> EmailMessage:
     """
-    The send_recovery_email function sends an email to the user with a link to reset their password.
-        Args:
-            email (str): The user's email address.
-            username (str): The user's username.
-            host (str): The hostname of the server where this function is being called from.
-
-    :param email: EmailStr: Specify the email address of the user
-    :param username: str: Personalize the email message
+    The render_email function builds an email of the given kind with a fresh email token.
+
+    :param kind: str: A key of TEMPLATES
+    :param email: str: The email address of the user
+    :param username: str: Pass the username to the template
     :param host: str: Pass the host url to the template
-    :return: A coroutine object, which is a special type of object that can be used with asyncio
+    :return: The email message
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={
-                "host": host,
-                "username": username,
-                "token": token_verification,
-            },
-            subtype=MessageType.html,
-        )
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_recovery_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    subject, template_name = TEMPLATES[kind]
+    token_verification = await auth_service.create_email_token({"sub": email})
+    return dispatcher.render(
+        email,
+        subject,
+        template_name,
+        {"host": host, "username": username, "token": token_verification},
+    )
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+CSV_FIELDS = ["id", "title", "description", "done", "created_at", "tags"]
+
+
+async def export_ndjson(
+    notes: AsyncIterator[dict], chunk_size: int = 500
+) -> AsyncIterator[str]:
+    """
+    The export_ndjson function turns a stream of notes into newline-delimited JSON.
+    Lines are sent in chunks of chunk_size notes to keep the number of writes low.
+
+    :param notes: AsyncIterator[dict]: The notes to export
+    :param chunk_size: int: The number of notes per yielded chunk
+    :return: An async iterator of text chunks
+    """
+    lines = []
+    async for note in notes:
+        lines.append(json.dumps(note, default=str) + "\n")
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+async def export_csv(
+    notes: AsyncIterator[dict], chunk_size: int = 500
+) -> AsyncIterator[str]:
+    """
+    The export_csv function turns a stream of notes into CSV with a header row.
+    Tag names are joined with ";" in the tags column.
+
+    :param notes: AsyncIterator[dict]: The notes to export
+    :param chunk_size: int: The number of notes per yielded chunk
+    :return: An async iterator of text chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    rows = 0
+    async for note in notes:
+        writer.writerow({**note, "tags": ";".join(note["tags"])})
+        rows += 1
+        if rows >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    yield buffer.getvalue()
@@ -0,0 +1,108 @@
+import json
+from typing import AsyncIterator, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from src.database.models import User
+from src.repository import notes as repository_notes
+from src.schemas import NoteImport
+
+MAX_LINE_BYTES = 64 * 1024
+
+
+class ProgressStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse whose body iterator reads the request body while the response is sent.
+    StreamingResponse waits for the client disconnect on receive(), which would swallow the
+    request body messages, so here receive() is left to the body iterator alone.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def read_ndjson(
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[Tuple[int, NoteImport | None, str | None]]:
+    """
+    The read_ndjson function parses an NDJSON body into notes as it is received.
+    Only the current line is buffered; blank lines are skipped and lines longer than
+    MAX_LINE_BYTES are rejected without being buffered.
+
+    :param chunks: AsyncIterator[bytes]: The request body
+    :return: An async iterator of (line number, note, error) where either note or error is None
+    """
+    buffer = b""
+    line_number = 0
+    skipping = False
+    async for chunk in chunks:
+        *lines, rest = chunk.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if skipping:
+                skipping = False
+                yield line_number, None, "Line is too long"
+                continue
+            line, buffer = buffer + line, b""
+            if line.strip():
+                yield line_number, *_parse_line(line)
+        if skipping:
+            continue
+        buffer += rest
+        if len(buffer) > MAX_LINE_BYTES:
+            buffer, skipping = b"", True
+    if skipping:
+        yield line_number + 1, None, "Line is too long"
+    elif buffer.strip():
+        yield line_number + 1, *_parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> Tuple[NoteImport | None, str | None]:
+    try:
+        return NoteImport.model_validate(json.loads(line)), None
+    except ValueError as e:
+        if isinstance(e, ValidationError):
+            return None, "; ".join(error["msg"] for error in e.errors())
+        return None, "Invalid JSON"
+
+
+async def import_ndjson(
+    chunks: AsyncIterator[bytes], user: User, db: AsyncSession, batch_size: int
+) -> AsyncIterator[str]:
+    """
+    The import_ndjson function imports the notes of an NDJSON body in batches of batch_size.
+    After every batch it yields an NDJSON progress line with the running total and the lines
+    that were rejected since the previous one, and it ends with a summary line.
+
+    :param chunks: AsyncIterator[bytes]: The request body
+    :param user: User: The user to import the notes for
+    :param db: AsyncSession: The database session
+    :param batch_size: int: The number of notes written per transaction
+    :return: An async iterator of NDJSON progress lines
+    """
+    batch, errors = [], []
+    imported = failed = batches = 0
+
+    def progress(**extra) -> str:
+        return json.dumps({"batch": batches, "imported": imported, "errors": errors, **extra}) + "\n"
+
+    async for line_number, note, error in read_ndjson(chunks):
+        if error is not None:
+            errors.append({"line": line_number, "error": error})
+            failed += 1
+            continue
+        batch.append(note)
+        if len(batch) >= batch_size:
+            imported += await repository_notes.import_notes(batch, user, db)
+            batches += 1
+            yield progress()
+            batch, errors = [], []
+    if batch:
+        imported += await repository_notes.import_notes(batch, user, db)
+        batches += 1
+    yield progress(done=True, failed=failed)
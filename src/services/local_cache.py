@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+    A bounded in-process cache: entries expire ttl seconds after they were set and the
+    least recently used entry is evicted when maxsize is reached.
+    It is not thread-safe; it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        The get method returns the value of key if it is cached and not expired yet.
+
+        :param self: Represent the instance of the class
+        :param key: Hashable: The key to look up
+        :param default: Any: Returned when the key is missing or expired
+        :return: The cached value or default
+        """
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """
+        The set method caches value under key, evicting the least recently used entry if full.
+
+        :param self: Represent the instance of the class
+        :param key: Hashable: The key to cache the value under
+        :param value: Any: The value to cache
+        :param ttl: float | None: Expire after ttl seconds instead of the default of the cache
+        :return: None
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
@@ -0,0 +1,133 @@
+"""
+The email outbox worker.
+
+Signup and recovery emails are written to the email_outbox table in the transaction
+of the request; this worker sends them and purges the finished ones. The web workers
+never send email themselves. Any number of outbox workers can run side by side:
+
+    python -m src.services.outbox
+"""
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.repository import outbox as repository_outbox
+from src.services.email import dispatcher, render_email
+
+logger = logging.getLogger(__name__)
+
+
+async def process_batch(
+    db: AsyncSession,
+    batch_size: int = settings.outbox_batch_size,
+    max_attempts: int = settings.outbox_max_attempts,
+    retry_delay: float = settings.outbox_retry_delay,
+    lease: float = settings.outbox_lease,
+) -> int:
+    """
+    The process_batch function claims a batch of due emails, sends them concurrently through
+    the dispatcher and records the outcome. The claim is committed before anything is sent,
+    so no rows stay locked while the SMTP server is slow; an email whose outcome could not
+    be recorded is sent again once its lease runs out. An email that cannot be rendered
+    fails on its own, without the rest of the batch.
+
+    :param db: AsyncSession: The database session
+    :param batch_size: int: The maximum number of emails to send
+    :param max_attempts: int: Give up on an email after this many attempts
+    :param retry_delay: float: Seconds to wait after the first failure of an email
+    :param lease: float: Seconds before a claimed email that was not recorded is due again
+    :return: The number of emails claimed
+    """
+    emails = await repository_outbox.claim_emails(batch_size, max_attempts, lease, db)
+    await db.commit()
+    if not emails:
+        return 0
+    # the same email queued twice in a batch is sent once
+    unique = {}
+    for email in emails:
+        unique.setdefault((email.kind, email.recipient), []).append(email)
+    sent, failed = [], []
+    rendered, messages = [], []
+    for (kind, recipient), same in unique.items():
+        try:
+            message = await render_email(kind, recipient, same[0].username, same[0].host)
+        except Exception:
+            logger.exception("Could not render the %s email to %s", kind, recipient)
+            failed.extend(same)
+            continue
+        rendered.append(same)
+        messages.append(message)
+    results = await asyncio.gather(
+        *(dispatcher.send(message) for message in messages), return_exceptions=True
+    )
+    for same, ok in zip(rendered, results):
+        # an exception means the email failed too
+        (sent if ok is True else failed).extend(same)
+    await repository_outbox.mark_sent([email.id for email in sent], db)
+    repository_outbox.mark_failed(failed, retry_delay, db)
+    await db.commit()
+    return len(emails)
+
+
+async def purge(
+    max_attempts: int = settings.outbox_max_attempts,
+    retention: float = settings.outbox_retention,
+) -> int:
+    """
+    The purge function deletes the emails that were sent or given up on more than
+    retention seconds ago.
+
+    :param max_attempts: int: Emails attempted this many times are not sent anymore
+    :param retention: float: Seconds to keep finished emails for
+    :return: The number of deleted emails
+    """
+    async with SessionLocal() as db:
+        purged = await repository_outbox.purge_emails(max_attempts, retention, db)
+        await db.commit()
+    return purged
+
+
+async def run(
+    poll_interval: float = settings.outbox_poll_interval,
+    purge_interval: float = settings.outbox_purge_interval,
+) -> None:
+    """
+    The run function drains the outbox until it is cancelled, waiting poll_interval
+    seconds whenever there is nothing to send, and purges it every purge_interval seconds.
+    It is the only place where the dispatcher runs. An error, e.g. a lost database
+    connection, is logged and the worker carries on after poll_interval seconds; the
+    emails of a batch that failed are claimed again once their lease runs out.
+
+    :param poll_interval: float: Seconds to wait when the outbox is empty
+    :param purge_interval: float: Seconds between two purges of finished emails
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    purged_at = None
+    dispatcher.start()
+    try:
+        while True:
+            if purged_at is None or loop.time() - purged_at >= purge_interval:
+                # a failed purge is tried again at the next interval
+                purged_at = loop.time()
+                try:
+                    await purge()
+                except Exception:
+                    logger.exception("Could not purge the outbox")
+            try:
+                async with SessionLocal() as db:
+                    claimed = await process_batch(db)
+            except Exception:
+                logger.exception("Could not process the outbox")
+                claimed = 0
+            if not claimed:
+                await asyncio.sleep(poll_interval)
+    finally:
+        await dispatcher.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
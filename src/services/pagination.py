@@ -0,0 +1,92 @@
+import base64
+import json
+from typing import Any, Callable, Sequence, Tuple
+
+from fastapi import HTTPException, Request, Response, status
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    The encode_cursor function turns the id of the last item on a page into an opaque cursor.
+
+    :param last_id: int: The id of the last item returned
+    :return: An url-safe cursor string
+    """
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    The decode_cursor function returns the id encoded in a cursor made by encode_cursor.
+    It raises an HTTPException with status code 400 if the cursor is malformed.
+
+    :param cursor: str: The cursor received from the client
+    :return: The id after which the next page starts
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def encode_rank_cursor(rank: float, last_id: int) -> str:
+    """
+    The encode_rank_cursor function makes an opaque cursor for results ordered by rank and id.
+
+    :param rank: float: The rank of the last item returned
+    :param last_id: int: The id of the last item returned
+    :return: An url-safe cursor string
+    """
+    payload = json.dumps([rank, last_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    The decode_rank_cursor function returns the rank and id encoded by encode_rank_cursor.
+    It raises an HTTPException with status code 400 if the cursor is malformed.
+
+    :param cursor: str: The cursor received from the client
+    :return: The rank and the id after which the next page starts
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(rank), int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+def set_next_cursor(
+    request: Request,
+    response: Response,
+    items: Sequence,
+    limit: int,
+    encode: Callable[[Any], str] = lambda item: encode_cursor(item.id),
+) -> str | None:
+    """
+    The set_next_cursor function adds the cursor of the next page to the response.
+    The cursor is sent in the X-Next-Cursor header and as a Link header with rel="next".
+    A page shorter than limit is the last one, so no cursor is set for it.
+
+    :param request: Request: The current request, used to build the next page url
+    :param response: Response: The response to add the headers to
+    :param items: Sequence: The items of the current page, in cursor order
+    :param limit: int: The page size that was requested
+    :param encode: Callable: Build the cursor from the last item, by default from its id
+    :return: The next cursor, or None if this is the last page
+    """
+    if not items or len(items) < limit:
+        return None
+    next_cursor = encode(items[-1])
+    next_url = request.url.remove_query_params("skip").include_query_params(
+        cursor=next_cursor
+    )
+    response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return next_cursor
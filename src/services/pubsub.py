@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+POLL_TIMEOUT = 1.0
+
+
+async def listen_forever(
+    r,
+    channel: str,
+    on_message: Callable[[str], None],
+    on_subscribe: Callable[[], Awaitable[None]],
+    retry_delay: float = 1.0,
+) -> None:
+    """
+    The listen_forever function calls on_message with every message published on channel.
+    It runs until cancelled and subscribes again when the connection is lost. on_subscribe
+    runs after every subscription, to resynchronize whatever messages may have been missed.
+
+    :param r: The Redis client
+    :param channel: str: The channel to subscribe to
+    :param on_message: Callable[[str], None]: Called with the decoded data of every message
+    :param on_subscribe: Callable[[], Awaitable[None]]: Called once subscribed
+    :param retry_delay: float: Seconds to wait before subscribing again
+    :return: None
+    """
+    while True:
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(channel)
+            await on_subscribe()
+            while True:
+                # a read with its own timeout, so the socket timeout of the pool does not
+                # drop an idle subscription; it also sends the periodic health checks
+                message = await pubsub.get_message(timeout=POLL_TIMEOUT)
+                if message is None:
+                    continue
+                data = message["data"]
+                on_message(data.decode() if isinstance(data, bytes) else data)
+        except (RedisError, OSError) as e:
+            print(e)
+        finally:
+            await pubsub.reset()
+        await asyncio.sleep(retry_delay)
@@ -0,0 +1,332 @@
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, List, Tuple
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi_limiter import FastAPILimiter
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.db import get_db
+from src.services.auth import Auth, auth_service
+from src.services.user_cache import UserSnapshot
+
+
+async def user_identifier(request: Request) -> str:
+    """
+    The user_identifier function names the bucket of a request: the user of a valid bearer
+    access token, or else the client address, and the path. The token is decoded through
+    the token cache of auth_service, so this costs no signature check for a known token.
+
+    :param request: Request: The request to limit
+    :return: The bucket key
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    payload = None
+    if scheme.lower() == "bearer" and token:
+        payload = auth_service.decode_access_token(token)
+    if payload is not None:
+        identity = f"user:{payload['sub']}"
+    else:
+        forwarded = request.headers.get("x-forwarded-for")
+        identity = f"ip:{forwarded.split(',')[0].strip() if forwarded else request.client.host}"
+    return f"{identity}:{request.scope['path']}"
+
+
+class Bucket:
+    __slots__ = ("tokens", "updated_at", "pending", "total")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+        # requests not yet reported to Redis
+        self.pending = 0
+        # the shared counter of the bucket at the last reconciliation
+        self.total: int | None = None
+
+
+class TokenBucketLimiter:
+    """
+    A rate limiting dependency that keeps a token bucket per user and path in the worker,
+    so checking a request needs no Redis round trip. A bucket holds up to times tokens and
+    refills at times / seconds tokens per second; every request takes one token.
+    A RateLimitReconciler adds the requests of every worker to a shared counter per bucket in
+    Redis, in one pipeline per interval, and takes the requests the other workers let through
+    since the last reconciliation out of the local bucket. The limit is therefore enforced
+    across workers up to what they let through in one interval; if Redis is down, every
+    worker applies it on its own.
+    """
+
+    def __init__(
+        self,
+        times: int,
+        seconds: float,
+        identifier: Callable[[Request], Awaitable[str]] | None = None,
+        reconciler: "RateLimitReconciler | None" = None,
+        prefix: str = "ratelimit",
+    ):
+        self.capacity = times
+        self.rate = times / seconds
+        self.seconds = seconds
+        self.identifier = identifier or user_identifier
+        self.prefix = f"{prefix}:{times}/{seconds}"
+        self.buckets: dict[str, Bucket] = {}
+        (reconciler or rate_limit_reconciler).register(self)
+
+    def _refill(self, bucket: Bucket, now: float) -> None:
+        bucket.tokens = min(
+            self.capacity, bucket.tokens + (now - bucket.updated_at) * self.rate
+        )
+        bucket.updated_at = now
+
+    def acquire(self, key: str, now: float | None = None) -> float:
+        """
+        The acquire method takes a token from the bucket of key if there is one.
+
+        :param self: Represent the instance of the class
+        :param key: str: The bucket key
+        :param now: float | None: The time.monotonic() of the request
+        :return: 0 if the request may proceed, otherwise the seconds until the next token
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(self.capacity, now)
+        else:
+            self._refill(bucket, now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.pending += 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+    async def __call__(self, request: Request, response: Response):
+        wait = self.acquire(await self.identifier(request))
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too Many Requests",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    def report(self, pipe) -> List[Tuple[str, int]]:
+        """
+        The report method queues the requests of every bucket since the last reconciliation
+        on a Redis pipeline.
+
+        :param self: Represent the instance of the class
+        :param pipe: The pipeline
+        :return: The reported buckets with their request counts, for reconcile or restore
+        """
+        reported = []
+        for key, bucket in self.buckets.items():
+            redis_key = f"{self.prefix}:{key}"
+            pipe.incrby(redis_key, bucket.pending)
+            pipe.expire(redis_key, math.ceil(self.seconds))
+            reported.append((key, bucket.pending))
+            bucket.pending = 0
+        return reported
+
+    def reconcile(self, reported: List[Tuple[str, int]], totals: List[int]) -> None:
+        """
+        The reconcile method takes the requests other workers let through out of the buckets,
+        given the shared counters returned by the pipeline of report, and drops the buckets
+        that are full and idle.
+
+        :param self: Represent the instance of the class
+        :param reported: List[Tuple[str, int]]: The result of report
+        :param totals: List[int]: The shared counters of the reported buckets
+        :return: None
+        """
+        now = time.monotonic()
+        for (key, sent), total in zip(reported, totals):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            others = 0
+            if bucket.total is not None:
+                # a counter that expired meanwhile started again from our own requests
+                others = max(total - bucket.total - sent, 0)
+            bucket.total = total
+            self._refill(bucket, now)
+            bucket.tokens = max(bucket.tokens - others, 0)
+            if bucket.tokens >= self.capacity and not bucket.pending and not others:
+                del self.buckets[key]
+
+    def restore(self, reported: List[Tuple[str, int]]) -> None:
+        """
+        The restore method puts back the request counts of a report that could not be sent,
+        so that they are reported next time.
+
+        :param self: Represent the instance of the class
+        :param reported: List[Tuple[str, int]]: The result of report
+        :return: None
+        """
+        for key, sent in reported:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.pending += sent
+
+
+class RateLimitReconciler:
+    """
+    Reconciles the buckets of every TokenBucketLimiter of the worker with Redis,
+    in a single pipeline every interval seconds.
+    """
+
+    def __init__(self, r, interval: float):
+        self.r = r
+        self.interval = interval
+        self.limiters: list[TokenBucketLimiter] = []
+
+    def register(self, limiter: TokenBucketLimiter) -> None:
+        self.limiters.append(limiter)
+
+    async def sync(self) -> None:
+        """
+        The sync method reconciles all the buckets once.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        async with self.r.pipeline(transaction=False) as pipe:
+            reports = [(limiter, limiter.report(pipe)) for limiter in self.limiters]
+            if not any(reported for _, reported in reports):
+                return
+            try:
+                results = await pipe.execute()
+            except (RedisError, OSError) as e:
+                print(e)
+                for limiter, reported in reports:
+                    limiter.restore(reported)
+                return
+        # every bucket queued INCRBY and EXPIRE
+        totals = iter(results[::2])
+        for limiter, reported in reports:
+            limiter.reconcile(reported, [int(next(totals)) for _ in reported])
+
+    async def run(self) -> None:
+        """
+        The run method reconciles the buckets every interval seconds until it is cancelled.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sync()
+
+
+rate_limit_reconciler = RateLimitReconciler(Auth.r, settings.rate_limit_sync_interval)
+
+
+# fastapi_limiter's fixed window counter on KEYS[1], and the cached user at KEYS[2] if given
+LIMIT_AND_GET_USER = """
+local pexpire = 0
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current > 0 then
+    if current + 1 > tonumber(ARGV[1]) then
+        pexpire = redis.call('PTTL', KEYS[1])
+    else
+        redis.call('INCR', KEYS[1])
+    end
+else
+    redis.call('SET', KEYS[1], 1, 'PX', ARGV[2])
+end
+local user = ''
+if KEYS[2] then
+    user = redis.call('GET', KEYS[2]) or ''
+end
+return {pexpire, user}
+"""
+
+
+class RateLimitedUser:
+    """
+    A dependency for routes that are rate limited in Redis and need the current user.
+    It behaves like RateLimiter per user followed by auth_service.get_current_user, but the
+    limit check also fetches the user from the Redis tier of the user cache, in one
+    script, into the local tier; the user is then found there by the auth service, so an
+    authenticated, rate limited request makes a single round trip to Redis.
+    If Redis is down the request is not limited.
+    """
+
+    def __init__(self, times: int, seconds: int):
+        self.times = times
+        self.milliseconds = seconds * 1000
+        self._script = None
+
+    def _limit_key(self, email: str, path: str) -> str:
+        return f"{FastAPILimiter.prefix or 'fastapi-limiter'}:user:{email}:{path}"
+
+    async def limit(self, email: str, path: str) -> None:
+        """
+        The limit method counts a request of the user against the limit of the path and
+        caches the user in this process if it is cached in Redis.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :param path: str: The path of the request
+        :return: None
+        """
+        cache = auth_service.user_cache
+        keys = [self._limit_key(email, path)]
+        fetch_user = cache.local.get(email) is None
+        if fetch_user:
+            keys.append(cache.key(email))
+        if self._script is None or self._script.registered_client is not cache.r:
+            self._script = cache.r.register_script(LIMIT_AND_GET_USER)
+        try:
+            pexpire, data = await self._script(keys=keys, args=[self.times, self.milliseconds])
+        except (RedisError, OSError) as e:
+            print(e)
+            return
+        if pexpire:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too Many Requests",
+                headers={"Retry-After": str(math.ceil(pexpire / 1000))},
+            )
+        if fetch_user and data:
+            cache.local.set(email, UserSnapshot.loads(data))
+
+    async def __call__(
+        self,
+        request: Request,
+        token: str = Depends(Auth.oauth2_scheme),
+        db: AsyncSession = Depends(get_db),
+    ):
+        payload = auth_service.decode_access_token(token)
+        if payload is not None:
+            await self.limit(payload["sub"], request.scope["path"])
+        # an invalid token is rejected here
+        # the user is read from the primary, since a miss fills the shared user cache
+        return await auth_service.get_current_user(token, db)
+
+
+def rate_limited_user(times: int, seconds: int, backend: str | None = None):
+    """
+    The rate_limited_user function returns a dependency that rate limits a route and
+    returns the current user.
+
+    :param times: int: The number of requests allowed
+    :param seconds: int: Per this many seconds
+    :param backend: str | None: "redis" for RateLimitedUser, "local" for TokenBucketLimiter
+        followed by auth_service.get_current_user; settings.rate_limit_backend by default
+    :return: The dependency
+    """
+    if (backend or settings.rate_limit_backend) == "redis":
+        return RateLimitedUser(times, seconds)
+    limiter = TokenBucketLimiter(times, seconds)
+
+    async def limited_user(
+        request: Request,
+        response: Response,
+        current_user=Depends(auth_service.get_current_user),
+    ):
+        await limiter(request, response)
+        return current_user
+
+    return limited_user
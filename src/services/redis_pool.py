@@ -0,0 +1,56 @@
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+
+
+def create_redis() -> redis.Redis:
+    """
+    The create_redis function creates a Redis client on a connection pool with the settings
+    from the config. Commands wait up to redis_pool_timeout seconds for a free connection
+    instead of failing when all of them are in use, time out after redis_socket_timeout
+    seconds, and a connection that was idle for redis_health_check_interval seconds is
+    checked with a PING before it is used again.
+
+    :return: A Redis client
+    """
+    pool = redis.BlockingConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        password=settings.redis_password,
+        db=0,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=settings.redis_socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+        retry_on_timeout=True,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+# the one Redis client of the worker, shared by the caches, the token stores and the limiters
+r = create_redis()
+
+
+async def open_redis() -> None:
+    """
+    The open_redis function checks at startup that Redis can be reached. The app still starts
+    if it cannot, since everything that uses Redis falls back to the database or to the worker.
+
+    :return: None
+    """
+    try:
+        await r.ping()
+    except (RedisError, OSError) as e:
+        print(f"Redis is not available: {e}")
+
+
+async def close_redis() -> None:
+    """
+    The close_redis function closes every connection of the pool at shutdown.
+
+    :return: None
+    """
+    await r.close()
+    await r.connection_pool.disconnect()
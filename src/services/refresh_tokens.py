@@ -0,0 +1,129 @@
+import uuid
+from typing import Tuple
+
+
+# claims the presented token and stores its successor in one step: returns -1 if the token
+# is not the current one of the family, 0 if the family is gone, 1 once rotated
+ROTATE = """
+if redis.call('GETDEL', KEYS[1]) ~= ARGV[1] then
+    return -1
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+redis.call('SET', KEYS[3], ARGV[1], 'EX', ARGV[3])
+redis.call('SADD', KEYS[4], ARGV[1])
+redis.call('EXPIRE', KEYS[4], ARGV[3])
+return 1
+"""
+
+
+class RefreshTokenStore:
+    """
+    Keeps the state of refresh tokens in Redis instead of the users table.
+    Every login starts a rotation family, one per device. The family key holds the id (jti)
+    of the only refresh token of the family that may still be used, and a token key
+    maps that jti back to the family. Refreshing claims the token key with GETDEL,
+    so a token can be rotated exactly once. A token that is presented again while
+    its family is alive has been reused, possibly stolen, and the whole family is revoked.
+    Both keys expire with the refresh token lifetime, which is renewed on every rotation.
+    The families of a user are also listed in a set, so that they can all be revoked at once;
+    the set expires with the last family that was issued or rotated.
+    """
+
+    def __init__(self, r, ttl: int, prefix: str = "refresh"):
+        self.r = r
+        self.ttl = ttl
+        self.prefix = prefix
+        self._rotate = None
+
+    def family_key(self, family: str) -> str:
+        return f"{self.prefix}:family:{family}"
+
+    def token_key(self, jti: str) -> str:
+        return f"{self.prefix}:token:{jti}"
+
+    def user_key(self, email: str) -> str:
+        return f"{self.prefix}:user:{email}"
+
+    async def _store(self, family: str, jti: str, email: str) -> None:
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.setex(self.family_key(family), self.ttl, jti)
+            pipe.setex(self.token_key(jti), self.ttl, family)
+            pipe.sadd(self.user_key(email), family)
+            pipe.expire(self.user_key(email), self.ttl)
+            await pipe.execute()
+
+    async def issue(self, email: str) -> Tuple[str, str]:
+        """
+        The issue method starts a new rotation family.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user that logged in
+        :return: The family id and the jti of its first refresh token
+        """
+        family, jti = uuid.uuid4().hex, uuid.uuid4().hex
+        await self._store(family, jti, email)
+        return family, jti
+
+    async def rotate(self, family: str, jti: str, email: str) -> str | None:
+        """
+        The rotate method exchanges the current refresh token of a family for a new one.
+        The token is claimed and its successor stored by one script, so a family revoked
+        in the meantime is not brought back. If jti is not the current token of the family,
+        the family is revoked.
+
+        :param self: Represent the instance of the class
+        :param family: str: The family id of the presented token
+        :param jti: str: The jti of the presented token
+        :param email: str: The email of the user, whose set of families is renewed
+        :return: The jti of the new refresh token, or None if the token was reused or expired
+        """
+        if self._rotate is None or self._rotate.registered_client is not self.r:
+            self._rotate = self.r.register_script(ROTATE)
+        new_jti = uuid.uuid4().hex
+        keys = [
+            self.token_key(jti),
+            self.family_key(family),
+            self.token_key(new_jti),
+            self.user_key(email),
+        ]
+        rotated = await self._rotate(keys=keys, args=[family, new_jti, self.ttl])
+        if rotated < 0:
+            await self.revoke(family, email)
+        if rotated <= 0:
+            return None
+        return new_jti
+
+    async def revoke(self, family: str, email: str | None = None) -> None:
+        """
+        The revoke method ends a rotation family, so none of its tokens can be used anymore.
+
+        :param self: Represent the instance of the class
+        :param family: str: The family id
+        :param email: str | None: The email of the user, to remove the family from its set
+        :return: None
+        """
+        current = await self.r.getdel(self.family_key(family))
+        async with self.r.pipeline(transaction=False) as pipe:
+            if current is not None:
+                if isinstance(current, bytes):
+                    current = current.decode()
+                pipe.delete(self.token_key(current))
+            if email is not None:
+                pipe.srem(self.user_key(email), family)
+            await pipe.execute()
+
+    async def revoke_user(self, email: str) -> None:
+        """
+        The revoke_user method ends every rotation family of a user.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: None
+        """
+        families = await self.r.smembers(self.user_key(email))
+        for family in families:
+            await self.revoke(family.decode() if isinstance(family, bytes) else family)
+        await self.r.delete(self.user_key(email))
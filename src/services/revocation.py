@@ -0,0 +1,99 @@
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from src.services.pubsub import listen_forever
+
+REVOKED_CHANNEL = "tokens:revoked"
+
+logger = logging.getLogger(__name__)
+
+
+class RevokedTokens:
+    """
+    The ids (jti) of revoked access tokens, mirrored in every worker so that checking a
+    token needs no network round trip.
+    Redis keeps them in a sorted set scored by the expiry of the token; a revocation is
+    added there and published on REVOKED_CHANNEL, and each worker applies the messages
+    to its in-memory copy and reloads the whole set whenever it (re)subscribes.
+    Entries are dropped once their token would have expired anyway.
+    """
+
+    def __init__(self, r, key: str = "revoked_tokens"):
+        self.r = r
+        self.key = key
+        self.local: dict[str, float] = {}
+        self._added = 0
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def is_revoked(self, jti: str | None) -> bool:
+        """
+        The is_revoked method tells if the token with the given jti was revoked, from memory only.
+
+        :param self: Represent the instance of the class
+        :param jti: str | None: The id of the token
+        :return: True if the token was revoked
+        """
+        return jti is not None and jti in self.local
+
+    def _add(self, jti: str, exp: float) -> None:
+        now = time.time()
+        if exp > now:
+            self.local[jti] = exp
+        self._added += 1
+        if self._added % 1024 == 0:
+            self.prune(now)
+
+    def prune(self, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        self.local = {jti: exp for jti, exp in self.local.items() if exp > now}
+
+    async def revoke(self, jti: str, exp: float) -> None:
+        """
+        The revoke method revokes a token until its expiry, in this worker and in all the others.
+        If Redis cannot be reached the token stays revoked in this worker only.
+
+        :param self: Represent the instance of the class
+        :param jti: str: The id of the token
+        :param exp: float: The expiry of the token, as a unix timestamp
+        :return: None
+        """
+        self._add(jti, exp)
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.zadd(self.key, {jti: exp})
+                pipe.zremrangebyscore(self.key, "-inf", time.time())
+                pipe.publish(REVOKED_CHANNEL, f"{jti} {exp}")
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            logger.error("Token %s was only revoked in this worker: %s", jti, e)
+
+    async def load(self) -> None:
+        """
+        The load method replaces the in-memory copy with the revocations stored in Redis.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        now = time.time()
+        entries = await self.r.zrangebyscore(self.key, now, "+inf", withscores=True)
+        self.local = {
+            (jti.decode() if isinstance(jti, bytes) else jti): exp for jti, exp in entries
+        }
+
+    def _on_message(self, data: str) -> None:
+        jti, exp = data.split(" ")
+        self._add(jti, float(exp))
+
+    async def listen(self, retry_delay: float = 1.0) -> None:
+        """
+        The listen method keeps the in-memory copy up to date until it is cancelled.
+
+        :param self: Represent the instance of the class
+        :param retry_delay: float: Seconds to wait before subscribing again
+        :return: None
+        """
+        await listen_forever(self.r, REVOKED_CHANNEL, self._on_message, self.load, retry_delay)
@@ -0,0 +1,149 @@
+import json
+import logging
+from datetime import datetime
+
+from redis.exceptions import RedisError
+
+from src.database.models import User
+from src.services.local_cache import TTLCache
+from src.services.pubsub import listen_forever
+
+INVALIDATE_CHANNEL = "users:invalidate"
+
+logger = logging.getLogger(__name__)
+
+
+class UserSnapshot:
+    """
+    The authenticated user as the endpoints see it: the columns of User they read, without
+    the password hash, the refresh token or any SQLAlchemy state.
+    It is serialized explicitly to a small JSON array rather than pickled.
+    """
+
+    __slots__ = ("id", "username", "email", "avatar", "confirmed", "created_at")
+
+    def __init__(
+        self,
+        id: int,
+        username: str | None,
+        email: str,
+        avatar: str | None,
+        confirmed: bool,
+        created_at: datetime | None,
+    ):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.avatar = avatar
+        self.confirmed = confirmed
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(
+            user.id,
+            user.username,
+            user.email,
+            user.avatar,
+            bool(user.confirmed),
+            user.created_at,
+        )
+
+    def dumps(self) -> bytes:
+        created_at = self.created_at.isoformat() if self.created_at else None
+        return json.dumps(
+            [self.id, self.username, self.email, self.avatar, self.confirmed, created_at]
+        ).encode()
+
+    @classmethod
+    def loads(cls, data: bytes) -> "UserSnapshot":
+        id, username, email, avatar, confirmed, created_at = json.loads(data)
+        if created_at is not None:
+            created_at = datetime.fromisoformat(created_at)
+        return cls(id, username, email, avatar, confirmed, created_at)
+
+
+class UserCache:
+    """
+    Caches UserSnapshot objects by email in two tiers: a small in-process TTL/LRU cache in
+    front of Redis. A change to a user is published on INVALIDATE_CHANNEL so every worker
+    drops its local copy; the short local ttl bounds staleness if a message is missed.
+    Redis errors are not fatal: the user is then read from the database.
+    """
+
+    def __init__(self, r, ttl: int, local_ttl: float, local_size: int, prefix: str = "user"):
+        self.r = r
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = TTLCache(local_size, local_ttl)
+
+    def key(self, email: str) -> str:
+        return f"{self.prefix}:{email}"
+
+    async def get(self, email: str) -> UserSnapshot | None:
+        """
+        The get method returns the cached snapshot of the user with the given email,
+        from this process if possible and from Redis otherwise.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: The snapshot, or None if the user is not cached
+        """
+        user = self.local.get(email)
+        if user is not None:
+            return user
+        try:
+            data = await self.r.get(self.key(email))
+        except (RedisError, OSError) as e:
+            logger.warning("Could not read user %s from Redis: %s", email, e)
+            return None
+        if data is None:
+            return None
+        user = UserSnapshot.loads(data)
+        self.local.set(email, user)
+        return user
+
+    async def set(self, user: UserSnapshot) -> None:
+        """
+        The set method caches the snapshot in this process and in Redis with one SETEX.
+
+        :param self: Represent the instance of the class
+        :param user: UserSnapshot: The user to cache
+        :return: None
+        """
+        self.local.set(user.email, user)
+        try:
+            await self.r.setex(self.key(user.email), self.ttl, user.dumps())
+        except (RedisError, OSError) as e:
+            logger.warning("Could not cache user %s in Redis: %s", user.email, e)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate method removes the user from Redis and from the local cache of every worker.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user that changed
+        :return: None
+        """
+        self.local.pop(email)
+        try:
+            await self.r.delete(self.key(email))
+            await self.r.publish(INVALIDATE_CHANNEL, email)
+        except (RedisError, OSError) as e:
+            logger.warning("Could not invalidate user %s in Redis: %s", email, e)
+
+    async def listen(self, retry_delay: float = 1.0) -> None:
+        """
+        The listen method evicts the users published on INVALIDATE_CHANNEL from the local cache.
+        It runs until cancelled and subscribes again when the connection is lost; the local
+        cache is cleared then, since messages may have been missed in between.
+
+        :param self: Represent the instance of the class
+        :param retry_delay: float: Seconds to wait before subscribing again
+        :return: None
+        """
+
+        async def clear():
+            self.local.clear()
+
+        await listen_forever(self.r, INVALIDATE_CHANNEL, self.local.pop, clear, retry_delay)
@@ -1,19 +1,202 @@
+from contextlib import contextmanager
+from unittest.mock import patch
+
 import pytest
+from fastapi import Depends, Request, Response
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from fastapi_limiter.depends import RateLimiter
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from main import app
-from src.database.models import Base
-from src.database.db import get_db
+from src.database.models import Base, User
+from src.database.db import get_db, get_read_db
+from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.refresh_tokens import ROTATE
+from src.services.rate_limit import RateLimitedUser, TokenBucketLimiter
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient runs every request on its own event loop, so async connections are
+# not pooled between requests.
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+# ON DELETE CASCADE needs foreign keys, which SQLite leaves off by default
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+class FakeRedis:
+    # The few Redis commands the app uses, kept in a dict; values come back as bytes
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    @staticmethod
+    def _encode(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = self._encode(value)
+        return True
+
+    async def setex(self, key, ttl, value):
+        self.data[key] = self._encode(value)
+        self.ttls[key] = int(ttl)
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def incrby(self, key, amount):
+        value = int(self.data.get(key, 0)) + amount
+        self.data[key] = self._encode(value)
+        return value
+
+    async def getdel(self, key):
+        return self.data.pop(key, None)
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def publish(self, channel, message):
+        return 0
+
+    async def expire(self, key, ttl):
+        if key not in self.data:
+            return False
+        self.ttls[key] = int(ttl)
+        return True
+
+    async def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(self._encode(member) for member in members)
+
+    async def srem(self, key, *members):
+        self.data.get(key, set()).difference_update(self._encode(member) for member in members)
+
+    async def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(
+            (self._encode(member), float(score)) for member, score in mapping.items()
+        )
+
+    async def zremrangebyscore(self, key, low, high):
+        zset = self.data.get(key, {})
+        low, high = float(low), float(high)
+        for member in [m for m, score in zset.items() if low <= score <= high]:
+            del zset[member]
+
+    async def zrangebyscore(self, key, low, high, withscores=False):
+        low, high = float(low), float(high)
+        items = sorted(
+            (score, member) for member, score in self.data.get(key, {}).items()
+            if low <= score <= high
+        )
+        if withscores:
+            return [(member, score) for score, member in items]
+        return [member for _, member in items]
+
+    def register_script(self, script):
+        return FakeScript(self, SCRIPTS[script])
+
+
+async def rotate_refresh_token(redis, keys, args):
+    # ROTATE of src.services.refresh_tokens
+    token, family, new_token, user = keys
+    family_id, new_jti, ttl = args
+    if await redis.getdel(token) != redis._encode(family_id):
+        return -1
+    if family not in redis.data:
+        return 0
+    await redis.setex(family, ttl, new_jti)
+    await redis.setex(new_token, ttl, family_id)
+    await redis.sadd(user, family_id)
+    await redis.expire(user, ttl)
+    return 1
+
+
+SCRIPTS = {ROTATE: rotate_refresh_token}
+
+
+class FakeScript:
+    # A script of SCRIPTS, run in Python against the FakeRedis that registered it
+
+    def __init__(self, redis, run):
+        self.registered_client = redis
+        self.run = run
+
+    async def __call__(self, keys=(), args=()):
+        return await self.run(self.registered_client, list(keys), list(args))
+
+
+class FakePipeline:
+    # Queues commands and runs them on execute, like redis.asyncio pipelines
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append(getattr(self.redis, name)(*args, **kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        return [await command for command in commands]
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    # There is no Redis server in the tests
+    fake = FakeRedis()
+    auth_service.user_cache.local.clear()
+    auth_service.revoked_tokens.local.clear()
+    with patch.object(response_cache, "r", fake), patch.object(
+        auth_service.user_cache, "r", fake
+    ), patch.object(auth_service.refresh_tokens, "r", fake), patch.object(
+        auth_service.revoked_tokens, "r", fake
+    ):
+        yield fake
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -33,13 +216,12 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
 
     yield TestClient(app)
 
@@ -51,3 +233,71 @@ def user():
         "email": "deadpool@example.com",
         "password": "123456789",
     }
+
+
+@pytest.fixture(scope="module")
+def current_user(session):
+    user = User(
+        username="wolverine",
+        email="wolverine@example.com",
+        password="secret",
+        confirmed=True,
+    )
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    session.expunge(user)
+    return user
+
+
+async def no_rate_limit(self, request: Request, response: Response):
+    # Replaces the __call__ of the rate limiters
+    return None
+
+
+async def no_rate_limit_user(
+    self, request: Request, current_user=Depends(auth_service.get_current_user)
+):
+    # Replaces RateLimitedUser.__call__; the user comes from the overridden dependency
+    return current_user
+
+
+@pytest.fixture(scope="module")
+def auth_client(client, current_user):
+    # Authenticate every request as current_user, without Redis
+
+    async def override_get_current_user():
+        return current_user
+
+    app.dependency_overrides[auth_service.get_current_user] = override_get_current_user
+    app.dependency_overrides[
+        auth_service.get_current_user_readonly
+    ] = override_get_current_user
+    with patch.object(RateLimiter, "__call__", no_rate_limit), patch.object(
+        TokenBucketLimiter, "__call__", no_rate_limit
+    ), patch.object(RateLimitedUser, "__call__", no_rate_limit_user):
+        yield client
+    app.dependency_overrides.pop(auth_service.get_current_user)
+    app.dependency_overrides.pop(auth_service.get_current_user_readonly)
+
+
+@pytest.fixture
+def count_queries():
+    # Collects the SQL statements the app runs inside the with block
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(
+                async_engine.sync_engine, "before_cursor_execute", before_cursor_execute
+            )
+
+    return counter
@@ -0,0 +1,125 @@
+import socket
+import unittest
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig
+
+from src.services.email import EmailDispatcher
+
+
+class Handler:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.messages = []
+        self.peers = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.failures:
+            self.failures -= 1
+            return "451 Try again later"
+        self.messages.append(envelope)
+        self.peers.add(session.peer)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestEmailDispatcher(unittest.IsolatedAsyncioTestCase):
+    """
+    Sends through an aiosmtpd server running on localhost.
+    """
+
+    def start_server(self, handler: Handler) -> EmailDispatcher:
+        port = free_port()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        conf = ConnectionConfig(
+            MAIL_USERNAME="",
+            MAIL_PASSWORD="",
+            MAIL_FROM="noreply@example.com",
+            MAIL_PORT=port,
+            MAIL_SERVER="127.0.0.1",
+            MAIL_STARTTLS=False,
+            MAIL_SSL_TLS=False,
+            USE_CREDENTIALS=False,
+            VALIDATE_CERTS=False,
+            TEMPLATE_FOLDER=Path(__file__).parent.parent / "src" / "services" / "templates",
+        )
+        return EmailDispatcher(
+            conf, concurrency=2, queue_size=10, max_attempts=3, retry_delay=0.01, dedup_window=60
+        )
+
+    def message(self, dispatcher: EmailDispatcher, recipient: str):
+        return dispatcher.render(
+            recipient,
+            "Confirm your email",
+            "email_template.html",
+            {"host": "http://test/", "username": "test", "token": "token"},
+        )
+
+    async def test_connections_are_reused(self):
+        handler = Handler()
+        dispatcher = self.start_server(handler)
+        for i in range(10):
+            await dispatcher.enqueue(self.message(dispatcher, f"user{i}@example.com"))
+        await dispatcher.stop()
+        self.assertEqual(len(handler.messages), 10)
+        self.assertLessEqual(len(handler.peers), 2)
+        self.assertEqual(dispatcher.sent, 10)
+        self.assertIn(b"http://test/api/auth/confirmed_email/token", handler.messages[0].content)
+
+    async def test_retry(self):
+        handler = Handler(failures=2)
+        dispatcher = self.start_server(handler)
+        await dispatcher.enqueue(self.message(dispatcher, "user@example.com"))
+        await dispatcher.stop()
+        self.assertEqual(len(handler.messages), 1)
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (1, 0))
+
+    async def test_gives_up(self):
+        handler = Handler(failures=3)
+        dispatcher = self.start_server(handler)
+        await dispatcher.enqueue(self.message(dispatcher, "user@example.com"))
+        await dispatcher.stop()
+        self.assertEqual(handler.messages, [])
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (0, 1))
+
+    async def test_unexpected_error(self):
+        handler = Handler()
+        dispatcher = self.start_server(handler)
+        smtp = dispatcher._smtp
+        calls = []
+
+        def broken_once():
+            calls.append(None)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return smtp()
+
+        dispatcher._smtp = broken_once
+        dispatcher.concurrency = 1
+        with self.assertLogs("src.services.email", "ERROR"):
+            with self.assertRaises(RuntimeError):
+                await dispatcher.send(self.message(dispatcher, "user1@example.com"))
+        # the worker is still running
+        self.assertTrue(await dispatcher.send(self.message(dispatcher, "user2@example.com")))
+        await dispatcher.stop()
+        self.assertEqual(len(handler.messages), 1)
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (1, 1))
+
+    async def test_duplicates_are_dropped(self):
+        handler = Handler()
+        dispatcher = self.start_server(handler)
+        message = self.message(dispatcher, "user@example.com")
+        self.assertTrue(await dispatcher.enqueue(message, dedup_key="confirm:user@example.com"))
+        self.assertFalse(await dispatcher.enqueue(message, dedup_key="confirm:user@example.com"))
+        self.assertTrue(await dispatcher.enqueue(message, dedup_key="recovery:user@example.com"))
+        await dispatcher.stop()
+        self.assertEqual(len(handler.messages), 2)
+        self.assertEqual(dispatcher.deduplicated, 1)
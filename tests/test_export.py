@@ -0,0 +1,80 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, Note, Tag, User, note_m2m_tag
+from src.repository.notes import stream_notes
+from src.services.export import export_csv, export_ndjson
+
+
+class TestExportMemory(unittest.IsolatedAsyncioTestCase):
+    """
+    Exports users with 3k and 15k notes from a file-backed SQLite database and
+    checks that the peak memory of the export does not grow with the number of notes.
+    """
+
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'export.db')}"
+        )
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(
+                insert(User),
+                [{"id": i, "email": f"{i}@example.com", "password": "x"} for i in (1, 2)],
+            )
+            await conn.execute(
+                insert(Tag),
+                [{"id": i, "name": f"tag {i}", "user_id": 2} for i in range(1, 11)],
+            )
+            note_id = 0
+            for user_id, count in ((1, 3_000), (2, 15_000)):
+                notes, links = [], []
+                for _ in range(count):
+                    note_id += 1
+                    notes.append(
+                        {
+                            "id": note_id,
+                            "title": f"note {note_id}",
+                            "description": "x" * 100,
+                            "user_id": user_id,
+                        }
+                    )
+                    if user_id == 2:
+                        links.append({"note_id": note_id, "tag_id": note_id % 10 + 1})
+                await conn.execute(insert(Note), notes)
+                if links:
+                    await conn.execute(insert(note_m2m_tag), links)
+        self.session_local = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def export(self, user_id, exporter):
+        size = 0
+        async with self.session_local() as db:
+            tracemalloc.start()
+            try:
+                async for chunk in exporter(stream_notes(User(id=user_id), db)):
+                    size += len(chunk)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        return size, peak
+
+    async def test_memory_is_bounded(self):
+        for exporter in (export_ndjson, export_csv):
+            with self.subTest(exporter=exporter.__name__):
+                # the first run pays for one-off allocations such as compiled statements
+                await self.export(1, exporter)
+                small_size, small_peak = await self.export(1, exporter)
+                large_size, large_peak = await self.export(2, exporter)
+                self.assertGreater(large_size, 4 * small_size)
+                self.assertLess(large_peak, 1.5 * small_peak)
+                self.assertLess(large_peak, large_size)
@@ -0,0 +1,184 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.database.models import Base, EmailOutbox
+from src.repository import outbox as repository_outbox
+from src.services.outbox import process_batch, run
+
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+    """
+    Drains an email outbox in a file-backed SQLite database with a mocked dispatcher.
+    """
+
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'outbox.db')}"
+        )
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_local = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.send = AsyncMock(return_value=True)
+        patcher = patch("src.services.outbox.dispatcher.send", self.send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def add(self, *emails):
+        async with self.session_local() as db:
+            for kind, recipient in emails:
+                repository_outbox.add_email(kind, recipient, "user", "http://test/", db)
+            await db.commit()
+
+    async def rows(self):
+        async with self.session_local() as db:
+            rows = await db.execute(select(EmailOutbox).order_by(EmailOutbox.id))
+            return rows.scalars().all()
+
+    async def process(self, **kwargs):
+        async with self.session_local() as db:
+            return await process_batch(db, **kwargs)
+
+    async def test_sends_and_marks_sent(self):
+        await self.add(("confirm", "a@example.com"), ("recovery", "b@example.com"))
+        self.assertEqual(await self.process(), 2)
+        self.assertEqual(self.send.await_count, 2)
+        recipients = {call.args[0]["To"] for call in self.send.await_args_list}
+        self.assertEqual(recipients, {"a@example.com", "b@example.com"})
+        self.assertTrue(all(row.sent_at is not None for row in await self.rows()))
+        self.assertEqual(await self.process(), 0)
+        self.assertEqual(self.send.await_count, 2)
+
+    async def test_batch_size(self):
+        await self.add(*(("confirm", f"{i}@example.com") for i in range(5)))
+        self.assertEqual(await self.process(batch_size=3), 3)
+        self.assertEqual(await self.process(batch_size=3), 2)
+        self.assertEqual(await self.process(batch_size=3), 0)
+
+    async def test_duplicates_in_batch_sent_once(self):
+        await self.add(("confirm", "a@example.com"), ("confirm", "a@example.com"))
+        self.assertEqual(await self.process(), 2)
+        self.send.assert_awaited_once()
+        self.assertTrue(all(row.sent_at is not None for row in await self.rows()))
+
+    async def test_failure_is_rescheduled(self):
+        self.send.return_value = False
+        await self.add(("confirm", "a@example.com"))
+        self.assertEqual(await self.process(retry_delay=60), 1)
+        [row] = await self.rows()
+        self.assertIsNone(row.sent_at)
+        self.assertEqual(row.attempts, 1)
+        # not due yet
+        self.assertEqual(await self.process(), 0)
+
+    async def test_error_is_a_failure(self):
+        async def send(message):
+            if message["To"] == "a@example.com":
+                raise RuntimeError("boom")
+            return True
+
+        self.send.side_effect = send
+        await self.add(("confirm", "a@example.com"), ("confirm", "b@example.com"))
+        self.assertEqual(await self.process(retry_delay=60), 2)
+        failed, sent = await self.rows()
+        self.assertEqual((failed.attempts, failed.sent_at), (1, None))
+        self.assertIsNotNone(sent.sent_at)
+
+    async def test_render_error_fails_that_email_only(self):
+        await self.add(("unknown", "a@example.com"), ("confirm", "b@example.com"))
+        with self.assertLogs("src.services.outbox", "ERROR"):
+            self.assertEqual(await self.process(retry_delay=60), 2)
+        failed, sent = await self.rows()
+        self.assertEqual((failed.attempts, failed.sent_at), (1, None))
+        self.assertIsNotNone(sent.sent_at)
+        self.send.assert_awaited_once()
+
+    async def test_run_survives_errors(self):
+        process = AsyncMock(side_effect=[OSError("database down"), 1, asyncio.CancelledError()])
+        purge = AsyncMock(side_effect=RuntimeError("boom"))
+        with patch("src.services.outbox.process_batch", process), patch(
+            "src.services.outbox.purge", purge
+        ), patch("src.services.outbox.SessionLocal", self.session_local), patch(
+            "src.services.outbox.dispatcher"
+        ) as dispatcher, self.assertLogs("src.services.outbox", "ERROR") as logs:
+            dispatcher.stop = AsyncMock()
+            with self.assertRaises(asyncio.CancelledError):
+                await run(poll_interval=0, purge_interval=3600)
+        self.assertEqual(process.await_count, 3)
+        purge.assert_awaited_once()
+        self.assertEqual(len(logs.records), 2)
+        dispatcher.stop.assert_awaited_once()
+
+    async def test_gives_up_after_max_attempts(self):
+        self.send.return_value = False
+        await self.add(("confirm", "a@example.com"))
+        for attempt in range(2):
+            self.assertEqual(await self.process(max_attempts=2, retry_delay=0), 1)
+        self.assertEqual(await self.process(max_attempts=2, retry_delay=0), 0)
+        [row] = await self.rows()
+        self.assertEqual(row.attempts, 2)
+        self.assertEqual(self.send.await_count, 2)
+
+    async def test_claim_is_committed_before_sending(self):
+        await self.add(("confirm", "a@example.com"))
+
+        async def send(message):
+            # another worker finds nothing to claim while the email is being sent
+            self.assertEqual(await self.process(), 0)
+            [row] = await self.rows()
+            self.assertEqual(row.attempts, 1)
+            return True
+
+        self.send.side_effect = send
+        self.assertEqual(await self.process(), 1)
+        self.send.assert_awaited_once()
+
+    async def test_lease_expires(self):
+        await self.add(("confirm", "a@example.com"))
+        async with self.session_local() as db:
+            # a worker that died after claiming
+            await repository_outbox.claim_emails(10, 5, 60, db)
+            await db.commit()
+        self.assertEqual(await self.process(), 0)
+        await self.add(("confirm", "b@example.com"))
+        async with self.session_local() as db:
+            # one whose lease ran out
+            await repository_outbox.claim_emails(1, 5, -1, db)
+            await db.commit()
+        self.assertEqual(await self.process(), 1)
+        leased, expired = await self.rows()
+        self.assertEqual((leased.attempts, leased.sent_at), (1, None))
+        self.assertEqual(expired.attempts, 2)
+        self.assertIsNotNone(expired.sent_at)
+
+    async def test_purge(self):
+        self.send.side_effect = lambda message: message["To"] != "dead@example.com"
+        await self.add(
+            ("confirm", "sent@example.com"),
+            ("confirm", "dead@example.com"),
+            ("confirm", "pending@example.com"),
+        )
+        self.assertEqual(await self.process(batch_size=2, max_attempts=1, retry_delay=0), 2)
+        async with self.session_local() as db:
+            self.assertEqual(await repository_outbox.purge_emails(1, 60, db), 0)
+            self.assertEqual(await repository_outbox.purge_emails(1, -60, db), 2)
+            await db.commit()
+        [row] = await self.rows()
+        self.assertEqual(row.recipient, "pending@example.com")
+
+    async def test_rolled_back_email_is_not_sent(self):
+        async with self.session_local() as db:
+            repository_outbox.add_email("confirm", "a@example.com", "user", "http://test/", db)
+            await db.rollback()
+        self.assertEqual(await self.process(), 0)
+        self.send.assert_not_awaited()
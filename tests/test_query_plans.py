@@ -0,0 +1,104 @@
+import unittest
+
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database.models import Base, Note, Tag, User, note_m2m_tag
+from src.repository import notes as repository_notes
+from src.repository import tags as repository_tags
+
+
+class TestQueryPlans(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the per-user repository queries against SQLite and checks with
+    EXPLAIN QUERY PLAN that none of them falls back to a full table scan.
+    """
+
+    async def asyncSetUp(self) -> None:
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(
+                insert(User), [{"id": i, "email": f"{i}@example.com", "password": "x"} for i in (1, 2)]
+            )
+            await conn.execute(
+                insert(Tag), [{"id": i, "name": f"tag_{i}", "user_id": i % 2 + 1} for i in range(1, 21)]
+            )
+            await conn.execute(
+                insert(Note),
+                [
+                    {"id": i, "title": "t", "description": "d", "user_id": i % 2 + 1}
+                    for i in range(1, 201)
+                ],
+            )
+            await conn.execute(
+                insert(note_m2m_tag),
+                [{"note_id": i, "tag_id": i % 20 + 1} for i in range(1, 201)],
+            )
+            await conn.exec_driver_sql("ANALYZE")
+        self.session = async_sessionmaker(bind=self.engine, expire_on_commit=False)()
+        self.user = User(id=1)
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._capture)
+
+    async def asyncTearDown(self) -> None:
+        event.remove(self.engine.sync_engine, "before_cursor_execute", self._capture)
+        await self.session.close()
+        await self.engine.dispose()
+
+    def _capture(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+    async def assert_indexed(self):
+        self.assertTrue(self.statements)
+        statements, self.statements = self.statements, []
+        async with self.engine.connect() as conn:
+            for statement, parameters in statements:
+                plan = await conn.exec_driver_sql(
+                    "EXPLAIN QUERY PLAN " + statement, parameters
+                )
+                for row in plan:
+                    detail = row[-1]
+                    with self.subTest(statement=statement, detail=detail):
+                        self.assertFalse(
+                            detail.startswith("SCAN") and "CONSTANT ROW" not in detail,
+                            f"full scan in query plan: {detail}",
+                        )
+
+    async def test_get_notes(self):
+        await repository_notes.get_notes(0, 10, self.user, self.session)
+        await self.assert_indexed()
+
+    async def test_get_notes_after_cursor(self):
+        await repository_notes.get_notes(0, 10, self.user, self.session, after_id=150)
+        await self.assert_indexed()
+
+    async def test_get_notes_with_any_tag(self):
+        await repository_notes.get_notes(
+            0, 10, self.user, self.session, tag_ids=[1, 3, 5]
+        )
+        await self.assert_indexed()
+
+    async def test_get_notes_with_all_tags(self):
+        await repository_notes.get_notes(
+            0, 10, self.user, self.session, tag_ids=[1, 3], match_all=True
+        )
+        await self.assert_indexed()
+
+    async def test_get_note(self):
+        await repository_notes.get_note(1, self.user, self.session)
+        await self.assert_indexed()
+
+    async def test_get_tags(self):
+        await repository_tags.get_tags(0, 10, self.user, self.session)
+        await self.assert_indexed()
+
+    async def test_get_tags_after_cursor(self):
+        await repository_tags.get_tags(0, 10, self.user, self.session, after_id=10)
+        await self.assert_indexed()
+
+    async def test_get_tag(self):
+        await repository_tags.get_tag(1, self.user, self.session)
+        await self.assert_indexed()
@@ -1,11 +1,13 @@
-from unittest.mock import MagicMock
+import asyncio
 
-from src.database.models import User
+from passlib.context import CryptContext
 
+from src.database.models import EmailOutbox, User
+from src.conf.config import settings
+from src.services.auth import auth_service
 
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+
+def test_create_user(client, session, user):
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -14,6 +16,9 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["user"]["email"] == user.get("email")
     assert "id" in data["user"]
+    email = session.query(EmailOutbox).filter(EmailOutbox.recipient == user.get("email")).one()
+    assert email.kind == "confirm"
+    assert email.sent_at is None
 
 
 def test_repeat_create_user(client, user):
@@ -49,6 +54,18 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_cache_stats_requires_login(client, user):
+    assert client.get("/api/cache/stats").status_code == 401
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = client.get("/api/cache/stats", headers=headers)
+    assert response.status_code == 200, response.text
+    assert "hit_ratio" in response.json()
+
+
 def test_login_wrong_password(client, user):
     response = client.post(
         "/api/auth/login",
@@ -67,3 +84,152 @@ def test_login_wrong_email(client, user):
     assert response.status_code == 401, response.text
     data = response.json()
     assert data["detail"] == "Invalid email"
+
+
+def test_login_rehashes_password(client, session, user, monkeypatch):
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4)
+    monkeypatch.setattr(auth_service, "pwd_context", context)
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    session.expire_all()
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    assert current_user.password.startswith("$2b$04$")
+    assert context.verify(user.get('password'), current_user.password)
+
+
+def login(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["refresh_token"]
+
+
+def refresh(client, refresh_token):
+    return client.get(
+        "/api/auth/refresh_token", headers={"Authorization": f"Bearer {refresh_token}"}
+    )
+
+
+def test_refresh_token_database(client, user):
+    refresh_token = login(client, user)
+    response = refresh(client, refresh_token)
+    assert response.status_code == 200, response.text
+    assert response.json()["refresh_token"] != refresh_token
+    assert refresh(client, refresh_token).status_code == 401
+    assert refresh(client, response.json()["refresh_token"]).status_code == 401
+
+
+def test_refresh_token_redis_rotation(client, session, user, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "refresh_token_store", "redis")
+    session.query(User).filter(User.email == user.get('email')).update({"refresh_token": None})
+    session.commit()
+    first = login(client, user)
+    other_device = login(client, user)
+    session.expire_all()
+    assert session.query(User).filter(User.email == user.get('email')).one().refresh_token is None
+
+    second = refresh(client, first).json()["refresh_token"]
+    third = refresh(client, second).json()["refresh_token"]
+    # reusing a rotated token revokes its family, but not the other device
+    assert refresh(client, first).status_code == 401
+    assert refresh(client, third).status_code == 401
+    assert refresh(client, other_device).status_code == 200
+
+
+def test_refresh_token_redis_user_set(client, user, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "refresh_token_store", "redis")
+    store = auth_service.refresh_tokens
+    user_key = store.user_key(user.get('email'))
+    first = login(client, user)
+    del fake_redis.ttls[user_key]
+    second = refresh(client, first).json()["refresh_token"]
+    # every rotation keeps the set of families alive as long as the family
+    assert fake_redis.ttls[user_key] == store.ttl
+    assert len(fake_redis.data[user_key]) == 1
+    assert refresh(client, first).status_code == 401
+    assert fake_redis.data[user_key] == set()
+    assert refresh(client, second).status_code == 401
+
+
+def test_refresh_token_redis_revoked_family(client, user, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "refresh_token_store", "redis")
+    token = login(client, user)
+    [family_key] = [key for key in fake_redis.data if ":family:" in key]
+    del fake_redis.data[family_key]
+    assert refresh(client, token).status_code == 401
+    assert family_key not in fake_redis.data
+
+
+def test_refresh_token_migrates_to_redis(client, session, user, fake_redis, monkeypatch):
+    legacy = login(client, user)
+    monkeypatch.setattr(settings, "refresh_token_store", "redis")
+    response = refresh(client, legacy)
+    assert response.status_code == 200, response.text
+    session.expire_all()
+    assert session.query(User).filter(User.email == user.get('email')).one().refresh_token is None
+    assert refresh(client, legacy).status_code == 401
+    assert refresh(client, response.json()["refresh_token"]).status_code == 200
+
+
+def test_logout(client, user, fake_redis):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    tokens = response.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/api/users/me/", headers=headers).status_code == 200
+
+    response = client.post("/api/auth/logout", headers=headers)
+    assert response.status_code == 204, response.text
+    assert auth_service.revoked_tokens.is_revoked(
+        auth_service.decode_access_token(tokens["access_token"])["jti"]
+    )
+    assert client.get("/api/users/me/", headers=headers).status_code == 401
+    assert client.post("/api/auth/logout", headers=headers).status_code == 401
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_logout_revokes_refresh_family(client, user, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "refresh_token_store", "redis")
+    other_device = login(client, user)
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    # the access tokens of a rotated login still name its family
+    tokens = refresh(client, response.json()["refresh_token"]).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.post("/api/auth/logout", headers=headers).status_code == 204
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+    assert refresh(client, other_device).status_code == 200
+    assert len(fake_redis.data[auth_service.refresh_tokens.user_key(user.get('email'))]) == 1
+
+
+def test_logout_without_family_revokes_all(client, user, fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "refresh_token_store", "redis")
+    refresh_token = login(client, user)
+    # an access token issued before tokens named their family
+    access_token = asyncio.run(auth_service.create_access_token({"sub": user.get('email')}))
+    headers = {"Authorization": f"Bearer {access_token}"}
+    assert client.post("/api/auth/logout", headers=headers).status_code == 204
+    assert refresh(client, refresh_token).status_code == 401
+
+
+def test_recovery_password_outbox(client, session, user):
+    for _ in range(2):
+        response = client.post(
+            "/api/auth/recovery_password", json={"email": user.get("email")}
+        )
+        assert response.status_code == 200, response.text
+    emails = (
+        session.query(EmailOutbox)
+        .filter(EmailOutbox.recipient == user.get("email"), EmailOutbox.kind == "recovery")
+        .all()
+    )
+    assert len(emails) == 1
@@ -0,0 +1,344 @@
+import csv
+import io
+import json
+
+from main import app
+from src.database.db import get_read_db
+from src.database.models import Note, Tag, note_m2m_tag
+from src.schemas import BULK_MAX_ITEMS, NOTE_MAX_TAGS
+
+
+def test_create_note(auth_client):
+    response = auth_client.post("/api/tags/", json={"name": "work"})
+    assert response.status_code == 201, response.text
+    tag_id = response.json()["id"]
+    for i in range(5):
+        response = auth_client.post(
+            "/api/notes/",
+            json={"title": f"note {i}", "description": "test note", "tags": [tag_id]},
+        )
+        assert response.status_code == 201, response.text
+        data = response.json()
+        assert data["title"] == f"note {i}"
+        assert data["tags"] == [{"name": "work", "id": tag_id}]
+
+
+def test_read_notes_cursor_pagination(auth_client):
+    titles = []
+    response = auth_client.get("/api/notes/", params={"limit": 2})
+    assert response.status_code == 200, response.text
+    while True:
+        titles.extend(note["title"] for note in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        assert 'rel="next"' in response.headers["Link"]
+        response = auth_client.get("/api/notes/", params={"limit": 2, "cursor": cursor})
+        assert response.status_code == 200, response.text
+    assert titles == [f"note {i}" for i in range(5)]
+
+
+def test_read_notes_skip(auth_client):
+    response = auth_client.get("/api/notes/", params={"skip": 3, "limit": 10})
+    assert response.status_code == 200, response.text
+    assert [note["title"] for note in response.json()] == ["note 3", "note 4"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_read_notes_invalid_cursor(auth_client):
+    response = auth_client.get("/api/notes/", params={"cursor": "not a cursor"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_tags_cursor_pagination(auth_client):
+    for name in ("home", "hobby"):
+        assert auth_client.post("/api/tags/", json={"name": name}).status_code == 201
+    response = auth_client.get("/api/tags/", params={"limit": 2})
+    assert [tag["name"] for tag in response.json()] == ["work", "home"]
+    cursor = response.headers["X-Next-Cursor"]
+    response = auth_client.get("/api/tags/", params={"limit": 2, "cursor": cursor})
+    assert [tag["name"] for tag in response.json()] == ["hobby"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_read_notes_query_count(auth_client, session, current_user, count_queries):
+    tags = [Tag(name=f"bulk {i}", user_id=current_user.id) for i in range(3)]
+    session.add_all(
+        Note(title="bulk", description="bulk", tags=tags, user_id=current_user.id)
+        for _ in range(50)
+    )
+    session.commit()
+    with count_queries() as statements:
+        response = auth_client.get("/api/notes/", params={"limit": 100})
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == 55
+    assert all(note["tags"] for note in response.json())
+    assert len(statements) == 2, statements
+
+
+def test_read_note_query_count(auth_client, count_queries):
+    note_id = auth_client.get("/api/notes/", params={"limit": 1}).json()[0]["id"]
+    with count_queries() as statements:
+        response = auth_client.get(f"/api/notes/{note_id}")
+    assert response.status_code == 200, response.text
+    assert len(statements) == 2, statements
+
+
+def test_create_notes_bulk(auth_client, count_queries):
+    tag_id = auth_client.post("/api/tags/", json={"name": "import"}).json()["id"]
+    body = [
+        {"title": f"imported {i}", "description": "bulk", "tags": [tag_id, tag_id]}
+        for i in range(20)
+    ]
+    body.insert(3, {"title": "broken", "description": "bulk", "tags": [tag_id, 99999]})
+    with count_queries() as statements:
+        response = auth_client.post("/api/notes/bulk", json=body)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["created"] == 20
+    assert len(data["results"]) == 21
+    assert data["results"][3] == {"index": 3, "id": None, "error": "Tags not found: [99999]"}
+    ids = [result["id"] for result in data["results"] if result["id"] is not None]
+    assert len(set(ids)) == 20
+    assert len(statements) == 3, statements
+
+    note = auth_client.get(f"/api/notes/{ids[-1]}").json()
+    assert note["title"] == "imported 19"
+    assert note["tags"] == [{"name": "import", "id": tag_id}]
+
+
+def test_update_status_notes(auth_client, count_queries):
+    ids = [note["id"] for note in auth_client.get("/api/notes/", params={"limit": 3}).json()]
+    with count_queries() as statements:
+        response = auth_client.patch(
+            "/api/notes/status", json={"ids": ids + [99999], "done": True}
+        )
+    assert response.status_code == 200, response.text
+    assert response.json() == {"affected": ids, "not_found": [99999]}
+    assert len(statements) == 1, statements
+
+
+def test_remove_notes(auth_client, session, count_queries):
+    notes = auth_client.get("/api/notes/", params={"limit": 3}).json()
+    ids = [note["id"] for note in notes]
+    assert any(note["tags"] for note in notes)
+    with count_queries() as statements:
+        response = auth_client.request(
+            "DELETE", "/api/notes/", json={"ids": ids + [99999]}
+        )
+    assert response.status_code == 200, response.text
+    assert response.json() == {"affected": ids, "not_found": [99999]}
+    assert len(statements) == 1, statements
+    for note_id in ids:
+        assert auth_client.get(f"/api/notes/{note_id}").status_code == 404
+    links = session.execute(
+        note_m2m_tag.select().filter(note_m2m_tag.c.note_id.in_(ids))
+    ).all()
+    assert links == []
+
+
+def test_create_notes_bulk_limited(auth_client):
+    note = {"title": "bulk", "description": "bulk", "tags": []}
+    response = auth_client.post("/api/notes/bulk", json=[note] * (BULK_MAX_ITEMS + 1))
+    assert response.status_code == 422, response.text
+    note["tags"] = list(range(1, NOTE_MAX_TAGS + 2))
+    response = auth_client.post("/api/notes/bulk", json=[note])
+    assert response.status_code == 422, response.text
+
+
+def test_bulk_ids_limited(auth_client):
+    ids = list(range(1, BULK_MAX_ITEMS + 2))
+    response = auth_client.patch("/api/notes/status", json={"ids": ids, "done": True})
+    assert response.status_code == 422, response.text
+    response = auth_client.request("DELETE", "/api/notes/", json={"ids": ids})
+    assert response.status_code == 422, response.text
+
+
+def test_search_notes(auth_client):
+    body = [
+        {"title": "groceries", "description": "buy milk and bread", "tags": []},
+        {"title": "milk milk", "description": "milk again", "tags": []},
+        {"title": "meeting", "description": "call Bob about the report", "tags": []},
+    ] + [
+        {"title": f"milk {i}", "description": "weekly order", "tags": []}
+        for i in range(4)
+    ]
+    assert auth_client.post("/api/notes/bulk", json=body).json()["created"] == 7
+
+    response = auth_client.get("/api/notes/search", params={"q": "milk"})
+    assert response.status_code == 200, response.text
+    titles = [note["title"] for note in response.json()]
+    assert len(titles) == 6
+    assert titles[0] == "milk milk"
+    assert "meeting" not in titles
+
+    paged = []
+    response = auth_client.get("/api/notes/search", params={"q": "milk", "limit": 4})
+    while True:
+        paged.extend(note["title"] for note in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = auth_client.get(
+            "/api/notes/search", params={"q": "milk", "limit": 4, "cursor": cursor}
+        )
+    assert paged == titles
+
+
+def test_search_notes_syntax_is_literal(auth_client):
+    response = auth_client.get("/api/notes/search", params={"q": 'bob" OR "milk'})
+    assert response.status_code == 200, response.text
+    assert [note["title"] for note in response.json()] == []
+    response = auth_client.get("/api/notes/search", params={"q": "Bob report"})
+    assert [note["title"] for note in response.json()] == ["meeting"]
+
+
+def test_search_notes_follows_updates(auth_client):
+    note = auth_client.get("/api/notes/search", params={"q": "meeting"}).json()[0]
+    response = auth_client.put(
+        f"/api/notes/{note['id']}",
+        json={"title": "standup", "description": "daily", "tags": [], "done": False},
+    )
+    assert response.status_code == 200, response.text
+    assert auth_client.get("/api/notes/search", params={"q": "meeting"}).json() == []
+    assert len(auth_client.get("/api/notes/search", params={"q": "standup"}).json()) == 1
+
+
+def test_read_notes_by_tags(auth_client):
+    tags = auth_client.post(
+        "/api/tags/bulk", json=[{"name": "red"}, {"name": "green"}, {"name": "blue"}]
+    ).json()
+    red, green, blue = (tag["id"] for tag in tags)
+    body = [
+        {"title": "red", "description": "filter", "tags": [red]},
+        {"title": "red green", "description": "filter", "tags": [red, green]},
+        {"title": "green blue", "description": "filter", "tags": [green, blue]},
+        {"title": "plain", "description": "filter", "tags": []},
+    ]
+    auth_client.post("/api/notes/bulk", json=body)
+
+    def titles(**params):
+        response = auth_client.get("/api/notes/", params=params)
+        assert response.status_code == 200, response.text
+        return [note["title"] for note in response.json()]
+
+    assert titles(tags=f"{red}") == ["red", "red green"]
+    assert titles(tags=f"{red},{blue}", match="any") == ["red", "red green", "green blue"]
+    assert titles(tags=f"{red},{green}", match="all") == ["red green"]
+    assert titles(tags=f"{red},{blue}", match="all") == []
+    assert titles(tags=f"{green}", limit=1) == ["red green"]
+
+    response = auth_client.get("/api/notes/", params={"tags": "1,x"})
+    assert response.status_code == 422, response.text
+
+
+def test_export_notes_ndjson(auth_client):
+    notes = auth_client.get("/api/notes/", params={"limit": 1000}).json()
+    response = auth_client.get("/api/notes/export")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [note["id"] for note in exported] == [note["id"] for note in notes]
+    by_id = {note["id"]: note for note in exported}
+    for note in notes:
+        assert sorted(by_id[note["id"]]["tags"]) == sorted(tag["name"] for tag in note["tags"])
+
+
+def test_export_notes_csv(auth_client):
+    response = auth_client.get("/api/notes/export", params={"format": "csv"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    red_green = next(row for row in rows if row["title"] == "red green")
+    assert sorted(red_green["tags"].split(";")) == ["green", "red"]
+    assert len(rows) == len(auth_client.get("/api/notes/", params={"limit": 1000}).json())
+
+
+def test_import_notes(auth_client):
+    lines = [
+        json.dumps({"title": f"imported {i}", "description": "ndjson", "tags": ["import", f"batch {i % 2}"]})
+        for i in range(7)
+    ]
+    lines.insert(2, "not json")
+    lines.insert(5, json.dumps({"title": "x" * 51, "description": "too long"}))
+    lines.insert(6, "")
+    response = auth_client.post(
+        "/api/notes/import",
+        params={"batch_size": 3},
+        content="\n".join(lines).encode(),
+    )
+    assert response.status_code == 200, response.text
+    progress = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["imported"] for line in progress] == [3, 6, 7]
+    assert progress[0]["errors"] == [{"line": 3, "error": "Invalid JSON"}]
+    assert progress[1]["errors"][0]["line"] == 6
+    assert progress[-1]["done"] is True
+    assert progress[-1]["failed"] == 2
+
+    tags = {tag["name"]: tag["id"] for tag in auth_client.get("/api/tags/").json()}
+    assert {"batch 0", "batch 1"} <= tags.keys()
+    notes = auth_client.get(
+        "/api/notes/", params={"tags": tags["batch 1"], "limit": 100}
+    ).json()
+    assert [note["title"] for note in notes if note["title"].startswith("imported ")] == [
+        "imported 1",
+        "imported 3",
+        "imported 5",
+    ]
+
+
+def test_read_notes_cached(auth_client, count_queries):
+    params = {"limit": 2}
+    first = auth_client.get("/api/notes/", params=params)
+    assert first.status_code == 200, first.text
+    with count_queries() as statements:
+        second = auth_client.get("/api/notes/", params=params)
+    assert second.status_code == 200, second.text
+    assert statements == []
+    assert second.json() == first.json()
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+    note_id = first.json()[0]["id"]
+    assert auth_client.get(f"/api/notes/{note_id}").json() == first.json()[0]
+    assert auth_client.delete(f"/api/notes/{note_id}").status_code == 200
+    assert auth_client.get(f"/api/notes/{note_id}").status_code == 404
+    third = auth_client.get("/api/notes/", params=params)
+    assert third.json()[0] == first.json()[1]
+
+
+def test_read_notes_not_modified(auth_client, count_queries):
+    first = auth_client.get("/api/notes/")
+    etag = first.headers["ETag"]
+    with count_queries() as statements:
+        response = auth_client.get("/api/notes/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    assert statements == []
+
+    note_id = first.json()[0]["id"]
+    assert auth_client.get(f"/api/notes/{note_id}").headers["ETag"] == etag
+    auth_client.delete(f"/api/notes/{note_id}")
+    response = auth_client.get("/api/notes/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert note_id not in [note["id"] for note in response.json()]
+
+
+def test_read_notes_cache_miss_reads_primary(auth_client):
+    # a lagging replica must not fill the cache under the current version
+    async def lagging_replica():
+        raise AssertionError("cached responses are built from the replica")
+        yield
+
+    auth_client.post("/api/tags/", json={"name": "primary"})
+    override = app.dependency_overrides[get_read_db]
+    app.dependency_overrides[get_read_db] = lagging_replica
+    try:
+        assert auth_client.get("/api/notes/").status_code == 200
+        response = auth_client.get("/api/tags/")
+        assert response.status_code == 200
+        assert "primary" in [tag["name"] for tag in response.json()]
+    finally:
+        app.dependency_overrides[get_read_db] = override
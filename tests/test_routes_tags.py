@@ -0,0 +1,53 @@
+from src.schemas import BULK_MAX_ITEMS
+
+
+def test_upsert_tags(auth_client, count_queries):
+    existing = auth_client.post("/api/tags/", json={"name": "work"}).json()
+    body = [{"name": name} for name in ("home", "work", "home", "travel")]
+    with count_queries() as statements:
+        response = auth_client.post("/api/tags/bulk", json=body)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [tag["name"] for tag in data] == ["home", "work", "travel"]
+    assert data[1]["id"] == existing["id"]
+    assert len(statements) == 1, statements
+
+    response = auth_client.post("/api/tags/bulk", json=body)
+    assert response.json() == data
+    tags = auth_client.get("/api/tags/").json()
+    assert sorted(tag["name"] for tag in tags) == ["home", "travel", "work"]
+
+
+def test_upsert_tags_empty(auth_client):
+    response = auth_client.post("/api/tags/bulk", json=[])
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+
+
+def test_upsert_tags_limited(auth_client):
+    body = [{"name": f"tag {i}"} for i in range(BULK_MAX_ITEMS + 1)]
+    response = auth_client.post("/api/tags/bulk", json=body)
+    assert response.status_code == 422, response.text
+
+
+def test_read_tags_not_modified(auth_client):
+    response = auth_client.get("/api/tags/")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    response = auth_client.get("/api/tags/", headers={"If-None-Match": f'W/{etag}, "0-0"'})
+    assert response.status_code == 304
+    auth_client.post("/api/tags/bulk", json=[{"name": "etag"}])
+    response = auth_client.get("/api/tags/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "etag" in [tag["name"] for tag in response.json()]
+
+
+def test_etag_survives_redis_flush(auth_client, fake_redis):
+    auth_client.post("/api/tags/bulk", json=[{"name": "before flush"}])
+    etag = auth_client.get("/api/tags/").headers["ETag"]
+    fake_redis.data.clear()
+    # one write after the flush must not bring the counter back to the version of etag
+    auth_client.post("/api/tags/bulk", json=[{"name": "after flush"}])
+    response = auth_client.get("/api/tags/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "after flush" in [tag["name"] for tag in response.json()]
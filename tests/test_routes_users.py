@@ -0,0 +1,127 @@
+import io
+
+import pytest
+from PIL import Image
+
+from src.conf.config import settings
+from src.services.avatars import LocalAvatarStorage
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalAvatarStorage(tmp_path, "/api/users/{user_id}/avatar")
+    monkeypatch.setattr("src.routes.users.avatar_storage", storage)
+    return storage
+
+
+def png(size=(600, 400), color="blue") -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, "PNG")
+    return output.getvalue()
+
+
+def test_update_avatar(auth_client, current_user, storage):
+    response = auth_client.patch(
+        "/api/users/avatar", files={"file": ("avatar.png", png(), "image/png")}
+    )
+    assert response.status_code == 200, response.text
+    url = response.json()["avatar"]
+    assert url.startswith(f"/api/users/{current_user.id}/avatar?v=")
+    [path] = (storage.root / str(current_user.id)).iterdir()
+    assert url.endswith(path.stem)
+    with Image.open(path) as image:
+        assert image.size == (settings.avatar_size, settings.avatar_size)
+
+
+def upload(client, color="blue") -> str:
+    response = client.patch(
+        "/api/users/avatar", files={"file": ("avatar.png", png(color=color), "image/png")}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["avatar"]
+
+
+def test_read_avatar(auth_client, current_user, storage):
+    url = upload(auth_client)
+    response = auth_client.get(url)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"] == f'"{url.rsplit("=", 1)[1]}"'
+    avatar = response.content
+    assert int(response.headers["content-length"]) == len(avatar)
+
+    response = auth_client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304, response.text
+
+    response = auth_client.get(f"/api/users/{current_user.id}/avatar")
+    assert response.status_code == 200, response.text
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.content == avatar
+
+
+def test_read_avatar_range(auth_client, storage):
+    url = upload(auth_client)
+    avatar = auth_client.get(url).content
+    size = len(avatar)
+    for header, start, end in (
+        ("bytes=0-99", 0, 100),
+        ("bytes=100-", 100, size),
+        ("bytes=-50", size - 50, size),
+        (f"bytes=10-{size + 100}", 10, size),
+    ):
+        response = auth_client.get(url, headers={"Range": header})
+        assert response.status_code == 206, header
+        assert response.content == avatar[start:end]
+        assert response.headers["content-range"] == f"bytes {start}-{end - 1}/{size}"
+
+    response = auth_client.get(url, headers={"Range": f"bytes={len(avatar)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(avatar)}"
+
+    for headers in (
+        {"Range": "bytes=0-1,5-6"},
+        {"Range": "bytes=5-2"},
+        {"Range": "bytes=0-9", "If-Range": '"old"'},
+    ):
+        response = auth_client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert response.content == avatar
+
+
+def test_read_avatar_replaced(auth_client, current_user, storage):
+    old_url = upload(auth_client)
+    new_url = upload(auth_client, "green")
+    assert old_url != new_url
+    assert auth_client.get(old_url).status_code == 404
+    assert auth_client.get(new_url).status_code == 200
+
+
+def test_read_avatar_not_found(client, current_user, storage):
+    assert client.get("/api/users/999999/avatar").status_code == 404
+    for v in ("../../etc/passwd", "0" * 32):
+        response = client.get(f"/api/users/{current_user.id}/avatar", params={"v": v})
+        assert response.status_code == 404
+
+
+def test_update_avatar_too_large(auth_client, storage, monkeypatch):
+    monkeypatch.setattr(settings, "avatar_max_bytes", 1024)
+    response = auth_client.patch(
+        "/api/users/avatar", files={"file": ("avatar.png", b"x" * 100_000, "image/png")}
+    )
+    assert response.status_code == 413, response.text
+    assert not list(storage.root.iterdir())
+
+
+def test_update_avatar_not_image(auth_client, storage):
+    response = auth_client.patch(
+        "/api/users/avatar", files={"file": ("avatar.png", b"not an image", "image/png")}
+    )
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "File is not a valid image"
+
+
+def test_update_avatar_missing_file(auth_client, storage):
+    response = auth_client.patch("/api/users/avatar", files={"other": ("a.png", png())})
+    assert response.status_code == 422, response.text
@@ -0,0 +1,82 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from jose import jwt
+from passlib.context import CryptContext
+
+from src.services.auth import Auth
+from src.services.local_cache import TTLCache
+
+
+class TestDecodeAccessToken(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.token_cache = TTLCache(10, ttl=0)
+
+    async def test_token_is_verified_once(self):
+        token = await self.auth.create_access_token({"sub": "test@example.com"})
+        with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as decode:
+            first = self.auth.decode_access_token(token)
+            second = self.auth.decode_access_token(token)
+        self.assertEqual(first["sub"], "test@example.com")
+        self.assertIs(second, first)
+        decode.assert_called_once()
+        self.assertEqual(len(self.auth.token_cache), 1)
+
+    async def test_cached_until_expiry(self):
+        token = await self.auth.create_access_token({"sub": "test@example.com"}, 60)
+        with patch("src.services.local_cache.time.monotonic", return_value=1000.0):
+            self.auth.decode_access_token(token)
+        with patch("src.services.local_cache.time.monotonic", return_value=1061.0):
+            with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as decode:
+                self.auth.decode_access_token(token)
+            decode.assert_called_once()
+
+    async def test_invalid_tokens_are_rejected(self):
+        refresh_token = await self.auth.create_refresh_token({"sub": "test@example.com"})
+        expired = await self.auth.create_access_token({"sub": "test@example.com"}, -10)
+        access_token = await self.auth.create_access_token({"sub": "test@example.com"})
+        for token in (refresh_token, expired, access_token[:-2], "garbage"):
+            with self.subTest(token=token):
+                self.assertIsNone(self.auth.decode_access_token(token))
+        self.assertEqual(len(self.auth.token_cache), 0)
+
+
+class TestPasswordHash(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.auth = Auth()
+        self.auth.pwd_context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4
+        )
+
+    async def test_hash_runs_in_pool(self):
+        threads = []
+
+        def record(password):
+            threads.append(threading.current_thread().name)
+            return "hash"
+
+        with patch.object(self.auth.pwd_context, "hash", record):
+            self.assertEqual(await self.auth.get_password_hash("secret"), "hash")
+        self.assertTrue(threads[0].startswith("password-hash"))
+
+    async def test_verify(self):
+        hashed = await self.auth.get_password_hash("secret")
+        self.assertTrue(await self.auth.verify_password("secret", hashed))
+        self.assertFalse(await self.auth.verify_password("wrong", hashed))
+
+    async def test_rehash_when_rounds_change(self):
+        hashed = await self.auth.get_password_hash("secret")
+        self.assertEqual(
+            await self.auth.verify_and_update_password("secret", hashed), (True, None)
+        )
+        self.auth.pwd_context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5
+        )
+        valid, new_hash = await self.auth.verify_and_update_password("secret", hashed)
+        self.assertTrue(valid)
+        self.assertTrue(new_hash.startswith("$2b$05$"))
+        self.assertEqual(
+            await self.auth.verify_and_update_password("wrong", hashed), (False, None)
+        )
@@ -0,0 +1,84 @@
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from fastapi import HTTPException
+from PIL import Image
+
+from src.database.models import User
+from src.services.avatars import LocalAvatarStorage, parse_range, process_avatar
+
+
+def image_bytes(size, format="PNG", mode="RGBA") -> bytes:
+    output = io.BytesIO()
+    Image.new(mode, size, "red").save(output, format)
+    return output.getvalue()
+
+
+class TestProcessAvatar(unittest.IsolatedAsyncioTestCase):
+    async def test_resized_to_square_jpeg(self):
+        for size, format, mode in (((1000, 500), "PNG", "RGBA"), ((60, 90), "JPEG", "RGB")):
+            avatar = await process_avatar(image_bytes(size, format, mode), 250)
+            with Image.open(io.BytesIO(avatar)) as image:
+                self.assertEqual(image.format, "JPEG")
+                self.assertEqual(image.size, (250, 250))
+
+    async def test_not_an_image(self):
+        for data in (b"not an image", image_bytes((100, 100))[:50]):
+            with self.assertRaises(HTTPException) as e:
+                await process_avatar(data, 250)
+            self.assertEqual(e.exception.status_code, 400)
+
+
+class TestLocalAvatarStorage(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = Path(self.tmp.name) / "avatars"
+        self.storage = LocalAvatarStorage(self.root, "/users/{user_id}/avatar")
+        self.user = MagicMock(spec=User, id=7)
+
+    async def test_save_replaces_avatar(self):
+        first = await self.storage.save(self.user, b"first")
+        second = await self.storage.save(self.user, b"second")
+        self.assertTrue(first.startswith("/users/7/avatar?v="))
+        self.assertNotEqual(first, second)
+        self.assertEqual(first, await self.storage.save(self.user, b"first"))
+        [(path, version)] = [self.storage.find(7)]
+        self.assertEqual(path.read_bytes(), b"first")
+        self.assertEqual(first, f"/users/7/avatar?v={version}")
+        self.assertEqual(list(path.parent.iterdir()), [path])
+        self.assertEqual(self.storage.find(7, version), (path, version))
+        self.assertIsNone(self.storage.find(7, second.rsplit("=", 1)[1]))
+        self.assertIsNone(self.storage.find(8))
+
+    async def test_find_newest_of_two(self):
+        # what a concurrent save may briefly leave behind
+        directory = self.root / "7"
+        directory.mkdir(parents=True)
+        newer, older = directory / f"{'0' * 32}.jpg", directory / f"{'f' * 32}.jpg"
+        older.write_bytes(b"older")
+        newer.write_bytes(b"newer")
+        os.utime(older, (1000, 1000))
+        os.utime(newer, (2000, 2000))
+        self.assertEqual(self.storage.find(7), (newer, "0" * 32))
+
+
+class TestParseRange(unittest.TestCase):
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 100))
+        self.assertEqual(parse_range("bytes=-1000", 100), (0, 100))
+        self.assertEqual(parse_range("bytes=50-1000", 100), (50, 100))
+        for header in ("items=0-9", "bytes=0-1,3-4", "bytes=a-b", "bytes=-", "bytes"):
+            self.assertIsNone(parse_range(header, 100), header)
+        # invalid ranges are ignored, not answered with 416
+        for header in ("bytes=5-2", "bytes=9-5", "bytes=a-5", "bytes=5-b"):
+            self.assertIsNone(parse_range(header, 100), header)
+        for header in ("bytes=100-", "bytes=150-200", "bytes=-0"):
+            with self.assertRaises(ValueError):
+                parse_range(header, 100)
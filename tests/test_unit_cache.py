@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import Request, Response
+from redis.exceptions import ConnectionError
+
+from src.schemas import TagResponse
+from src.services.cache import ResponseCache, etag_matches
+
+
+def make_request(path: str, query: str = "") -> Request:
+    return Request(
+        {"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": []}
+    )
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.r = AsyncMock()
+        self.pipe = MagicMock(execute=AsyncMock())
+        self.r.pipeline = MagicMock(
+            return_value=MagicMock(
+                __aenter__=AsyncMock(return_value=self.pipe), __aexit__=AsyncMock(return_value=False)
+            )
+        )
+        self.cache = ResponseCache(self.r, ttl=60)
+
+    async def test_miss_then_hit(self):
+        request = make_request("/api/tags/", "limit=1&skip=0")
+        self.r.mget.return_value = [b"3", None]
+        lookup = await self.cache.get(1, request)
+        self.assertIsNone(lookup.response)
+        self.assertEqual(lookup.version, 3)
+
+        response = Response()
+        response.headers["X-Next-Cursor"] = "Mg"
+        sent = await self.cache.set(lookup, TagResponse, {"id": 2, "name": "a"}, response)
+        self.assertEqual(sent.body, b'{"name":"a","id":2}')
+        key, ttl, value = self.r.setex.call_args.args
+        self.assertEqual((key, ttl), (lookup.key, 60))
+
+        self.r.mget.return_value = [b"3", value]
+        hit = await self.cache.get(1, make_request("/api/tags/", "skip=0&limit=1"))
+        self.assertEqual(hit.response.body, sent.body)
+        self.assertEqual(hit.response.headers["X-Next-Cursor"], "Mg")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    async def test_stale_version_is_a_miss(self):
+        self.r.mget.return_value = [b"7", None]
+        lookup = await self.cache.get(1, make_request("/api/tags/"))
+        await self.cache.set(lookup, TagResponse, {"id": 2, "name": "a"}, Response())
+        value = self.r.setex.call_args.args[2]
+        self.r.mget.return_value = [b"8", value]
+        stale = await self.cache.get(1, make_request("/api/tags/"))
+        self.assertIsNone(stale.response)
+        self.assertEqual(stale.version, 8)
+
+    async def test_missing_version_starts_from_random_base(self):
+        self.r.mget.return_value = [None, None]
+        self.pipe.execute.return_value = [True, b"123456789"]
+        lookup = await self.cache.get(1, make_request("/api/tags/"))
+        self.assertEqual(lookup.version, 123456789)
+        self.assertEqual(lookup.etag, '"1-123456789"')
+        key, base = self.pipe.set.call_args.args
+        self.assertEqual(key, "cache:version:1")
+        self.assertEqual(self.pipe.set.call_args.kwargs, {"nx": True})
+        self.pipe.get.assert_called_once_with("cache:version:1")
+
+    async def test_invalidate(self):
+        await self.cache.invalidate(5)
+        self.assertEqual(self.pipe.set.call_args.args[0], "cache:version:5")
+        self.assertEqual(self.pipe.set.call_args.kwargs, {"nx": True})
+        self.pipe.incr.assert_called_once_with("cache:version:5")
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_redis_errors_fall_back(self):
+        self.r.mget.side_effect = ConnectionError()
+        lookup = await self.cache.get(1, make_request("/api/tags/"))
+        self.assertIsNone(lookup.response)
+        sent = await self.cache.set(lookup, TagResponse, {"id": 2, "name": "a"}, Response())
+        self.assertEqual(sent.status_code, 200)
+        self.r.setex.assert_not_awaited()
+        self.assertEqual(self.cache.stats()["errors"], 1)
+
+    async def test_not_modified(self):
+        self.r.mget.return_value = [b"4", None]
+        request = Request(
+            {
+                "type": "http",
+                "method": "GET",
+                "path": "/api/tags/",
+                "query_string": b"",
+                "headers": [(b"if-none-match", b'"1-4"')],
+            }
+        )
+        lookup = await self.cache.get(1, request)
+        self.assertEqual(lookup.response.status_code, 304)
+        self.assertEqual(lookup.response.headers["ETag"], '"1-4"')
+        self.assertEqual(self.cache.stats()["not_modified"], 1)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"1-4"', '"1-4"'))
+        self.assertTrue(etag_matches('"1-3", W/"1-4"', '"1-4"'))
+        self.assertTrue(etag_matches("*", '"1-4"'))
+        self.assertFalse(etag_matches('"1-3"', '"1-4"'))
+        self.assertFalse(etag_matches(None, '"1-4"'))
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database import db as database
+
+
+class TestReadDb(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.primary = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'primary.db')}"
+        )
+        self.replica = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'replica.db')}"
+        )
+        self.broken = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'missing', 'x.db')}"
+        )
+        database.SessionLocal.configure(bind=self.primary)
+
+    async def asyncTearDown(self) -> None:
+        database.SessionLocal.configure(bind=database.engine)
+        for engine in (self.primary, self.replica, self.broken):
+            await engine.dispose()
+        self.tmp.cleanup()
+
+    async def _read_db_bind(self):
+        gen = database.get_read_db()
+        db = await anext(gen)
+        bind = db.bind
+        await gen.aclose()
+        return bind
+
+    async def test_without_replicas_uses_primary(self):
+        with patch.object(database, "replica_engines", []):
+            self.assertIs(await self._read_db_bind(), self.primary)
+
+    async def test_uses_replica(self):
+        with patch.object(database, "replica_engines", [self.replica]):
+            self.assertIs(await self._read_db_bind(), self.replica)
+
+    async def test_skips_unreachable_replica(self):
+        with patch.object(database, "replica_engines", [self.broken, self.replica]):
+            binds = {await self._read_db_bind() for _ in range(4)}
+        self.assertEqual(binds, {self.replica})
+
+    async def test_falls_back_to_primary(self):
+        with patch.object(database, "replica_engines", [self.broken]):
+            self.assertIs(await self._read_db_bind(), self.primary)
+
+    async def test_falls_back_to_primary_when_replica_pool_is_exhausted(self):
+        busy = create_async_engine(
+            f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'replica.db')}",
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.1,
+        )
+        async with busy.connect():
+            with patch.object(database, "replica_engines", [busy]):
+                self.assertIs(await self._read_db_bind(), self.primary)
+        await busy.dispose()
@@ -0,0 +1,47 @@
+import json
+import unittest
+
+from src.services.imports import MAX_LINE_BYTES, read_ndjson
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+class TestReadNdjson(unittest.IsolatedAsyncioTestCase):
+    async def read(self, data: bytes, size: int):
+        return [item async for item in read_ndjson(chunked(data, size))]
+
+    async def test_lines_split_across_chunks(self):
+        lines = [
+            json.dumps({"title": f"note {i}", "description": "test", "tags": ["a"]})
+            for i in range(5)
+        ]
+        data = ("\n".join(lines) + "\n").encode()
+        for size in (1, 7, len(data)):
+            result = await self.read(data, size)
+            self.assertEqual([line for line, _, _ in result], [1, 2, 3, 4, 5])
+            self.assertEqual([note.title for _, note, _ in result], [f"note {i}" for i in range(5)])
+
+    async def test_last_line_without_newline(self):
+        data = b'{"title": "a", "description": "b"}\n\n{"title": "c", "description": "d"}'
+        result = await self.read(data, 4)
+        self.assertEqual([(line, note.title) for line, note, _ in result], [(1, "a"), (3, "c")])
+
+    async def test_invalid_lines(self):
+        data = b'{"title": "a"}\n{broken\n{"title": "c", "description": "d"}\n'
+        result = await self.read(data, 5)
+        self.assertEqual(result[0][0], 1)
+        self.assertIsNone(result[0][1])
+        self.assertIn("required", result[0][2])
+        self.assertEqual(result[1], (2, None, "Invalid JSON"))
+        self.assertEqual(result[2][1].title, "c")
+
+    async def test_too_long_line_is_not_buffered(self):
+        long_line = b'{"title": "' + b"x" * (2 * MAX_LINE_BYTES) + b'"}'
+        data = long_line + b'\n{"title": "a", "description": "b"}\n' + long_line
+        result = await self.read(data, 1024)
+        self.assertEqual(result[0], (1, None, "Line is too long"))
+        self.assertEqual(result[1][1].title, "a")
+        self.assertEqual(result[2], (3, None, "Line is too long"))
@@ -0,0 +1,192 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException, Request
+from redis.exceptions import ConnectionError, RedisError
+
+from src.database.models import User
+from src.services.auth import Auth, auth_service
+from src.services.rate_limit import RateLimitedUser, RateLimitReconciler, TokenBucketLimiter
+from src.services.user_cache import UserCache, UserSnapshot
+
+
+class Counters:
+    # The shared counters of the workers: INCRBY and EXPIRE in pipelines
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return CountersPipeline(self)
+
+
+class CountersPipeline:
+    def __init__(self, counters: Counters):
+        self.counters = counters
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def incrby(self, key, amount):
+        self.commands.append((key, amount))
+
+    def expire(self, key, ttl):
+        self.commands.append(None)
+
+    async def execute(self):
+        self.counters.round_trips += 1
+        results = []
+        for command in self.commands:
+            if command is None:
+                results.append(True)
+                continue
+            key, amount = command
+            self.counters.data[key] = self.counters.data.get(key, 0) + amount
+            results.append(self.counters.data[key])
+        return results
+
+
+def worker(r, times=10, seconds=60):
+    reconciler = RateLimitReconciler(r, interval=1)
+    return reconciler, TokenBucketLimiter(times, seconds, reconciler=reconciler)
+
+
+def request(path="/api/notes/", headers=()):
+    return Request(
+        {"type": "http", "path": path, "headers": list(headers), "client": ("10.0.0.1", 1)}
+    )
+
+
+class TestTokenBucketLimiter(unittest.IsolatedAsyncioTestCase):
+    def test_acquire_and_refill(self):
+        _, limiter = worker(None, times=3, seconds=3)
+        self.assertEqual([limiter.acquire("k", now=0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("k", now=0), 1.0)
+        self.assertAlmostEqual(limiter.acquire("k", now=0.5), 0.5)
+        self.assertEqual(limiter.acquire("k", now=1), 0)
+        self.assertEqual(limiter.acquire("other", now=1), 0)
+        self.assertEqual(limiter.buckets["k"].pending, 4)
+
+    async def test_too_many_requests(self):
+        _, limiter = worker(None, times=2, seconds=60)
+        await limiter(request(), None)
+        await limiter(request(), None)
+        with self.assertRaises(HTTPException) as e:
+            await limiter(request(), None)
+        self.assertEqual(e.exception.status_code, 429)
+        self.assertEqual(e.exception.headers["Retry-After"], "30")
+        # another path has its own bucket
+        await limiter(request("/api/tags/"), None)
+
+    async def test_reconcile_across_workers(self):
+        r = Counters()
+        (sync_a, a), (sync_b, b) = worker(r), worker(r)
+        a.acquire("k")
+        b.acquire("k")
+        await sync_a.sync()
+        await sync_b.sync()
+        for _ in range(5):
+            self.assertEqual(a.acquire("k"), 0)
+        await sync_a.sync()
+        await sync_b.sync()
+        self.assertEqual(r.data["ratelimit:10/60:k"], 7)
+        # 10 tokens, 1 taken by b and 5 by a since b first reconciled
+        for _ in range(4):
+            self.assertEqual(b.acquire("k"), 0)
+        self.assertGreater(b.acquire("k"), 0)
+        self.assertEqual(r.round_trips, 4)
+
+    async def test_idle_buckets_dropped(self):
+        r = Counters()
+        reconciler, limiter = worker(r, times=10, seconds=0.01)
+        limiter.acquire("k")
+        await reconciler.sync()
+        self.assertEqual(r.round_trips, 1)
+        limiter.buckets["k"].updated_at -= 1
+        await reconciler.sync()
+        self.assertEqual(limiter.buckets, {})
+        await reconciler.sync()
+        self.assertEqual(r.round_trips, 2)
+
+    async def test_redis_down(self):
+        r = MagicMock()
+        pipe = MagicMock(execute=AsyncMock(side_effect=RedisError("down")))
+        r.pipeline.return_value = MagicMock(
+            __aenter__=AsyncMock(return_value=pipe), __aexit__=AsyncMock()
+        )
+        reconciler, limiter = worker(r)
+        limiter.acquire("k")
+        limiter.acquire("k")
+        await reconciler.sync()
+        self.assertEqual(limiter.buckets["k"].pending, 2)
+
+
+class TestRateLimitedUser(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.cache = UserCache(AsyncMock(), ttl=300, local_ttl=30, local_size=10)
+        self.cache.r.get.return_value = None
+        self.script = AsyncMock(return_value=[0, b""])
+        self.script.registered_client = self.cache.r
+        self.cache.r.register_script = MagicMock(return_value=self.script)
+        patcher = patch.object(Auth, "user_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get_user = AsyncMock(
+            return_value=User(id=3, username="u", email="test@example.com", confirmed=True)
+        )
+        patcher = patch("src.services.auth.repository_users.get_user_by_email", self.get_user)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.token = await auth_service.create_access_token({"sub": "test@example.com"})
+        self.limited = RateLimitedUser(times=10, seconds=60)
+
+    async def call(self):
+        return await self.limited(request(), self.token, MagicMock())
+
+    async def test_one_round_trip(self):
+        snapshot = UserSnapshot(3, "u", "test@example.com", None, True, None)
+        self.script.return_value = [0, snapshot.dumps()]
+        user = await self.call()
+        self.assertEqual(user.id, 3)
+        self.get_user.assert_not_awaited()
+        self.cache.r.get.assert_not_awaited()
+        keys = self.script.await_args.kwargs["keys"]
+        self.assertEqual(keys[1], "user:test@example.com")
+        self.assertIn("test@example.com:/api/notes/", keys[0])
+        self.assertEqual(self.script.await_args.kwargs["args"], [10, 60000])
+        # the user is in the local cache now, only the limit is checked
+        self.assertIs(await self.call(), user)
+        self.assertEqual(len(self.script.await_args.kwargs["keys"]), 1)
+        self.cache.r.register_script.assert_called_once()
+
+    async def test_user_not_cached(self):
+        user = await self.call()
+        self.assertEqual(user.id, 3)
+        self.get_user.assert_awaited_once()
+        self.cache.r.setex.assert_awaited_once()
+
+    async def test_too_many_requests(self):
+        self.script.return_value = [1500, b""]
+        with self.assertRaises(HTTPException) as e:
+            await self.call()
+        self.assertEqual(e.exception.status_code, 429)
+        self.assertEqual(e.exception.headers["Retry-After"], "2")
+        self.get_user.assert_not_awaited()
+
+    async def test_redis_down(self):
+        self.script.side_effect = ConnectionError("down")
+        self.cache.r.get.side_effect = ConnectionError("down")
+        self.cache.r.setex.side_effect = ConnectionError("down")
+        user = await self.call()
+        self.assertEqual(user.id, 3)
+
+    async def test_invalid_token(self):
+        with self.assertRaises(HTTPException) as e:
+            await self.limited(request(), "invalid", MagicMock())
+        self.assertEqual(e.exception.status_code, 401)
+        self.script.assert_not_awaited()
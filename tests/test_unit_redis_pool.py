@@ -0,0 +1,29 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from redis.asyncio import BlockingConnectionPool
+from redis.exceptions import ConnectionError
+
+from src.conf.config import settings
+from src.services import redis_pool
+from src.services.auth import Auth
+
+
+class TestRedisPool(unittest.IsolatedAsyncioTestCase):
+    def test_shared_client(self):
+        # the services themselves are given a fake Redis in the tests
+        self.assertIs(Auth.r, redis_pool.r)
+
+    def test_pool_settings(self):
+        pool = redis_pool.create_redis().connection_pool
+        self.assertIsInstance(pool, BlockingConnectionPool)
+        self.assertEqual(pool.max_connections, settings.redis_max_connections)
+        self.assertEqual(pool.timeout, settings.redis_pool_timeout)
+        kwargs = pool.connection_kwargs
+        self.assertEqual(kwargs["socket_timeout"], settings.redis_socket_timeout)
+        self.assertEqual(kwargs["socket_connect_timeout"], settings.redis_connect_timeout)
+        self.assertEqual(kwargs["health_check_interval"], settings.redis_health_check_interval)
+
+    async def test_open_redis_without_server(self):
+        with patch.object(redis_pool.r, "ping", AsyncMock(side_effect=ConnectionError("down"))):
+            await redis_pool.open_redis()
@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Note, User, Tag
 from src.schemas import NoteModel, NoteUpdate, NoteStatusUpdate
@@ -9,6 +9,7 @@ from src.repository.notes import (
     get_note,
     get_notes,
     create_note,
+    create_notes,
     remove_note,
     update_note,
     update_status_note,
@@ -19,7 +20,9 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         self.user = User(id=1, username="test_user", password="qwerty", confirmed=True)
         self.tags = [Tag(id=1, user_id=1), Tag(id=2, user_id=1)]
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
 
     async def test_get_notes(self):
         limit = 10
@@ -38,15 +41,13 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
                 user=self.user,
             ),
         ]
-        mocked_notes = MagicMock()
-        mocked_notes.scalars.return_value.all.return_value = notes
-        self.session.execute.return_value = mocked_notes
+        self.result.scalars.return_value.all.return_value = notes
         result = await get_notes(offset, limit, self.user, self.session)
         self.assertEqual(result, notes)
 
     async def test_create_todo(self):
         body = NoteModel(title="test", description="test note", tags=[1, 2])
-        self.session.query().filter().all.return_value = self.tags
+        self.result.scalars.return_value.all.return_value = self.tags
         result = await create_note(body=body, user=self.user, db=self.session)
         self.assertIsInstance(result, Note)
         self.assertEqual(result.title, body.title)
@@ -54,13 +55,38 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.tags, self.tags)
         self.assertTrue(hasattr(result, "id"))
 
+    async def test_create_notes(self):
+        bodies = [
+            NoteModel(title="first", description="test note", tags=[1, 2]),
+            NoteModel(title="second", description="test note", tags=[3]),
+            NoteModel(title="third", description="test note", tags=[]),
+        ]
+        owned_tags, note_ids = MagicMock(), MagicMock()
+        owned_tags.scalars.return_value.all.return_value = [1, 2]
+        note_ids.scalars.return_value.all.return_value = [11, 10]
+        self.session.execute.side_effect = [owned_tags, note_ids, MagicMock()]
+        result = await create_notes(bodies=bodies, user=self.user, db=self.session)
+        self.assertEqual(
+            result,
+            [
+                {"index": 0, "id": 10, "error": None},
+                {"index": 1, "id": None, "error": "Tags not found: [3]"},
+                {"index": 2, "id": 11, "error": None},
+            ],
+        )
+        links = self.session.execute.call_args_list[2].args[1]
+        self.assertCountEqual(
+            links, [{"note_id": 10, "tag_id": 1}, {"note_id": 10, "tag_id": 2}]
+        )
+        self.session.commit.assert_called_once()
+
     async def test_update_note(self):
         body = NoteUpdate(
             title="test_title", description="test_description", tags=[1, 2], done=True
         )
         note = Note(id=1, title="test_title", description="test_description")
-        self.session.query().filter().first.return_value = note
-        self.session.query().filter().all.return_value = self.tags
+        self.result.scalar_one_or_none.return_value = note
+        self.result.scalars.return_value.all.return_value = self.tags
         result = await update_note(
             note_id=1, body=body, user=self.user, db=self.session
         )
@@ -72,7 +98,7 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
 
     async def test_update_note_not_found(self):
         body = NoteUpdate(title="test", description="test note", tags=[1, 2], done=True)
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         self.session.commit.return_value = None
         result = await update_note(
             note_id=1, body=body, user=self.user, db=self.session
@@ -81,14 +107,14 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_note(self):
         note = Note()
-        self.session.query().filter().first.return_value = note
+        self.result.scalar_one_or_none.return_value = note
         result = await get_note(note_id=1, user=self.user, db=self.session)
         self.assertEqual(result, note)
 
     async def test_update_status_note_found(self):
         body = NoteStatusUpdate(done=True)
         note = Note()
-        self.session.query().filter().first.return_value = note
+        self.result.scalar_one_or_none.return_value = note
         self.session.commit.return_value = None
         result = await update_status_note(
             note_id=1, body=body, user=self.user, db=self.session
@@ -97,7 +123,7 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
 
     async def test_update_status_note_not_found(self):
         body = NoteStatusUpdate(done=True)
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         self.session.commit.return_value = None
         result = await update_status_note(
             note_id=1, body=body, user=self.user, db=self.session
@@ -108,7 +134,7 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
         note = Note(
             id=1, title="test_title", description="test_description", user=self.user
         )
-        self.session.query().filter().first.return_value = note
+        self.result.scalar_one_or_none.return_value = note
         result = await remove_note(note_id=1, user=self.user, db=self.session)
         self.assertEqual(result, note)
         self.session.delete.assert_called_once()
@@ -116,6 +142,6 @@ class TestNote(unittest.IsolatedAsyncioTestCase):
         self.assertIsInstance(result, Note)
 
     async def test_remove_note_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await remove_note(note_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
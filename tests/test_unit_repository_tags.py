@@ -1,10 +1,18 @@
 import unittest
+from types import SimpleNamespace
 from unittest.mock import MagicMock, AsyncMock, Mock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Note, User, Tag
-from src.repository.tags import get_tag, get_tags, remove_tag, create_tag, update_tag
+from src.repository.tags import (
+    get_tag,
+    get_tags,
+    remove_tag,
+    create_tag,
+    update_tag,
+    upsert_tags,
+)
 from src.schemas import TagModel
 
 
@@ -12,18 +20,20 @@ class TestTags(unittest.IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         self.tags = [Tag(id=1, user_id=1), Tag(id=2, user_id=1)]
         self.user = User(id=1, username="test_user", password="qwerty", confirmed=True)
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
 
     async def test_get_tags(self):
         limit = 10
         offset = 0
-        self.session.query().filter().offset().limit().all.return_value = self.tags
+        self.result.scalars.return_value.all.return_value = self.tags
         result = await get_tags(offset, limit, self.user, self.session)
         self.assertEqual(result, self.tags)
 
     async def test_get_tag(self):
         tag = Tag(id=1, name="test_1")
-        self.session.query().filter().first.return_value = tag
+        self.result.scalar_one_or_none.return_value = tag
         result = await get_tag(1, self.user, self.session)
         self.assertEqual(result, tag)
         self.assertIsInstance(result, Tag)
@@ -35,10 +45,20 @@ class TestTags(unittest.IsolatedAsyncioTestCase):
         result = await create_tag(body=body, user=self.user, db=self.session)
         self.assertIsInstance(result, Tag)
 
+    async def test_upsert_tags(self):
+        self.result.all.return_value = [
+            SimpleNamespace(id=2, name="old"),
+            SimpleNamespace(id=7, name="new"),
+        ]
+        result = await upsert_tags(["new", "old", "new"], self.user, self.session)
+        self.assertEqual([(tag.id, tag.name) for tag in result], [(7, "new"), (2, "old")])
+        self.session.execute.assert_called_once()
+        self.session.commit.assert_called_once()
+
     async def test_update_tag(self):
         body = TagModel(name="test_updated_new")
         tag = Tag()
-        self.session.query().filter().first.return_value = tag
+        self.result.scalar_one_or_none.return_value = tag
         result = await update_tag(tag_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, tag)
         self.assertEqual(result.name, body.name)
@@ -47,7 +67,7 @@ class TestTags(unittest.IsolatedAsyncioTestCase):
 
     async def test_remove_tags(self):
         tag = Tag(id=1, name="test_tag")
-        self.session.query().filter().first.return_value = tag
+        self.result.scalar_one_or_none.return_value = tag
         result = await remove_tag(tag_id=1, user=self.user, db=self.session)
         self.assertEqual(result, tag)
         self.session.delete.assert_called_once()
@@ -1,21 +1,23 @@
 import unittest
 from unittest.mock import MagicMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Note, User, Tag
-from src.repository.users import get_user_by_email, create_user, update_token, confirmed_email, update_avatar
+from src.repository.users import get_user_by_email, create_user, update_token, update_password, confirmed_email, update_avatar
 from src.schemas import TagModel, UserModel
 
 
 class TestTags(unittest.IsolatedAsyncioTestCase):
     def setUp(self) -> None:
         self.user = User(id=1, email="person2024.ua", username="test_user", password="qwerty", confirmed=True)
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
 
     async def test_user_by_email(self):
         email="person2024.ua"
-        self.session.query().filter().first.return_value = self.user
+        self.result.scalar_one_or_none.return_value = self.user
         result = await get_user_by_email(email, self.session)
         self.assertEqual(result, self.user)
         self.assertEqual(result.email, self.user.email)
@@ -34,6 +36,11 @@ class TestTags(unittest.IsolatedAsyncioTestCase):
         self.session.commit.assert_called_once()
         self.assertEqual(self.user.refresh_token, token)
 
+    async def test_update_password(self):
+        await update_password(self.user, "new_hash", self.session)
+        self.session.commit.assert_called_once()
+        self.assertEqual(self.user.password, "new_hash")
+
     async def test_confirmed_email(self):
         email = "person2024.ua"
         with patch('src.repository.users.get_user_by_email') as mock:
@@ -0,0 +1,52 @@
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from redis.exceptions import ConnectionError
+
+from src.services.revocation import REVOKED_CHANNEL, RevokedTokens
+
+
+class TestRevokedTokens(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.r = AsyncMock()
+        self.pipe = MagicMock(execute=AsyncMock())
+        self.r.pipeline = MagicMock(
+            return_value=MagicMock(
+                __aenter__=AsyncMock(return_value=self.pipe), __aexit__=AsyncMock(return_value=False)
+            )
+        )
+        self.revoked = RevokedTokens(self.r)
+
+    async def test_revoke(self):
+        exp = time.time() + 60
+        await self.revoked.revoke("abc", exp)
+        self.assertTrue(self.revoked.is_revoked("abc"))
+        self.assertFalse(self.revoked.is_revoked("def"))
+        self.assertFalse(self.revoked.is_revoked(None))
+        self.pipe.zadd.assert_called_once_with("revoked_tokens", {"abc": exp})
+        self.pipe.publish.assert_called_once_with(REVOKED_CHANNEL, f"abc {exp}")
+        self.pipe.execute.assert_awaited_once()
+
+    async def test_revoke_redis_down(self):
+        self.pipe.execute.side_effect = ConnectionError("down")
+        with self.assertLogs("src.services.revocation", "ERROR"):
+            await self.revoked.revoke("abc", time.time() + 60)
+        self.assertTrue(self.revoked.is_revoked("abc"))
+
+    async def test_load(self):
+        self.revoked.local["stale"] = time.time() + 60
+        self.r.zrangebyscore.return_value = [(b"abc", time.time() + 60)]
+        await self.revoked.load()
+        self.assertTrue(self.revoked.is_revoked("abc"))
+        self.assertFalse(self.revoked.is_revoked("stale"))
+
+    def test_messages_and_pruning(self):
+        now = time.time()
+        self.revoked._on_message(f"abc {now + 60}")
+        self.revoked._on_message(f"old {now - 1}")
+        self.assertTrue(self.revoked.is_revoked("abc"))
+        self.assertFalse(self.revoked.is_revoked("old"))
+        self.revoked.local["expired"] = now - 1
+        self.revoked.prune()
+        self.assertEqual(list(self.revoked.local), ["abc"])
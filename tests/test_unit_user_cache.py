@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError
+
+from src.database.models import User
+from src.services.auth import Auth
+from src.services.local_cache import TTLCache
+from src.services.user_cache import INVALIDATE_CHANNEL, UserCache, UserSnapshot
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+        self.assertEqual(len(cache), 2)
+
+    def test_expiry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        with patch("src.services.local_cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+            cache.set("b", 2, ttl=5)
+        with patch("src.services.local_cache.time.monotonic", return_value=110.0):
+            self.assertEqual(cache.get("a"), 1)
+            self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 1)
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.r = AsyncMock()
+        self.cache = UserCache(self.r, ttl=300, local_ttl=30, local_size=10)
+        self.user = UserSnapshot(
+            1, "test", "test@example.com", None, True, datetime(2024, 1, 2, 3, 4, 5)
+        )
+
+    def test_snapshot_round_trip(self):
+        user = UserSnapshot.loads(self.user.dumps())
+        for name in UserSnapshot.__slots__:
+            self.assertEqual(getattr(user, name), getattr(self.user, name))
+        self.assertFalse(hasattr(user, "__dict__"))
+
+    def test_snapshot_from_user(self):
+        user = User(id=2, username="u", email="u@example.com", password="hash", refresh_token="t")
+        snapshot = UserSnapshot.from_user(user)
+        self.assertEqual((snapshot.id, snapshot.email, snapshot.confirmed), (2, "u@example.com", False))
+        self.assertNotIn(b"hash", snapshot.dumps())
+
+    async def test_set_then_get_locally(self):
+        await self.cache.set(self.user)
+        self.r.setex.assert_awaited_once_with("user:test@example.com", 300, self.user.dumps())
+        self.assertIs(await self.cache.get("test@example.com"), self.user)
+        self.r.get.assert_not_awaited()
+
+    async def test_get_from_redis(self):
+        self.r.get.return_value = self.user.dumps()
+        user = await self.cache.get("test@example.com")
+        self.assertEqual(user.id, 1)
+        self.assertIs(await self.cache.get("test@example.com"), user)
+        self.r.get.assert_awaited_once()
+
+    async def test_redis_errors_are_misses(self):
+        self.r.get.side_effect = ConnectionError()
+        self.assertIsNone(await self.cache.get("test@example.com"))
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        await self.cache.invalidate("test@example.com")
+        self.r.delete.assert_awaited_once_with("user:test@example.com")
+        self.r.publish.assert_awaited_once_with(INVALIDATE_CHANNEL, "test@example.com")
+        self.r.get.return_value = None
+        self.assertIsNone(await self.cache.get("test@example.com"))
+
+    async def test_listen_evicts_published_users(self):
+        subscribed, published = asyncio.Event(), asyncio.Event()
+
+        # a read that times out, then a message
+        messages = [None, {"type": "message", "data": b"test@example.com"}]
+
+        async def get_message(timeout):
+            await subscribed.wait()
+            if messages:
+                return messages.pop(0)
+            published.set()
+            await asyncio.Event().wait()
+
+        pubsub = MagicMock(subscribe=AsyncMock(), reset=AsyncMock(), get_message=get_message)
+        self.r.pubsub = MagicMock(return_value=pubsub)
+        listener = asyncio.create_task(self.cache.listen())
+        await asyncio.sleep(0)
+        self.cache.local.set("test@example.com", self.user)
+        self.cache.local.set("other@example.com", self.user)
+        subscribed.set()
+        await published.wait()
+        self.assertIs(self.cache.local.get("other@example.com"), self.user)
+        self.assertIsNone(self.cache.local.get("test@example.com"))
+        listener.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await listener
+        pubsub.reset.assert_awaited_once()
+
+
+class TestGetCurrentUser(unittest.IsolatedAsyncioTestCase):
+    async def test_database_is_read_once(self):
+        auth = Auth()
+        cache = UserCache(AsyncMock(), ttl=300, local_ttl=30, local_size=10)
+        cache.r.get.return_value = None
+        token = await auth.create_access_token({"sub": "test@example.com"})
+        db_user = User(id=3, username="u", email="test@example.com", confirmed=True)
+        get_user = AsyncMock(return_value=db_user)
+        with patch.object(Auth, "user_cache", cache), patch(
+            "src.services.auth.repository_users.get_user_by_email", get_user
+        ):
+            first = await auth.get_current_user(token, MagicMock())
+            second = await auth.get_current_user(token, MagicMock())
+        self.assertIsInstance(first, UserSnapshot)
+        self.assertIs(second, first)
+        self.assertEqual(first.id, 3)
+        get_user.assert_awaited_once()
+        cache.r.setex.assert_awaited_once()
+
+    async def test_replica_does_not_fill_cache(self):
+        auth = Auth()
+        cache = UserCache(AsyncMock(), ttl=300, local_ttl=30, local_size=10)
+        cache.r.get.return_value = None
+        token = await auth.create_access_token({"sub": "test@example.com"})
+        db_user = User(id=3, username="u", email="test@example.com", confirmed=True)
+        get_user = AsyncMock(return_value=db_user)
+        with patch.object(Auth, "user_cache", cache), patch(
+            "src.services.auth.repository_users.get_user_by_email", get_user
+        ):
+            user = await auth.get_current_user_readonly(token, MagicMock())
+            await auth.get_current_user_readonly(token, MagicMock())
+        self.assertEqual(user.id, 3)
+        self.assertEqual(get_user.await_count, 2)
+        cache.r.setex.assert_not_awaited()
+        self.assertIsNone(cache.local.get("test@example.com"))